@@ -0,0 +1,162 @@
+# bs"d - lehagdil torah velahadir
+
+import asyncio
+from concurrent.futures import Executor
+from typing import Dict, List, Optional, Tuple
+
+from backend.app.SourceSearchHandler import SourceSearchHandler
+from backend.app.SourceSearchQuery import SourceSearchQuery
+from backend.db.AsyncDBapiMongoDB import AsyncDBapiMongoDB
+from backend.db.DBFactory import DBFactory
+from backend.models_db.Answer import Answer
+from backend.models_db.SourceClasses.SourceMetadata import SourceMetadata
+
+
+class AsyncSourceSearchHandler:
+    """
+    asyncio variant of SourceSearchHandler: same queries, same answers, but
+    the stages of a search overlap instead of running one after another.
+
+      - query encoding runs in an executor while the structural filter
+        queries (and the entity/relation lookups) are in flight;
+      - FAISS/lexical ranking, which is CPU work, runs in the executor too,
+        so the event loop keeps serving other searches meanwhile;
+      - the structural queries of a batch, a page's count, and the
+        per-collection content fetches are all awaited concurrently.
+
+    So a search costs about its slowest stage rather than the sum of them.
+    Ranking, FAISS, the result cache and the structural filter index are
+    shared with (and delegated to) a regular SourceSearchHandler; only the db reads go through the async
+    driver (AsyncDBapiMongoDB).
+    """
+
+    def __init__(self, handler: Optional[SourceSearchHandler] = None, db_api: Optional[AsyncDBapiMongoDB] = None,
+                 executor: Optional[Executor] = None):
+        self.handler = handler or SourceSearchHandler()
+        self.db_api = db_api or DBFactory.get_prod_db_mongo_async(self.handler.db_api)
+        self._executor = executor  # None = the event loop's default thread pool
+
+    async def get_answer_w_source_metadata(self, query: SourceSearchQuery) -> Answer:
+        return (await self.get_answers_w_source_metadata([query]))[0]
+
+    async def get_full_answer(self, query: SourceSearchQuery) -> Answer:
+        return (await self.get_full_answers([query]))[0]
+
+    async def get_answers_w_source_metadata(self, queries: List[SourceSearchQuery]) -> List[Answer]:
+        """SourceSearchHandler.get_answers_w_source_metadata, through the same result cache."""
+        # The cache's lookups and writes are blocking I/O (Mongo-backed), so they run in the executor.
+        version, answers = await self._run_sync(self.handler.cached_answers, queries)
+        missing = [query for query, ans in zip(queries, answers) if ans is None]
+        searched = await self._search(missing) if missing else []
+        return await self._run_sync(self.handler.fill_answers, queries, answers, searched, version)
+
+    async def get_full_answers(self, queries: List[SourceSearchQuery]) -> List[Answer]:
+        answers = await self.get_answers_w_source_metadata(queries)
+        await self._load_src_contents(*answers)
+        return answers
+
+    async def get_page(self, ans: Answer, offset: int, limit: int) -> Answer:
+        """SourceSearchHandler.get_page: nothing is searched or ranked again."""
+        if ans.ranked_keys is not None:
+            page_keys = ans.ranked_keys[offset:offset + limit]
+            src_metadata_lst, total = self.handler.in_order(await self._hydrate_keys(page_keys), page_keys), ans.total
+        else:
+            src_metadata_lst, total = await self._get_src_metadata_page(ans.query, offset, limit)
+        page = self.handler.page_of(ans, offset, src_metadata_lst, total)
+        await self._load_src_contents(page)
+        return page
+
+    async def _search(self, queries: List[SourceSearchQuery]) -> List[Answer]:
+        # Warms the FAISS query-embedding cache, so ranking below finds the vectors already there.
+        encoding = asyncio.ensure_future(self._run_sync(self.handler.encode_free_texts, queries)) \
+            if any(q.free_text_similarity for q in queries) else None
+
+        filters: Dict[Tuple, SourceSearchQuery] = {}
+        for query in queries:
+            if query.free_text_similarity:
+                filters.setdefault(SourceSearchHandler.filter_of(query), query)
+        unranked = [i for i, query in enumerate(queries) if not query.free_text_similarity]
+
+        keys_lists, pages, extras = await asyncio.gather(
+            asyncio.gather(*(self._get_keys_filtered(query) for query in filters.values())),
+            asyncio.gather(*(self._get_src_metadata_page(queries[i], queries[i].offset, queries[i].max_sources)
+                             for i in unranked)),
+            asyncio.gather(*(self._get_entities_and_rels(query) for query in queries)),
+        )
+        keys_by_filter = dict(zip(filters, keys_lists))
+        candidates = {i: keys_by_filter[SourceSearchHandler.filter_of(query)]
+                      for i, query in enumerate(queries) if query.free_text_similarity}
+
+        if encoding is not None:
+            await encoding
+        rankings = await self._run_sync(self.handler.rank_candidates, queries, candidates) if candidates else {}
+        hydrated = await self._hydrate_keys(SourceSearchHandler.ranked_page_keys(queries, rankings))
+        return self.handler.assemble_answers(queries, rankings, hydrated, dict(zip(unranked, pages)), extras)
+
+    async def _uses_filter_index(self) -> bool:
+        # With its background refresher off (refresh_interval_s=0) this reads the db, so off the event loop.
+        return self.handler.filter_index is not None and await self._run_sync(self.handler.uses_filter_index)
+
+    async def _get_keys_filtered(self, query: SourceSearchQuery) -> List[str]:
+        if await self._uses_filter_index():
+            return self.handler.filter_index.get_source_metadata_keys_filtered(
+                passage_types=query.passage_types,
+                entity_ids=query.entity_ids,
+                rel_ids=query.rel_ids,
+                src_types=query.src_types,
+                books=query.books,
+            )
+        return await self.db_api.get_source_metadata_keys_filtered(
+            passage_types=query.passage_types,
+            entity_ids=query.entity_ids,
+            rel_ids=query.rel_ids,
+            src_types=query.src_types,
+            books=query.books,
+        )
+
+    async def _get_src_metadata_page(self, query: SourceSearchQuery, offset: int, limit: int):
+        if await self._uses_filter_index():
+            page_keys, total = self.handler.filter_index.get_source_metadata_key_page(
+                passage_types=query.passage_types,
+                entity_ids=query.entity_ids,
+                rel_ids=query.rel_ids,
+                src_types=query.src_types,
+                books=query.books,
+                offset=offset,
+                limit=limit,
+            )
+            return self.handler.in_order(await self._hydrate_keys(page_keys), page_keys), total
+        return await self.db_api.get_source_metadata_page(
+            passage_types=query.passage_types,
+            entity_ids=query.entity_ids,
+            rel_ids=query.rel_ids,
+            src_types=query.src_types,
+            books=query.books,
+            offset=offset,
+            limit=limit,
+        )
+
+    async def _get_entities_and_rels(self, query: SourceSearchQuery) -> Tuple[List, List]:
+        entities, rels = await asyncio.gather(
+            self.db_api.get_entities_by_keys(query.entity_ids) if query.entity_ids else _nothing(),
+            self.db_api.get_rels_by_keys(query.rel_ids) if query.rel_ids else _nothing(),
+        )
+        return entities, rels
+
+    async def _hydrate_keys(self, keys) -> Dict[str, SourceMetadata]:
+        slim = [SourceMetadata(key, hydrated=False) for key in dict.fromkeys(keys)]
+        return {src.key: src for src in await self.db_api.hydrate_source_metadata(slim)} if slim else {}
+
+    async def _load_src_contents(self, *answers: Answer) -> None:
+        # One bulk fetch for every page; its per-collection queries run concurrently.
+        keys = list(dict.fromkeys(src.key for ans in answers for src in ans.src_metadata_lst))
+        fetched = dict(zip(keys, await self.db_api.find_source_contents(keys))) if keys else {}
+        for ans in answers:
+            ans.src_contents.extend(fetched[src.key] for src in ans.src_metadata_lst)
+
+    async def _run_sync(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+
+async def _nothing() -> List:
+    return []
@@ -0,0 +1,223 @@
+# bs"d - lehagdil torah velahadir
+
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import replace
+from typing import Dict, Optional, Tuple
+
+from backend.app.SourceSearchQuery import SourceSearchQuery
+from backend.faiss_api.QueryEmbeddingCache import QueryEmbeddingCache
+from backend.models_db.Answer import Answer
+
+_ENTRY_SUFFIX = ".pkl"
+
+# (newest FAISS/lexical index uploadDate, src_metadata version counter): what every cached answer was computed against.
+ResultVersion = Tuple[Optional[str], int]
+
+
+class SearchResultCache:
+    """
+    Process-wide, bounded LRU of search answers (metadata only, no source
+    contents), keyed by query_hash(). Popular searches (an entity's page,
+    the default passage types) then skip Mongo and FAISS altogether.
+
+    Every entry carries the ResultVersion it was computed against, and is
+    dropped as soon as either part changes: a new FAISS index/delta anywhere
+    or a rebuilt lexical index, or any SourceMetadata insert/update. The version is read from the db at
+    most once per version_ttl_s, so a change shows up within that long.
+
+    With disk_dir set, entries are also pickled to disk (one file each, under
+    a directory per version), so worker processes share what any of them
+    computed. Files are written to a temp name and renamed, so a concurrent
+    reader never sees a half-written entry.
+    """
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self, dbapi=None, max_size: int = 256, disk_dir: Optional[str] = None,
+                 max_disk_entries: int = 2048, version_ttl_s: float = 5.0):
+        if getattr(self, "_initialized", False):
+            return
+        self._initialized = True
+
+        self.dbapi = dbapi
+        self.max_size = max_size
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self.version_ttl_s = version_ttl_s
+        self._entries: "OrderedDict[str, Tuple[ResultVersion, Answer]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._version: Optional[ResultVersion] = None
+        self._version_checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def query_hash(query: SourceSearchQuery) -> str:
+        """
+        Canonical hash of a query: the same search gets the same hash however
+        its filters were ordered (each filter is a set of OR'd values) and
+        whatever whitespace/unicode form the free text came in.
+        """
+        canonical = {
+            "free_text": QueryEmbeddingCache.normalize(query.free_text_similarity or ""),
+            "max_sources": query.max_sources,
+            "offset": query.offset,
+            "max_distance": query.max_distance,
+            "src_types": sorted(src_type.value for src_type in query.src_types or ()),
+            "passage_types": sorted(pt.value for pt in query.passage_types or ()),
+            "entity_ids": sorted(query.entity_ids or ()),
+            "rel_ids": sorted(query.rel_ids or ()),
+            "books": sorted(query.books or ()),
+        }
+        return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def current_version(self) -> Optional[ResultVersion]:
+        """
+        The ResultVersion of the data in the db, re-read at most once per
+        version_ttl_s. None if it can't be read, in which case nothing should
+        be cached or served from the cache.
+        """
+        now = time.monotonic()
+        if self._version is not None and now - self._version_checked_at < self.version_ttl_s:
+            return self._version
+        try:
+            upload_date = self.dbapi.get_latest_faiss_upload_date()
+            version = (upload_date.isoformat() if upload_date else None, self.dbapi.get_src_metadata_version())
+        except Exception as e:
+            print(f"[SearchResultCache] Could not read the data version; not caching: {e}")
+            return None
+
+        with self._lock:
+            if version != self._version:
+                if self._version is not None:
+                    print(f"[SearchResultCache] Data changed ({self._version} -> {version}); dropping cached results.")
+                self._entries.clear()
+                self._version = version
+                self._prune_disk(keep=self._version_dir(version))
+            self._version_checked_at = now
+        return version
+
+    def get(self, query: SourceSearchQuery, version: ResultVersion) -> Optional[Answer]:
+        """The cached answer to query if it was computed against version (a fresh copy, without contents)."""
+        key = self.query_hash(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return replace(entry[1], src_contents=[])
+
+        ans = self._read_disk(key, version)
+        with self._lock:
+            if ans is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, version, ans)
+        return replace(ans, src_contents=[])
+
+    def put(self, query: SourceSearchQuery, ans: Answer, version: ResultVersion) -> None:
+        """Cache ans (its contents left out) as the answer to query, computed against version."""
+        if self.max_size <= 0:
+            return
+        key = self.query_hash(query)
+        ans = replace(ans, src_contents=[])
+        with self._lock:
+            if version != self._version:
+                return  # the data changed while this answer was being computed
+            self._remember(key, version, ans)
+        self._write_disk(key, version, ans)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._version = None
+            self.hits = 0
+            self.misses = 0
+        self._prune_disk(keep=None)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _remember(self, key: str, version: ResultVersion, ans: Answer) -> None:
+        # caller holds self._lock
+        self._entries[key] = (version, ans)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    ############################################## Disk tier ###############################################
+
+    def _version_dir(self, version: ResultVersion) -> Optional[str]:
+        if not self.disk_dir:
+            return None
+        stamp = hashlib.sha256(repr(version).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.disk_dir, stamp)
+
+    def _read_disk(self, key: str, version: ResultVersion) -> Optional[Answer]:
+        version_dir = self._version_dir(version)
+        if version_dir is None:
+            return None
+        path = os.path.join(version_dir, key + _ENTRY_SUFFIX)
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"[SearchResultCache] Could not read cached result {path}: {e}")
+            return None
+
+    def _write_disk(self, key: str, version: ResultVersion, ans: Answer) -> None:
+        version_dir = self._version_dir(version)
+        if version_dir is None:
+            return
+        path = os.path.join(version_dir, key + _ENTRY_SUFFIX)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(version_dir, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                pickle.dump(ans, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            self._trim_disk(version_dir)
+        except OSError as e:
+            print(f"[SearchResultCache] Could not write cached result to {version_dir}: {e}")
+
+    def _trim_disk(self, version_dir: str) -> None:
+        """Keep at most max_disk_entries files, dropping the least recently written."""
+        entries = [entry for entry in os.scandir(version_dir) if entry.name.endswith(_ENTRY_SUFFIX)]
+        if len(entries) <= self.max_disk_entries:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_disk_entries]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass  # another worker got there first
+
+    def _prune_disk(self, keep: Optional[str]) -> None:
+        """Remove the directories of every other version (all of them when keep is None)."""
+        if not self.disk_dir or not os.path.isdir(self.disk_dir):
+            return
+        for entry in os.scandir(self.disk_dir):
+            if entry.is_dir() and entry.path != keep:
+                shutil.rmtree(entry.path, ignore_errors=True)
@@ -1,14 +1,29 @@
 # bs"d - lehagdil torah velahadir
 
+from backend.app.SearchResultCache import ResultVersion, SearchResultCache
+from backend.app.StructuralFilterIndex import StructuralFilterIndex
+from backend.common import Paths
 from backend.db.DBFactory import DBFactory
 from backend.db.DBapiMongoDB import DBapiMongoDB
 from backend.db.EntityRelManager import EntityRelManager
-from backend.faiss_api.FaissEngine import FaissEngine
+from backend.faiss_api.FaissEngine import FaissEngine, SearchHit
+from backend.faiss_api.QueryEncoder import QueryEncoderBackend
+from backend.lexical_api.BM25Index import BM25Index
+from backend.lexical_api.HebrewTextIndex import HebrewTextIndex
+from backend.lexical_api.LexicalIndexCache import LexicalIndexCache
+from backend.lexical_api.RankFusion import reciprocal_rank_fusion
 
 from backend.models_db.Answer import Answer
+from backend.models_db.SourceClasses.SourceMetadata import SourceMetadata
 from backend.app.SourceSearchQuery import SourceSearchQuery
 
-from typing import Optional, List
+from system_common.SystemFunctions import get_secret
+
+from dataclasses import replace
+from typing import Dict, Iterator, Optional, List, Tuple, Type
+
+# Sources whose contents iter_full_answer fetches per step (one bulk query each).
+CONTENT_PAGE_SIZE = 10
 
 
 class SourceSearchHandler:
@@ -17,81 +32,378 @@ class SourceSearchHandler:
         self.db_api: Optional[DBapiMongoDB] = None
         self.faiss: Optional[FaissEngine] = None
         self.entity_rel_manager: Optional[EntityRelManager] = None
+        self.result_cache: Optional[SearchResultCache] = None
+        self.filter_index: Optional[StructuralFilterIndex] = None
+        self.lexical_cache: Optional[LexicalIndexCache] = None
         self._set_up()
 
     def _set_up(self):
         """Private method: load env variables and set up db and FAISS."""
         self.db_api = DBFactory.get_prod_db_mongo()
-        self.faiss = FaissEngine(dbapi=self.db_api)
+        # FAISS_QUERY_ENCODER: torch (default) / onnx / onnx_int8, see QueryEncoder
+        self.faiss = FaissEngine(dbapi=self.db_api,
+                                 query_encoder=QueryEncoderBackend.from_config(get_secret("FAISS_QUERY_ENCODER")))
         self.entity_rel_manager = EntityRelManager()
+        self.lexical_cache = LexicalIndexCache()
+        # SEARCH_RESULT_CACHE_DISK=true: share cached results between worker processes, via Paths.SEARCH_CACHE_DIR
+        use_disk = (get_secret("SEARCH_RESULT_CACHE_DISK") or "").strip().lower() == "true"
+        self.result_cache = SearchResultCache(dbapi=self.db_api,
+                                              disk_dir=Paths.SEARCH_CACHE_DIR if use_disk else None)
+        self.filter_index = StructuralFilterIndex(dbapi=self.db_api)
 
-    def get_answer_w_source_metadata(self, query: SourceSearchQuery) -> Answer:
-
-        # Step 1: one DB query for every source that matches the *structural*
-        # filters (passage type / entity / relationship selections). This
-        # replaces per-item DB round-trips with a single round-trip.
-        src_metadata_lst = self.db_api.get_source_metadata_filtered(
-            passage_types=query.passage_types,
-            entity_ids=query.entity_ids,
-            rel_ids=query.rel_ids,
-        )
+    def warm_up(self) -> None:
+        """
+        Do the one-off loading of a first search now (FAISS index, query
+        encoder, lexical indexes, structural filter index), so that search
+        doesn't wait for it. The db connection is already set up by the constructor.
+        """
+        self.faiss.warm_up()
+        if self.filter_index is not None:
+            self.filter_index.warm_up()
+        for index_cls in (BM25Index, HebrewTextIndex):
+            self._get_lexical_index(index_cls)
 
-        # Step 2: if free text was given, ask FAISS for the similarity
-        # ranking of *keys* and use it purely to re-order the already
-        # filtered list above - no per-source DB lookups involved.
-        if query.free_text_similarity:
-            src_metadata_lst = self.order_by_faiss_similarity(query.free_text_similarity, src_metadata_lst)
+    def get_answer_w_source_metadata(self, query: SourceSearchQuery) -> Answer:
+        """
+        One page (query.offset, query.max_sources) of the sources matching the
+        query's structural filters (passage type / entity / relationship /
+        source type / book selections), without contents. The filters resolve
+        in memory on StructuralFilterIndex, or in the db when it is unavailable.
 
-        src_metadata_lst = self.populate_entity_rel(src_metadata_lst)
-        src_metadata_lst = src_metadata_lst[:query.max_sources]
+        Without free text they come in canonical order (the stored sort key)
+        and only the page is fetched. With free text only the matching *keys* are
+        fetched, ranked by similarity (see order_by_faiss_similarity), and
+        full metadata is fetched for the page alone.
+        """
+        return self.get_answers_w_source_metadata([query])[0]
 
-        return self.create_answer_obj(query, src_metadata_lst)
+    def create_answer_obj(self, query: SourceSearchQuery, src_metadata_lst, scores: Dict[str, float],
+                          total: int, ranked_keys: Optional[List[str]] = None) -> Answer:
 
-    def create_answer_obj(self, query:SourceSearchQuery, src_metadata_lst) -> Answer:
+        entities_from_q, rels_from_q = self._get_entities_and_rels(query)
+        return self.build_answer(query, src_metadata_lst, scores, total, ranked_keys, entities_from_q, rels_from_q)
 
+    def _get_entities_and_rels(self, query: SourceSearchQuery) -> Tuple[List, List]:
         # this code is possibly temporary.. the final front end might expect to be packaged differently..
         entities_from_q = self.db_api.get_entities_by_keys(query.entity_ids) if query.entity_ids else []
         rels_from_q = self.db_api.get_rels_by_keys(query.rel_ids) if query.rel_ids else []
-        # Create Answer object
+        return entities_from_q, rels_from_q
+
+    @staticmethod
+    def build_answer(query: SourceSearchQuery, src_metadata_lst, scores: Dict[str, float], total: int,
+                     ranked_keys: Optional[List[str]], entities: List, rels: List) -> Answer:
         return Answer(
             free_text_input=query.free_text_similarity,
             src_metadata_lst=src_metadata_lst,
-            entities=entities_from_q,
-            rels=rels_from_q
+            entities=entities,
+            rels=rels,
+            scores=scores,
+            offset=query.offset,
+            total=total,
+            ranked_keys=ranked_keys,
+            query=query,
         )
 
     def get_full_answer(self, query: SourceSearchQuery) -> Answer:
         ans = self.get_answer_w_source_metadata(query)
+        self._load_src_contents(ans)
+        return ans
+
+    def iter_full_answer(self, query: SourceSearchQuery, content_page_size: int = CONTENT_PAGE_SIZE
+                         ) -> Iterator[Answer]:
+        """
+        get_full_answer() delivered incrementally, for a UI that shows results
+        as they come: the first yield is the ranked page's metadata with no
+        contents, then one yield per content_page_size sources whose contents
+        were fetched, in ranked order. It is the same Answer every time,
+        filled in further; after the last yield it equals get_full_answer().
+        """
+        ans = self.get_answer_w_source_metadata(query)
+        yield ans
+        for start in range(0, len(ans.src_metadata_lst), content_page_size):
+            keys = [src.key for src in ans.src_metadata_lst[start:start + content_page_size]]
+            ans.src_contents.extend(self.db_api.find_source_contents(keys))
+            yield ans
 
-        for src_metadata in ans.src_metadata_lst:
-            src = self.db_api.find_one_source_content(src_metadata.key)
-            ans.src_contents.append(src)
+    def get_answers_w_source_metadata(self, queries: List[SourceSearchQuery]) -> List[Answer]:
+        """
+        get_answer_w_source_metadata() for a batch of queries. Answers still
+        in the result cache (same query, same FAISS index and metadata) are
+        reused; the rest are searched together, see _search.
+        """
+        version, answers = self.cached_answers(queries)
+        missing = [query for query, ans in zip(queries, answers) if ans is None]
+        return self.fill_answers(queries, answers, self._search(missing) if missing else [], version)
 
-        return ans
+    def cached_answers(self, queries: List[SourceSearchQuery]
+                       ) -> Tuple[Optional[ResultVersion], List[Optional[Answer]]]:
+        """
+        The data version and every query's answer from the result cache (None
+        where it has to be searched). A None version means nothing is cached.
+        """
+        version = self.result_cache.current_version() if self.result_cache else None
+        if version is None:
+            return None, [None] * len(queries)
+        return version, [self.result_cache.get(query, version) for query in queries]
+
+    def fill_answers(self, queries: List[SourceSearchQuery], answers: List[Optional[Answer]],
+                     searched: List[Answer], version: Optional[ResultVersion]) -> List[Answer]:
+        """Fill the gaps of cached_answers() with the searched answers, in order, caching them under version."""
+        missing = [i for i, ans in enumerate(answers) if ans is None]
+        for i, ans in zip(missing, searched):
+            if version is not None:
+                self.result_cache.put(queries[i], ans, version)
+            answers[i] = ans
+        return answers
+
+    def _search(self, queries: List[SourceSearchQuery]) -> List[Answer]:
+        """
+        Free-text queries with the same structural filters share one key
+        fetch, all their rankings go to FAISS together (one batched encoder
+        call, each candidate vector scored once for every query), and the
+        metadata of every ranked page comes back in one query.
+        """
+        keys_by_filter: Dict[Tuple, List[str]] = {}
+        candidates: Dict[int, List[str]] = {}
+        for i, query in enumerate(queries):
+            if not query.free_text_similarity:
+                continue
+            filt = self.filter_of(query)
+            if filt not in keys_by_filter:
+                keys_by_filter[filt] = self._get_keys_filtered(query)
+            candidates[i] = keys_by_filter[filt]
+
+        rankings = self.rank_candidates(queries, candidates)
+        hydrated = self._hydrate_keys(self.ranked_page_keys(queries, rankings))
+        pages = {i: self._get_src_metadata_page(query, query.offset, query.max_sources)
+                 for i, query in enumerate(queries) if i not in rankings}
+        extras = [self._get_entities_and_rels(query) for query in queries]
+        return self.assemble_answers(queries, rankings, hydrated, pages, extras)
+
+    @staticmethod
+    def ranked_page_keys(queries: List[SourceSearchQuery],
+                         rankings: Dict[int, Tuple[List[str], Dict[str, float]]]) -> List[str]:
+        """The keys on the requested page of every ranked query: the metadata to hydrate."""
+        return [key for i, (ranked, _) in rankings.items()
+                for key in ranked[queries[i].offset:queries[i].offset + queries[i].max_sources]]
+
+    def assemble_answers(self, queries: List[SourceSearchQuery],
+                         rankings: Dict[int, Tuple[List[str], Dict[str, float]]],
+                         hydrated: Dict[str, SourceMetadata], pages: Dict[int, Tuple[List, int]],
+                         extras: List[Tuple[List, List]]) -> List[Answer]:
+        """
+        _search's answers from its fetched parts, with no db access: rankings
+        of the free-text queries (rank_candidates), the hydrated metadata of
+        their pages, pages[i] (metadata, total) of every other query, and
+        extras[i] (entities, rels) of every query.
+        """
+        answers = []
+        for i, query in enumerate(queries):
+            if i in rankings:
+                ranked_keys, scores = rankings[i]
+                page_keys = ranked_keys[query.offset:query.offset + query.max_sources]
+                src_metadata_lst, total = self.in_order(hydrated, page_keys), len(ranked_keys)
+            else:
+                ranked_keys, scores = None, {}
+                src_metadata_lst, total = pages[i]
+            entities, rels = extras[i]
+            answers.append(self.build_answer(query, self.populate_entity_rel(src_metadata_lst), scores, total,
+                                             ranked_keys, entities, rels))
+        return answers
+
+    @staticmethod
+    def in_order(hydrated: Dict[str, SourceMetadata], keys: List[str]) -> List[SourceMetadata]:
+        """The hydrated metadata of keys, in their order (keys that weren't found are left out)."""
+        return [hydrated[key] for key in keys if key in hydrated]
+
+    @staticmethod
+    def filter_of(query: SourceSearchQuery) -> Tuple:
+        """The query's structural filters, as a hashable key: queries with equal ones share a key fetch."""
+        return (tuple(query.passage_types or ()), tuple(query.entity_ids or ()),
+                tuple(query.rel_ids or ()), tuple(query.src_types or ()), tuple(query.books or ()))
+
+    def rank_candidates(self, queries: List[SourceSearchQuery], candidates: Dict[int, List[str]]
+                        ) -> Dict[int, Tuple[List[str], Dict[str, float]]]:
+        """
+        order_by_faiss_similarity() of every queries[i] over its candidates[i]
+        keys, with all the FAISS work in one batch per max_distance. No db
+        access (beyond loading the lexical indexes once).
+        """
+        # search_within_many takes a single cutoff, so batch per max_distance.
+        hits: Dict[int, List[SearchHit]] = {}
+        batches: Dict[Optional[float], List[int]] = {}
+        for i in candidates:
+            if not self.ranks_by_hebrew(queries[i].free_text_similarity):
+                batches.setdefault(queries[i].max_distance, []).append(i)
+        for max_distance, rows in batches.items():
+            batch_hits = self.faiss.search_within_many(
+                [queries[i].free_text_similarity for i in rows],
+                [dict.fromkeys(candidates[i]).keys() for i in rows],
+                max_distance=max_distance,
+            )
+            hits.update(zip(rows, batch_hits))
+
+        return {i: self._order_by_hits(queries[i].free_text_similarity, keys, hits.get(i), queries[i].max_distance)
+                for i, keys in candidates.items()}
+
+    def get_full_answers(self, queries: List[SourceSearchQuery]) -> List[Answer]:
+        """
+        get_full_answer() for a batch of queries: ranked together (see
+        get_answers_w_source_metadata), and a source on several of the
+        answer pages is fetched from the db only once.
+        """
+        answers = self.get_answers_w_source_metadata(queries)
+        self._load_src_contents(*answers)
+        return answers
+
+    def get_page(self, ans: Answer, offset: int, limit: int) -> Answer:
+        """
+        Another page of an answer, with its source contents. Nothing is
+        searched or ranked again: a ranked page is cut from ans.ranked_keys
+        (only its metadata is fetched), an unranked one is read from the db
+        in canonical order.
+        """
+        if ans.ranked_keys is not None:
+            page_keys = ans.ranked_keys[offset:offset + limit]
+            src_metadata_lst, total = self.in_order(self._hydrate_keys(page_keys), page_keys), ans.total
+        else:
+            src_metadata_lst, total = self._get_src_metadata_page(ans.query, offset, limit)
+        page = self.page_of(ans, offset, src_metadata_lst, total)
+        self._load_src_contents(page)
+        return page
+
+    def page_of(self, ans: Answer, offset: int, src_metadata_lst: List[SourceMetadata], total: int) -> Answer:
+        """get_page's answer, before its contents are loaded."""
+        return replace(ans, src_metadata_lst=self.populate_entity_rel(src_metadata_lst),
+                       offset=offset, total=total, src_contents=[])
+
+    def uses_filter_index(self) -> bool:
+        """Whether structural filters resolve in memory (StructuralFilterIndex, once built) rather than in the db."""
+        return self.filter_index is not None and self.filter_index.is_ready()
+
+    def _get_keys_filtered(self, query: SourceSearchQuery) -> List[str]:
+        source = self.filter_index if self.uses_filter_index() else self.db_api
+        return source.get_source_metadata_keys_filtered(
+            passage_types=query.passage_types,
+            entity_ids=query.entity_ids,
+            rel_ids=query.rel_ids,
+            src_types=query.src_types,
+            books=query.books,
+        )
+
+    def _get_src_metadata_page(self, query: SourceSearchQuery, offset: int, limit: int) -> Tuple[List, int]:
+        if self.uses_filter_index():
+            page_keys, total = self.filter_index.get_source_metadata_key_page(
+                passage_types=query.passage_types,
+                entity_ids=query.entity_ids,
+                rel_ids=query.rel_ids,
+                src_types=query.src_types,
+                books=query.books,
+                offset=offset,
+                limit=limit,
+            )
+            return self.in_order(self._hydrate_keys(page_keys), page_keys), total
+        return self.db_api.get_source_metadata_page(
+            passage_types=query.passage_types,
+            entity_ids=query.entity_ids,
+            rel_ids=query.rel_ids,
+            src_types=query.src_types,
+            books=query.books,
+            offset=offset,
+            limit=limit,
+        )
+
+    def _hydrate_keys(self, keys) -> Dict[str, SourceMetadata]:
+        # Ranked keys are un-hydrated SourceMetadata; only the displayed page's are filled in.
+        slim = [SourceMetadata(key, hydrated=False) for key in dict.fromkeys(keys)]
+        return {src.key: src for src in self.db_api.hydrate_source_metadata(slim)} if slim else {}
+
+    def _load_src_contents(self, *answers: Answer) -> None:
+        # One bulk fetch for every page: a query per collection, however many sources.
+        keys = list(dict.fromkeys(src.key for ans in answers for src in ans.src_metadata_lst))
+        fetched = dict(zip(keys, self.db_api.find_source_contents(keys)))
+        for ans in answers:
+            ans.src_contents.extend(fetched[src.key] for src in ans.src_metadata_lst)
 
     def populate_entity_rel(self, src_metadata_lst):
         # todo from enetity ids, get the values (name, hebrew name, etc..)
         return src_metadata_lst
 
     def order_by_faiss_similarity(
-        self, free_text_similarity_text: str, src_metadata_lst: List
-    ) -> List:
-        """
-        Re-rank an already-filtered metadata list by FAISS text-similarity
-        order, without any further DB access.
-
-        FAISS ranks the *entire* index in one cheap, vectorized call and
-        returns it as a list of keys, ordered nearest-first. We walk that
-        ranking and pull matching entries out of ``src_metadata_lst`` (kept
-        as a key -> metadata map for O(1) lookup/removal), so the result is
-        the intersection of "structurally filtered" and "text-similar",
-        ordered by similarity. Anything FAISS didn't rank (e.g. the index is
-        stale/incomplete) is appended at the end rather than silently
-        dropped, so results never disappear because of a lookup mismatch.
-        """
-        by_key = {src.key: src for src in src_metadata_lst}
-        ranked_keys = self.faiss.search(free_text_similarity_text)
-
-        ordered = [by_key.pop(key) for key in ranked_keys if key in by_key]
-        ordered.extend(by_key.values())
-        return ordered
\ No newline at end of file
+        self, free_text_similarity_text: str, keys: List[str], max_distance: Optional[float] = None
+    ) -> Tuple[List[str], Dict[str, float]]:
+        """
+        Rank already-filtered source keys by text similarity, without any
+        DB access. Returns the ordered keys and the FAISS similarity score of
+        every source it scored.
+
+        Only the filtered keys are handed to FAISS, so it scores just those
+        candidates instead of ranking the entire index and discarding most
+        of it. When a BM25 index has been built, its keyword ranking of the
+        same candidates is fused in with reciprocal rank fusion, so exact
+        names and rare (e.g. Aramaic) terms count even where the embedding
+        misses them. Only candidate keys are kept from
+        that ranking (looked up in an ordered set).
+        Anything that wasn't ranked (e.g. the index is stale/incomplete) is
+        appended at the end rather than silently dropped, so results never
+        disappear because of a lookup mismatch.
+
+        With max_distance set, sources FAISS places further away than that
+        are dropped instead (unless the keyword ranking matched them), and so
+        is anything left unranked.
+
+        Hebrew text can't be compared against the English embeddings, so a
+        Hebrew query is ranked by the Hebrew full-text index alone (quoted
+        phrases must match exactly), and carries no scores.
+        """
+        hits = None
+        if not self.ranks_by_hebrew(free_text_similarity_text):
+            hits = self.faiss.search_within(free_text_similarity_text, dict.fromkeys(keys).keys(),
+                                            max_distance=max_distance)
+        return self._order_by_hits(free_text_similarity_text, keys, hits, max_distance)
+
+    def ranks_by_hebrew(self, text: str) -> bool:
+        """Whether text is ranked by the Hebrew full-text index (so never reaches FAISS)."""
+        hebrew = self._get_lexical_index(HebrewTextIndex)
+        return hebrew is not None and HebrewTextIndex.is_hebrew(text)
+
+    def encode_free_texts(self, queries: List[SourceSearchQuery]) -> None:
+        """Encode, into FAISS's query-embedding cache, the free texts rank_candidates will hand FAISS."""
+        texts = [q.free_text_similarity for q in queries
+                 if q.free_text_similarity and not self.ranks_by_hebrew(q.free_text_similarity)]
+        if texts:
+            self.faiss.encode_queries(texts)
+
+    def _order_by_hits(self, free_text_similarity_text: str, keys: List[str], hits: Optional[List[SearchHit]],
+                       max_distance: Optional[float]) -> Tuple[List[str], Dict[str, float]]:
+        """order_by_faiss_similarity() given FAISS's hits (None for a Hebrew query)."""
+        by_key = dict.fromkeys(keys)  # ordered set of the candidates
+        scores: Dict[str, float] = {}
+
+        if hits is None:
+            hebrew = self._get_lexical_index(HebrewTextIndex)
+            ranked_keys = hebrew.rank_within(free_text_similarity_text, by_key.keys())
+        else:
+            scores = dict(hits)
+            ranked_keys = [key for key, _ in hits]
+            lexical = self._get_lexical_index(BM25Index)
+            if lexical is not None:
+                keyword_keys = lexical.rank_within(free_text_similarity_text, by_key.keys())
+                ranked_keys = reciprocal_rank_fusion([ranked_keys, keyword_keys])
+
+        ordered = [key for key in ranked_keys if key in by_key]
+        if max_distance is None:
+            placed = set(ordered)
+            ordered.extend(key for key in by_key if key not in placed)
+        return ordered, scores
+
+    def _get_lexical_index(self, index_cls: Type[BM25Index]) -> Optional[BM25Index]:
+        """
+        The persisted lexical index of the given class, from the process-wide
+        LexicalIndexCache (reloaded once its persisted file is replaced).
+        None if it was never built, or lexical_cache is None, in which case
+        that ranking is skipped.
+        """
+        if self.lexical_cache is None:
+            return None
+        return self.lexical_cache.get(index_cls, self.db_api)
@@ -1,7 +1,7 @@
 # bs"d - lehagdil torah velahadir
 
 from dataclasses import dataclass, field
-from typing import List
+from typing import List, Optional
 
 from backend.models_db.Enums import PassageType, SourceType
 
@@ -9,8 +9,13 @@ from backend.models_db.Enums import PassageType, SourceType
 @dataclass
 class SourceSearchQuery:
     free_text_similarity: str
-    max_sources: int
+    max_sources: int  # page size
     src_types: List[SourceType] = field(default_factory=list)
     passage_types: List[PassageType] = field(default_factory=list)
     entity_ids: List[str] = field(default_factory=list)
     rel_ids: List[str] = field(default_factory=list)
+    books: List[str] = field(default_factory=list)  # Book.database_name; none = every book of src_types
+    offset: int = 0  # first result of the page
+    # Drop sources whose embedding distance to free_text_similarity is above
+    # this (squared L2; FaissEngine scores are 1 - distance/2).
+    max_distance: Optional[float] = None
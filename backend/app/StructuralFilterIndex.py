@@ -0,0 +1,325 @@
+# bs"d - lehagdil torah velahadir
+
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from backend.db.DBConstants import DBFields
+from backend.models_db.Enums import PassageType, SourceType
+from backend.models_db.SourceClasses.SourceMetadata import SourceMetadata
+
+# (dimension, value): dimension is the DBFields name the db filters on.
+Posting = Tuple[str, str]
+
+# Rebuild from the db once the incrementally added ordinals pass this fraction of the index.
+_MAX_TAIL_FRACTION = 0.1
+
+# The fields a refresh builds on a staged copy and swaps in as one consistent snapshot.
+_SNAPSHOT_FIELDS = ("_keys", "_ordinals", "_alive", "_order", "_order_keys",
+                    "_postings", "_base_n", "_tail", "_version")
+
+
+class StructuralFilterIndex:
+    """
+    Process-resident inverted index of the structural source filters:
+    every passage type, entity key, relationship key, source type and book
+    maps to the set of sources (by ordinal) that have it. A filter then
+    resolves in memory, with get_source_metadata_filtered semantics (OR
+    within a dimension, AND across dimensions), instead of a $in/$and query
+    over the src_metadata multikey indexes.
+
+    Each posting is stored roaring-style, in whichever form is smaller: a
+    sorted int32 array of ordinals for a rare value (most entities and
+    relations), or a packed bitmap (np.packbits, one bit per source) for a
+    common one (passage types, source types). Bitmaps of a dimension are
+    OR'd word-wise and unpacked once.
+
+    Built from one projection scan (get_src_metadata_structure) and kept up
+    to date by a background thread, like FaissEngine's refresher, so a
+    search never reads the db for it: every refresh_interval_s the
+    src_metadata version counter is read, and if it moved only the documents
+    written since are scanned. A rewritten source gets a new ordinal and its
+    old one is masked out; those new postings live in a small uncompressed
+    tail until the next full rebuild (after rebuild_every_s, or once the
+    tail passes _MAX_TAIL_FRACTION of the index). Each refresh builds on a
+    staged copy and swaps it in under the lock, so readers wait only for
+    the swap.
+
+    Every write first bumps the counter atomically and stamps its document
+    with the value it got (DBFields.WRITE_VERSION), and each incremental
+    scan starts from the last version seen, inclusive, so a write whose
+    document lands just after the counter was read is still picked up. Only
+    a write that lands after a later-stamped one was already scanned waits
+    for the next rebuild.
+    """
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self, dbapi=None, refresh_interval_s: float = 5.0, rebuild_every_s: float = 600.0):
+        """
+        :param refresh_interval_s: How often the background thread brings the
+            index up to date. 0 disables it: is_ready() then refreshes
+            synchronously on every call.
+        """
+        if getattr(self, "_initialized", False):
+            return
+        self._initialized = True
+
+        self.dbapi = dbapi
+        self.refresh_interval_s = refresh_interval_s
+        self.rebuild_every_s = rebuild_every_s
+        # Queries hold this while reading; a refresh only holds it to swap the new snapshot in.
+        self._lock = threading.Lock()
+        # Held for a whole refresh, so two never build at once (warm_up vs. the refresher).
+        self._build_lock = threading.Lock()
+        self._refresher: Optional[threading.Thread] = None
+        self._stop_refresher = threading.Event()
+        self._built_at = 0.0
+        self._reset()
+
+    def _reset(self) -> None:
+        self._version: Optional[int] = None  # src_metadata version the index reflects; None = not built
+        self._keys: List[str] = []  # ordinal -> key
+        self._ordinals: Dict[str, int] = {}  # key -> its live ordinal
+        self._alive = np.zeros(0, dtype=bool)
+        self._order = np.zeros(0, dtype=np.int64)  # every ordinal, in canonical source order
+        self._order_keys = np.empty(0, dtype=object)  # _order's _order_key()s, ascending
+        self._postings: Dict[Posting, np.ndarray] = {}  # of ordinals < _base_n: int32 ordinals or packed bitmap
+        self._base_n = 0
+        self._tail: Dict[Posting, List[int]] = {}  # of ordinals >= _base_n
+
+    ############################################## Queries ###############################################
+
+    def get_source_metadata_keys_filtered(
+        self,
+        passage_types: Optional[List[PassageType]] = None,
+        entity_ids: Optional[List[str]] = None,
+        rel_ids: Optional[List[str]] = None,
+        src_types: Optional[List[SourceType]] = None,
+        books: Optional[List[str]] = None,
+    ) -> List[str]:
+        """The keys the db's get_source_metadata_keys_filtered would return, in canonical order."""
+        with self._lock:
+            return [self._keys[i] for i in self._match(passage_types, entity_ids, rel_ids, src_types, books)]
+
+    def get_source_metadata_key_page(
+        self,
+        passage_types: Optional[List[PassageType]] = None,
+        entity_ids: Optional[List[str]] = None,
+        rel_ids: Optional[List[str]] = None,
+        src_types: Optional[List[SourceType]] = None,
+        books: Optional[List[str]] = None,
+        offset: int = 0,
+        limit: int = 0,
+    ) -> Tuple[List[str], int]:
+        """The keys of the db's get_source_metadata_page (same order and cut) and the total match count."""
+        with self._lock:
+            ordinals = self._match(passage_types, entity_ids, rel_ids, src_types, books)
+            page = ordinals[offset:offset + limit] if limit else ordinals[offset:]
+            return [self._keys[i] for i in page], len(ordinals)
+
+    def _match(self, passage_types, entity_ids, rel_ids, src_types, books) -> np.ndarray:
+        # caller holds self._lock
+        dimensions = (
+            (DBFields.PASSAGE_TYPES, [pt.value for pt in passage_types or ()]),
+            (DBFields.ENTITY_KEYS, entity_ids or ()),
+            (DBFields.REL_KEYS, rel_ids or ()),
+            (DBFields.SOURCE_TYPE, [src_type.value for src_type in src_types or ()]),
+            (DBFields.BOOK, books or ()),
+        )
+        mask = self._alive.copy()
+        for dimension, values in dimensions:
+            if values:
+                mask &= self._any_of(dimension, values)
+        return self._order[mask[self._order]]
+
+    def _any_of(self, dimension: str, values: Iterable[str]) -> np.ndarray:
+        """Mask of the sources with any of the values in dimension."""
+        mask = np.zeros(len(self._alive), dtype=bool)  # a refresh may be appending to _keys meanwhile
+        packed = None
+        for value in values:
+            posting = self._postings.get((dimension, value))
+            if posting is not None:
+                if posting.dtype == np.uint8:
+                    packed = posting.copy() if packed is None else np.bitwise_or(packed, posting, out=packed)
+                else:
+                    mask[posting] = True
+            tail = self._tail.get((dimension, value))
+            if tail:
+                mask[tail] = True
+        if packed is not None:
+            mask[:self._base_n] |= np.unpackbits(packed, count=self._base_n).view(bool)
+        return mask
+
+    ############################################## Building / refreshing ###############################################
+
+    def is_ready(self) -> bool:
+        """
+        Whether filters can resolve in memory, without reading the db: true
+        once the background refresher (started here) has built the index.
+        With refresh_interval_s=0 this refreshes synchronously instead.
+        """
+        if not self.refresh_interval_s:
+            return self.refresh()
+        self._ensure_background_refresh()
+        return self._version is not None
+
+    def warm_up(self) -> None:
+        """Build the index now rather than on the refresher's first tick, and start the refresher."""
+        self.refresh()
+        if self.refresh_interval_s:
+            self._ensure_background_refresh()
+
+    def refresh(self) -> bool:
+        """
+        Bring the index up to date with the db (the background refresher does
+        this every refresh_interval_s). False if the index can't be trusted
+        (never built, or the db can't be read), in which case filter in the db instead.
+        """
+        with self._build_lock:
+            now = time.monotonic()
+            try:
+                version = self.dbapi.get_src_metadata_version()
+                if self._version is None or now - self._built_at >= self.rebuild_every_s or self._tail_too_big():
+                    self._build(version)
+                    self._built_at = now
+                elif version != self._version:
+                    self._extend(version)
+            except Exception as e:
+                print(f"[StructuralFilterIndex] Could not refresh from the db; filtering in the db instead: {e}")
+                return False
+            return True
+
+    def _build(self, version: int) -> None:
+        # caller holds self._build_lock
+        start = time.perf_counter()
+        staged = self._staged()
+        staged._reset()
+        staged._add(self.dbapi.get_src_metadata_structure())
+        staged._compress()
+        staged._version = version
+        with self._lock:
+            self._swap_in(staged)
+        print(f"[StructuralFilterIndex] Indexed {len(self._keys)} sources ({len(self._postings)} postings) "
+              f"in {time.perf_counter() - start:.2f}s.")
+
+    def _extend(self, version: int) -> None:
+        """Add only the documents written since self._version."""
+        # caller holds self._build_lock
+        docs = list(self.dbapi.get_src_metadata_structure(min_write_version=self._version))
+        staged = self._staged()
+        staged._tail = {posting: list(ordinals) for posting, ordinals in self._tail.items()}  # still being read
+        staged._add(docs)
+        staged._version = version
+        with self._lock:
+            self._swap_in(staged)
+
+    def _staged(self) -> "StructuralFilterIndex":
+        """
+        A detached copy of this index for a refresh to build into. It shares
+        _keys (only ever appended to, and queries stay below len(_alive)) and
+        _ordinals (never read by queries).
+        """
+        staged = object.__new__(StructuralFilterIndex)
+        staged.__dict__.update(self.__dict__)
+        return staged
+
+    def _swap_in(self, staged: "StructuralFilterIndex") -> None:
+        # caller holds self._lock
+        for field_name in _SNAPSHOT_FIELDS:
+            setattr(self, field_name, getattr(staged, field_name))
+
+    def _tail_too_big(self) -> bool:
+        return len(self._keys) - self._base_n > max(self._base_n * _MAX_TAIL_FRACTION, 1000)
+
+    def _add(self, docs: Iterable[Dict[str, Any]]) -> None:
+        """Give each document a new ordinal (masking out its old one, if any), with its postings in the tail."""
+        # on a staged copy; everything is read from docs before anything shared is appended to
+        entries = [(doc[DBFields.KEY], self._order_key(doc), list(self._postings_of(doc))) for doc in docs]
+        first = len(self._keys)
+        replaced = []
+        for ordinal, (key, _, postings) in enumerate(entries, start=first):
+            if key in self._ordinals:
+                replaced.append(self._ordinals[key])
+            self._ordinals[key] = ordinal
+            self._keys.append(key)
+            for posting in postings:
+                self._tail.setdefault(posting, []).append(ordinal)
+
+        self._alive = np.concatenate([self._alive, np.ones(len(entries), dtype=bool)])
+        self._alive[replaced] = False
+        self._merge_order(first, [order_key for _, order_key, _ in entries])
+
+    def _merge_order(self, first: int, order_keys: List[str]) -> None:
+        """Merge ordinals first.. (with these order keys) into the canonical order, sorting only them."""
+        new_keys = np.empty(len(order_keys), dtype=object)
+        new_keys[:] = order_keys
+        by_key = np.argsort(new_keys, kind="stable")
+        new_keys = new_keys[by_key]
+        positions = np.searchsorted(self._order_keys, new_keys, side="right")
+        self._order_keys = np.insert(self._order_keys, positions, new_keys)
+        self._order = np.insert(self._order, positions, first + by_key)
+
+    def _compress(self) -> None:
+        """Move every tail posting into its compressed form: an ordinal array or a packed bitmap."""
+        # on a staged copy
+        n = len(self._keys)
+        for posting, ordinals in self._tail.items():
+            ordinals = np.asarray(ordinals, dtype=np.int32)
+            if len(ordinals) * 32 < n:  # 4 bytes an ordinal vs n/8 bytes a bitmap
+                self._postings[posting] = ordinals
+            else:
+                bits = np.zeros(n, dtype=bool)
+                bits[ordinals] = True
+                self._postings[posting] = np.packbits(bits)
+        self._tail = {}
+        self._base_n = n
+
+    ############################################## Background refresher ###############################################
+
+    def _ensure_background_refresh(self) -> None:
+        """Start (once per process) the thread that builds the index and keeps it fresh off the request path."""
+        if self._refresher is not None and self._refresher.is_alive():
+            return
+        with self._lock:  # not _build_lock: a search must not wait out a build in progress
+            if self._refresher is not None and self._refresher.is_alive():
+                return
+            self._stop_refresher.clear()
+            self._refresher = threading.Thread(
+                target=self._refresh_loop, name="StructuralFilterIndex-refresher", daemon=True,
+            )
+            self._refresher.start()
+
+    def _refresh_loop(self) -> None:
+        # refresh() logs a failure; the current index keeps serving and the next tick tries again.
+        self.refresh()
+        while not self._stop_refresher.wait(self.refresh_interval_s):
+            self.refresh()
+
+    def stop_background_refresh(self) -> None:
+        self._stop_refresher.set()
+        if self._refresher is not None:
+            self._refresher.join(timeout=5)
+        self._refresher = None
+
+    @staticmethod
+    def _order_key(doc: Dict[str, Any]) -> str:
+        """Sorts like the db's SourceMetadataMongoMixin.PAGE_SORT (sort key, then key); no sort key holds a NUL."""
+        key = doc[DBFields.KEY]
+        return (doc.get(DBFields.SORT_KEY) or SourceMetadata(key).stored_sort_key()) + "\0" + key
+
+    @staticmethod
+    def _postings_of(doc: Dict[str, Any]) -> Iterable[Posting]:
+        key = doc[DBFields.KEY]
+        # Documents written before source_type/book were stored get them from the key, like the backfill does.
+        yield DBFields.SOURCE_TYPE, doc.get(DBFields.SOURCE_TYPE) or SourceMetadata(key).source_type.value
+        yield DBFields.BOOK, doc.get(DBFields.BOOK) or SourceMetadata.get_book_name_from_key(key)
+        for field in (DBFields.PASSAGE_TYPES, DBFields.ENTITY_KEYS, DBFields.REL_KEYS):
+            for value in doc.get(field) or ():
+                yield field, value
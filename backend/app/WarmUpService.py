@@ -0,0 +1,145 @@
+# bs"d - lehagdil torah velahadir
+
+import threading
+import time
+from enum import Enum
+from typing import Callable, Optional
+
+from backend.app.SourceSearchHandler import SourceSearchHandler
+
+
+class WarmUpState(Enum):
+    NOT_STARTED = "not_started"
+    WARMING_UP = "warming_up"
+    READY = "ready"
+    FAILED = "failed"
+
+
+class WarmUpService:
+    """
+    Process-wide background warm-up of the source search: the Mongo
+    connection, the FAISS index and the query encoder's model all load
+    lazily, and would otherwise all land on whoever searches first.
+
+    start() (idempotent) builds a SourceSearchHandler and warms it on a
+    daemon thread; the UI polls state meanwhile. Once READY, every search
+    in the process reuses that one warmed handler (see get_handler).
+
+    A failed warm-up is retried by the next start() or get_handler() once
+    retry_backoff_s has passed, doubling after every failure up to
+    max_retry_backoff_s. Until one succeeds, searches share a single
+    fallback handler that loads lazily.
+    """
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self, handler_factory: Callable[[], SourceSearchHandler] = SourceSearchHandler,
+                 retry_backoff_s: float = 30.0, max_retry_backoff_s: float = 600.0):
+        if getattr(self, "_initialized", False):
+            return
+        self._initialized = True
+
+        self._handler_factory = handler_factory
+        self.retry_backoff_s = retry_backoff_s
+        self.max_retry_backoff_s = max_retry_backoff_s
+        self._handler: Optional[SourceSearchHandler] = None
+        self._fallback: Optional[SourceSearchHandler] = None
+        self._failures = 0
+        self._failed_at = 0.0
+        self._state = WarmUpState.NOT_STARTED
+        self._error: Optional[str] = None
+        self._elapsed_s: Optional[float] = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def state(self) -> WarmUpState:
+        return self._state
+
+    @property
+    def error(self) -> Optional[str]:
+        """Why the warm-up failed (None unless state is FAILED)."""
+        return self._error
+
+    @property
+    def elapsed_s(self) -> Optional[float]:
+        """How long the warm-up took, once it is over."""
+        return self._elapsed_s
+
+    def is_ready(self) -> bool:
+        return self._state == WarmUpState.READY
+
+    def start(self) -> None:
+        """
+        Start warming up in the background, unless that was already done (or
+        is underway). After a failure, start again once the backoff is over.
+        """
+        with self._lock:
+            if self._state == WarmUpState.FAILED:
+                if time.monotonic() - self._failed_at < self._retry_delay_s():
+                    return
+            elif self._state != WarmUpState.NOT_STARTED:
+                return
+            self._state = WarmUpState.WARMING_UP
+            self._done.clear()
+            self._thread = threading.Thread(target=self._run, name="WarmUpService", daemon=True)
+            self._thread.start()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the warm-up is over (either way); True if it is ready."""
+        self._done.wait(timeout)
+        return self.is_ready()
+
+    def get_handler(self) -> SourceSearchHandler:
+        """
+        The warmed, shared handler once READY. Before that (or while the
+        warm-up keeps failing) the shared fallback handler, which loads
+        everything lazily itself. A failed warm-up is retried from here too.
+        """
+        if self._state == WarmUpState.READY:
+            return self._handler
+        if self._state == WarmUpState.FAILED:
+            self.start()
+        fallback = self._fallback
+        if fallback is None:
+            # Built outside the lock (it connects to Mongo); a rare race just builds one extra.
+            fallback = self._handler_factory()
+            with self._lock:
+                if self._state == WarmUpState.READY:  # the warm-up finished meanwhile
+                    return self._handler
+                if self._fallback is None:
+                    self._fallback = fallback
+                fallback = self._fallback
+        return fallback
+
+    def _retry_delay_s(self) -> float:
+        return min(self.retry_backoff_s * 2 ** max(self._failures - 1, 0), self.max_retry_backoff_s)
+
+    def _run(self) -> None:
+        start = time.perf_counter()
+        try:
+            handler = self._handler_factory()
+            handler.warm_up()
+        except Exception as e:
+            self._error = str(e)
+            self._failures += 1
+            self._failed_at = time.monotonic()
+            self._state = WarmUpState.FAILED
+            print(f"[WarmUpService] Warm-up failed; searches will load lazily instead, "
+                  f"retrying in {self._retry_delay_s():.0f}s: {e}")
+        else:
+            with self._lock:
+                self._handler = handler
+                self._error = None
+                self._failures = 0
+                self._fallback = None
+                self._state = WarmUpState.READY
+            print(f"[WarmUpService] Source search warmed up in {time.perf_counter() - start:.1f}s.")
+        finally:
+            self._elapsed_s = time.perf_counter() - start
+            self._done.set()
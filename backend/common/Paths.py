@@ -8,6 +8,9 @@ TESTS_DIR = os.path.join(BASE_DIR, "Tests")
 QUESTIONS_OUTPUT_DIR = os.path.join(TESTS_DIR, "Questions")
 LMM_RESPONSES_OUTPUT_DIR = os.path.join(TESTS_DIR, "LMM Responses")
 ENRICHMENT_RESPONSES_OUTPUT_DIR = os.path.join(TESTS_DIR, "Enrichment Responses")
+FAISS_CACHE_DIR = os.path.join(BASE_DIR, "FaissCache")
+ONNX_MODEL_DIR = os.path.join(BASE_DIR, "OnnxModels")
+SEARCH_CACHE_DIR = os.path.join(BASE_DIR, "SearchCache")
 
 
 ############################################## local paths for this project #######################################
@@ -0,0 +1,130 @@
+# bs"d - lehagdil torah velahadir
+
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import AsyncMongoClient
+from pymongo.server_api import ServerApi
+
+from backend.db.Collections import Collection, CollectionObjs
+from backend.db.DBConstants import DBFields, DBOperators, SrcContentProjections
+from backend.db.DBapiMongoDB import DBapiMongoDB
+from backend.db.mongo_parts.source_metadata_mixin import SourceMetadataMongoMixin
+from backend.models_db.Enums import PassageType, SourceType
+from backend.models_db.SourceClasses.SourceClass import SourceClass
+from backend.models_db.SourceClasses.SourceContent import SourceContent
+from backend.models_db.SourceClasses.SourceMetadata import SourceMetadata
+
+
+class AsyncDBapiMongoDB:
+    """
+    asyncio counterpart (pymongo's AsyncMongoClient) of the DBapiMongoDB
+    reads a source search makes, for AsyncSourceSearchHandler. Queries are
+    built, and documents converted, by the same mixin code as the sync
+    DBapiMongoDB (conversion is delegated to sync_db), so both return
+    identical objects. Writes stay on the sync DBapiMongoDB.
+    """
+
+    def __init__(self, sync_db: DBapiMongoDB, connection_string: Optional[str] = None):
+        self.sync_db = sync_db
+        self.client: Optional[AsyncMongoClient] = None
+        if connection_string:
+            # AsyncMongoClient connects lazily, on the first awaited operation.
+            self.client = AsyncMongoClient(connection_string, server_api=ServerApi("1"))
+
+    def get_collection(self, collection: Collection):
+        if self.client is None:
+            raise Exception("Database connection is not established.")
+        return self.client.get_database(collection.db_name)[collection.name]
+
+    async def close(self) -> None:
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+
+    ############################################## Source metadata ###############################################
+
+    async def get_source_metadata_keys_filtered(
+        self,
+        passage_types: Optional[List[PassageType]] = None,
+        entity_ids: Optional[List[str]] = None,
+        rel_ids: Optional[List[str]] = None,
+        src_types: Optional[List[SourceType]] = None,
+        books: Optional[List[str]] = None,
+    ) -> List[str]:
+        query = SourceMetadataMongoMixin._src_metadata_filter(passage_types, entity_ids, rel_ids, src_types, books)
+        docs = await self.get_collection(CollectionObjs.SRC_METADATA).find(
+            query, {DBFields.KEY: 1, "_id": 0}).to_list(None)
+        return [doc[DBFields.KEY] for doc in docs]
+
+    async def get_source_metadata_page(
+        self,
+        passage_types: Optional[List[PassageType]] = None,
+        entity_ids: Optional[List[str]] = None,
+        rel_ids: Optional[List[str]] = None,
+        src_types: Optional[List[SourceType]] = None,
+        books: Optional[List[str]] = None,
+        offset: int = 0,
+        limit: int = 0,
+    ) -> Tuple[List[SourceMetadata], int]:
+        """The page and the count are queried concurrently."""
+        collection = self.get_collection(CollectionObjs.SRC_METADATA)
+        query = SourceMetadataMongoMixin._src_metadata_filter(passage_types, entity_ids, rel_ids, src_types, books)
+        docs, total = await asyncio.gather(
+            collection.find(query, sort=SourceMetadataMongoMixin.PAGE_SORT, skip=offset, limit=limit).to_list(None),
+            collection.count_documents(query),
+        )
+        return [self.sync_db._doc_to_src_metadata(doc) for doc in docs], total
+
+    async def hydrate_source_metadata(self, src_metadata_lst: List[SourceMetadata]) -> List[SourceMetadata]:
+        keys = [sm.key for sm in src_metadata_lst if not sm.hydrated]
+        docs = await self._find_by_keys(CollectionObjs.SRC_METADATA, keys) if keys else []
+        by_key = {doc[DBFields.KEY]: doc for doc in docs}
+        hydrated = []
+        for sm in src_metadata_lst:
+            if not sm.hydrated:
+                if sm.key not in by_key:
+                    continue
+                SourceMetadataMongoMixin._fill_src_metadata(sm, by_key[sm.key])
+            hydrated.append(sm)
+        return hydrated
+
+    ############################################## Entities / relations ###############################################
+
+    async def get_entities_by_keys(self, keys: List[str]) -> List[Any]:
+        return [self.sync_db._doc_to_entity(doc) for doc in await self._find_by_keys(CollectionObjs.ENTITIES, keys)]
+
+    async def get_rels_by_keys(self, keys: List[str]) -> List[Any]:
+        return [self.sync_db._doc_to_rel(doc) for doc in await self._find_by_keys(CollectionObjs.RELATIONS, keys)]
+
+    ############################################## Source content ###############################################
+
+    async def find_source_contents(self, keys: List[str]) -> List[SourceContent]:
+        """DBapiMongoDB.find_source_contents, with the per-collection $in queries awaited concurrently."""
+        keys_by_col: Dict[str, List[str]] = {}
+        for key in dict.fromkeys(keys):
+            col_code = SourceClass.get_collection_name_from_key(key)
+            if not col_code:
+                raise KeyError(key)
+            keys_by_col.setdefault(col_code, []).append(key)
+
+        results = await asyncio.gather(*(
+            self._find_by_keys(CollectionObjs.get_col_obj_from_str(col_code), col_keys, SrcContentProjections.FULL)
+            for col_code, col_keys in keys_by_col.items()
+        ))
+        found = {doc[DBFields.KEY]: SourceContent(key=doc[DBFields.KEY], content=doc[DBFields.CONTENT])
+                 for docs in results for doc in docs}
+
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        if missing:
+            raise Exception(f"Documents with keys {missing} not found.")
+        return [found[key] for key in keys]
+
+    async def _find_by_keys(self, collection: Collection, keys: List[str],
+                            projection: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        cursor = self.get_collection(collection).find(
+            {DBFields.KEY: {DBOperators.IN: list(keys)}},
+            projection,
+            batch_size=max(len(keys), 1),  # the whole answer in one round trip
+        )
+        return await cursor.to_list(None)
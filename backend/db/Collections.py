@@ -23,6 +23,8 @@ class CollectionObjs:
     SRC_METADATA = Collection(name="src_metadata", db_name="Graphs")
     ENTITIES = Collection(name="entities", db_name="Graphs")
     RELATIONS = Collection(name="relations", db_name="Graphs")
+    # Change counters, one document per counted collection (e.g. "src_metadata")
+    VERSIONS = Collection(name="versions", db_name="Graphs")
 
     @classmethod
     def all(cls):
@@ -38,6 +40,7 @@ class CollectionObjs:
             cls.SRC_METADATA,
             cls.ENTITIES,
             cls.RELATIONS,
+            cls.VERSIONS,
         ]
 
     @classmethod
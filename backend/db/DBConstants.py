@@ -11,6 +11,10 @@ class DBFields:
     # Common fields
     KEY = "key"
 
+    # Source Content fields
+    CONTENT = "content"
+    SORT_KEY = "sort_key"  # SourceClass.stored_sort_key(), for server-side ordering
+
     # Entity fields
     ENTITY_TYPE = "entityType"
     DISPLAY_EN_NAME = "display_en_name"
@@ -25,23 +29,51 @@ class DBFields:
 
     # Source Metadata fields
     SOURCE_TYPE = "source_type"
+    BOOK = "book"  # Book.database_name, as in the key
     SUMMARY_EN = "summary_en"
     SUMMARY_HEB = "summary_heb"
     PASSAGE_TYPES = "passage_types"
     ENTITY_KEYS = "entity_keys"
     REL_KEYS = "rel_keys"
+    WRITE_VERSION = "write_version"  # the src_metadata version counter its last insert/update brought about
+
+    # Version counter fields
+    VERSION = "version"
 
 
 class DBOperators:
     """MongoDB query operators."""
 
     SET = "$set"
+    INC = "$inc"
     OR = "$or"
     AND = "$and"
     IN = "$in"
+    EXISTS = "$exists"
+    GTE = "$gte"
+    LT = "$lt"
+    SLICE = "$slice"
     REGEX = "$regex"
     OPTIONS = "$options"
 
     # Regex options
     CASE_INSENSITIVE = "i"
 
+
+class SrcContentProjections:
+    """Projections for reading source content documents (the content array is [EN, HEB, ...])."""
+
+    FULL = {DBFields.KEY: 1, DBFields.CONTENT: 1, "_id": 0}
+    # English HTML only: for passes that never touch the Hebrew, roughly halves what crosses the wire.
+    EN_ONLY = {DBFields.KEY: 1, DBFields.CONTENT: {DBOperators.SLICE: 1}, "_id": 0}
+
+
+class SrcMetadataProjections:
+    """Projections for reading SourceMetadata documents."""
+
+    # Keys + sort info only: no summaries, no entity/rel key arrays. Read as un-hydrated
+    # SourceMetadata (see SourceMetadataMongoMixin.hydrate_source_metadata).
+    SLIM = {DBFields.KEY: 1, DBFields.SORT_KEY: 1, DBFields.SOURCE_TYPE: 1, DBFields.BOOK: 1, "_id": 0}
+    # Everything the structural filters look at, and nothing else: what StructuralFilterIndex is built from.
+    STRUCTURAL = {DBFields.KEY: 1, DBFields.SORT_KEY: 1, DBFields.SOURCE_TYPE: 1, DBFields.BOOK: 1,
+                  DBFields.PASSAGE_TYPES: 1, DBFields.ENTITY_KEYS: 1, DBFields.REL_KEYS: 1, "_id": 0}
@@ -3,6 +3,7 @@ import os
 import subprocess
 from datetime import datetime
 
+from backend.db.AsyncDBapiMongoDB import AsyncDBapiMongoDB
 from backend.db.DBapiMongoDB import DBapiMongoDB
 from system_common.SystemFunctions import get_secret
 
@@ -11,19 +12,26 @@ class DBFactory:
 
     @staticmethod
     def get_prod_db_mongo() -> DBapiMongoDB:
+        return DBapiMongoDB(DBFactory._prod_uri())
+
+    @staticmethod
+    def get_prod_db_mongo_async(sync_db: DBapiMongoDB) -> AsyncDBapiMongoDB:
+        """Async reads of the same prod db, for AsyncSourceSearchHandler (writes stay on sync_db)."""
+        return AsyncDBapiMongoDB(sync_db, DBFactory._prod_uri())
+
+    @staticmethod
+    def _prod_uri() -> str:
 
         # Retrieve the database username and password from environment variables
         username = get_secret('DB_BT_USERNAME')
         password = get_secret('DB_BT_PASSWORD')
 
         # MongoDB URI
-        uri = (
+        return (
             f"mongodb+srv://{username}:{password}"
             "@chatblatt.sdqpvk2.mongodb.net/?retryWrites=true&w=majority&appName=ChatBlatt"
         )
 
-        return DBapiMongoDB(uri)
-
     # #2
     # @staticmethod
     # def get_test_db_mongo() -> DBapiMongoDB:
@@ -79,6 +79,16 @@ class DBapiMongoDB(
           - Multikey (rel_keys): same benefit, for "find all SourceMetadata
             containing relationship key X" (used e.g. when re-pointing/cleaning up
             relationships during entity merges).
+          - Compound (sort_key, key): get_source_metadata_page sorts and limits
+            on it (key breaks sort_key ties, so pages are stable), so a page
+            costs a walk of the index, not a sort of every match.
+          - Compound (source_type, passage_types) and (book, passage_types): a
+            "Tanach only" or "one tractate" search (optionally narrowed by passage
+            type) scans just that slice of the collection.
+
+        Source content collections (BT, TN):
+          - Single (sort_key): iter_src_contents_by_book reads a whole book as one
+            range scan of this index, already in canonical order.
         """
         from pymongo import ASCENDING
 
@@ -103,6 +113,29 @@ class DBapiMongoDB(
             [(DBFields.REL_KEYS, ASCENDING)],
             name="idx_src_metadata_rel_keys",
         )
+        src_metadata.create_index(
+            SourceMetadataMongoMixin.PAGE_SORT,
+            name="idx_src_metadata_sort_key_key",
+        )
+        src_metadata.create_index(
+            [(DBFields.SOURCE_TYPE, ASCENDING), (DBFields.PASSAGE_TYPES, ASCENDING)],
+            name="idx_src_metadata_type_passage_types",
+        )
+        src_metadata.create_index(
+            [(DBFields.BOOK, ASCENDING), (DBFields.PASSAGE_TYPES, ASCENDING)],
+            name="idx_src_metadata_book_passage_types",
+        )
+        src_metadata.create_index(
+            [(DBFields.WRITE_VERSION, ASCENDING)],
+            name="idx_src_metadata_write_version",
+            sparse=True,  # documents written before write_version existed are only read by full scans
+        )
+
+        for src_collection in (CollectionObjs.BT, CollectionObjs.TN):
+            self.get_collection(src_collection).create_index(
+                [(DBFields.SORT_KEY, ASCENDING)],
+                name="idx_src_content_sort_key",
+            )
 
     @override
     def disconnect(self) -> None:
@@ -1,26 +1,83 @@
 from abc import ABC, abstractmethod
 from datetime import datetime
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 
 
 class FaissInterfaceMixin(ABC):
     @abstractmethod
-    def save_faiss_index(self, index_bytes: bytes, metadata_bytes: bytes) -> None:
+    def save_faiss_index(self, index_bytes: bytes, metadata_bytes: bytes,
+                         vectors_bytes: Optional[bytes] = None, shard: Optional[str] = None) -> None:
+        """Replace the persisted index (of the given SourceType shard, or the
+        combined index when shard is None) and drop its delta segments."""
         pass
 
     @abstractmethod
-    def load_faiss_index(self) -> Optional[Tuple[bytes, bytes]]:
+    def load_faiss_index(self, shard: Optional[str] = None) -> Optional[Tuple[bytes, bytes]]:
         pass
 
     @abstractmethod
-    def clear_faiss_index(self) -> None:
+    def load_faiss_index_with_upload_date(self, shard: Optional[str] = None) -> Optional[Tuple[bytes, bytes, datetime]]:
+        """Like load_faiss_index(), plus the upload timestamp of what was read
+        (same value as get_faiss_index_upload_date(), used to key the local
+        on-disk index cache)."""
         pass
 
     @abstractmethod
-    def get_faiss_index_upload_date(self) -> Optional[datetime]:
+    def load_faiss_vectors(self, shard: Optional[str] = None) -> Optional[bytes]:
+        """Return the optional full-precision vectors persisted alongside a
+        compressed index (used for exact re-ranking), or None."""
+        pass
+
+    @abstractmethod
+    def append_faiss_delta(self, delta_bytes: bytes, shard: Optional[str] = None) -> int:
+        """Persist an append-only segment (vectors + keys added since the
+        last base save) without rewriting the base index."""
+        pass
+
+    @abstractmethod
+    def load_faiss_deltas(self, shard: Optional[str] = None) -> List[bytes]:
+        """Return every delta segment on top of the base index, oldest first."""
+        pass
+
+    @abstractmethod
+    def save_lexical_index(self, name: str, index_bytes: bytes) -> None:
+        """Persist a serialized lexical (keyword) index next to the FAISS
+        index, replacing any previous version with the same name."""
+        pass
+
+    @abstractmethod
+    def load_lexical_index(self, name: str) -> Optional[bytes]:
+        """Return the lexical index saved under name, or None."""
+        pass
+
+    @abstractmethod
+    def get_lexical_index_upload_date(self, name: str) -> Optional[datetime]:
+        """Return the upload timestamp of the lexical index saved under name,
+        or None if there is none, without downloading it."""
+        pass
+
+    @abstractmethod
+    def clear_faiss_index(self, shard: Optional[str] = None) -> None:
+        """Delete one shard's persisted files, or everything when shard is None."""
+        pass
+
+    @abstractmethod
+    def list_faiss_shards(self) -> List[str]:
+        """Names of the SourceType shards with a persisted index."""
+        pass
+
+    @abstractmethod
+    def get_faiss_index_upload_date(self, shard: Optional[str] = None) -> Optional[datetime]:
         """Return the upload timestamp of the currently persisted FAISS index
-        file, or None if nothing has been persisted yet. Used to detect,
-        cheaply (without downloading the full index), whether an in-memory
-        cache is stale relative to what's in the db."""
+        (its newest base or delta file), or None if nothing has been persisted
+        yet. Used to detect, cheaply (without downloading the full index),
+        whether an in-memory cache is stale relative to what's in the db."""
+        pass
+
+    @abstractmethod
+    def get_latest_faiss_upload_date(self) -> Optional[datetime]:
+        """The newest get_faiss_index_upload_date() of the combined index, all
+        its shards and the lexical indexes: changes whenever any part of the
+        search index does."""
         pass
 
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, TYPE_CHECKING
+from typing import Any, Dict, Iterator, List, Optional, TYPE_CHECKING
 
 from backend.db.Collections import CollectionObjs, Collection
 from backend.db.DBConstants import DBFields
@@ -38,22 +38,46 @@ class SourceContentInterfaceMixin(ABC):
         col = CollectionObjs.get_col_obj_from_str(col_code)
         return self._find_one_source_content_by_col(col, key)
 
+    @abstractmethod
+    def find_source_contents(self, keys: List[str]) -> List[SourceContent]:
+        """find_one_source_content for many keys at once (a query per
+        collection, not per key); results are in the order of keys."""
+        pass
+
     @abstractmethod
     def get_all_src_contents_of_collection(self, collection: Collection) -> List[SourceContent]:
         pass
 
+    @abstractmethod
+    def iter_src_contents_of_collection(self, collection: Collection, batch_size: int = 256,
+                                        projection: Optional[Dict[str, Any]] = None) -> Iterator[SourceContent]:
+        """Stream every SourceContent of a collection without loading it all at once."""
+        pass
+
     @abstractmethod
     def get_all_src_contents_by_book(self, book: "Book") -> List[SourceContent]:
         """Get all SourceContent documents that belong to a specific book."""
         pass
 
+    @abstractmethod
+    def iter_src_contents_by_book(self, book: "Book", batch_size: int = 256,
+                                  projection: Optional[Dict[str, Any]] = None) -> Iterator[SourceContent]:
+        """Stream a book's SourceContents in canonical order, sorted by the db."""
+        pass
+
+    @abstractmethod
+    def backfill_src_content_sort_keys(self, collection: Collection, batch_size: int = 1000) -> int:
+        """Store the sort key on every document of collection that lacks one."""
+        pass
+
     def insert_source_content(self, result: SourceContent, ref, start_index):
         en = result.content[SourceContentType.EN.value]
         heb = result.content[SourceContentType.HEB.value]
 
         data = {
             DBFields.KEY: result.get_key(),
-            "content": [en, heb, ""],
+            DBFields.CONTENT: [en, heb, ""],
+            DBFields.SORT_KEY: result.stored_sort_key(),
         }
 
         # Decide target collection based on source type
@@ -1,7 +1,7 @@
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
-from backend.models_db.Enums import PassageType
+from backend.models_db.Enums import PassageType, SourceType
 from backend.models_db.SourceClasses.SourceMetadata import SourceMetadata
 
 
@@ -54,12 +54,77 @@ class SourceMetadataInterfaceMixin(ABC):
         passage_types: Optional[List[PassageType]] = None,
         entity_ids: Optional[List[str]] = None,
         rel_ids: Optional[List[str]] = None,
+        src_types: Optional[List[SourceType]] = None,
+        books: Optional[List[str]] = None,
+        slim: bool = False,
     ) -> List[SourceMetadata]:
         """
         Return every SourceMetadata document matching the given filters in a
         single query. Each dimension is OR'd internally (any one of its
         selected values is a match) while the dimensions are AND'd together.
-        A dimension left empty/None is not filtered on.
+        A dimension left empty/None is not filtered on. slim=True reads only
+        keys and sort info, as un-hydrated SourceMetadata.
         """
         pass
 
+    @abstractmethod
+    def hydrate_source_metadata(self, src_metadata_lst: List[SourceMetadata]) -> List[SourceMetadata]:
+        """Fill in the un-hydrated SourceMetadata of the list in place (one query); drops those no longer in the db."""
+        pass
+
+    @abstractmethod
+    def backfill_src_metadata_type_fields(self, batch_size: int = 1000) -> int:
+        """One-time: set the stored source type and book (from the key) on SourceMetadata
+        documents written before they were stored. Returns how many were updated."""
+        pass
+
+    @abstractmethod
+    def get_src_metadata_version(self) -> int:
+        """A counter that changes whenever any SourceMetadata is inserted or updated."""
+        pass
+
+    @abstractmethod
+    def get_src_metadata_structure(self, min_write_version: Optional[int] = None,
+                                   batch_size: int = 5000) -> Iterator[Dict[str, Any]]:
+        """
+        Raw documents with just the fields structural filters look at (key,
+        sort key, source type, book, passage types, entity/rel keys); with
+        min_write_version, only those written since the counter reached it.
+        """
+        pass
+
+    @abstractmethod
+    def get_source_metadata_keys_filtered(
+        self,
+        passage_types: Optional[List[PassageType]] = None,
+        entity_ids: Optional[List[str]] = None,
+        rel_ids: Optional[List[str]] = None,
+        src_types: Optional[List[SourceType]] = None,
+        books: Optional[List[str]] = None,
+    ) -> List[str]:
+        """Just the keys of what get_source_metadata_filtered would return."""
+        pass
+
+    @abstractmethod
+    def get_source_metadata_page(
+        self,
+        passage_types: Optional[List[PassageType]] = None,
+        entity_ids: Optional[List[str]] = None,
+        rel_ids: Optional[List[str]] = None,
+        src_types: Optional[List[SourceType]] = None,
+        books: Optional[List[str]] = None,
+        offset: int = 0,
+        limit: int = 0,
+    ) -> Tuple[List[SourceMetadata], int]:
+        """
+        One page (offset, limit; 0 = no limit) of the filtered SourceMetadata in
+        canonical source order, sorted and limited by the db, and the total
+        number of matches.
+        """
+        pass
+
+    @abstractmethod
+    def get_source_metadata_by_keys(self, keys: List[str]) -> List[SourceMetadata]:
+        """SourceMetadata of the given keys, in their order; unknown keys are skipped."""
+        pass
+
@@ -1,5 +1,6 @@
+import re
 from datetime import datetime
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 
 import gridfs
 
@@ -8,6 +9,23 @@ from backend.db.Collections import CollectionObjs
 # GridFS filenames used to identify the (single, latest) persisted FAISS index/metadata.
 _FAISS_INDEX_FILENAME = "faiss_index"
 _METADATA_FILENAME = "metadata"
+# Optional full-precision copy of the vectors, kept next to a compressed index
+# so the top candidates can be re-ranked exactly.
+_VECTORS_FILENAME = "exact_vectors"
+# Append-only segments holding just the vectors/keys added since the base
+# index above was written (checkpoints during bulk population). Folded back
+# into the base whenever save_faiss_index() runs.
+_DELTA_FILENAME = "faiss_delta"
+# Lexical (keyword) indexes built over the same passages, stored as
+# "lexical_<name>" so they are rebuilt/cleared together with the FAISS index.
+_LEXICAL_FILENAME_PREFIX = "lexical_"
+# A per-SourceType shard keeps the same set of files under "<shard>/<filename>"
+# (e.g. "TN/faiss_index"); shard=None is the single combined index.
+_SHARD_SEPARATOR = "/"
+
+
+def _filename(name: str, shard: Optional[str]) -> str:
+    return f"{shard}{_SHARD_SEPARATOR}{name}" if shard else name
 
 
 class FaissMongoMixin:
@@ -22,41 +40,129 @@ class FaissMongoMixin:
         database = self.get_collection(CollectionObjs.FS).database
         return gridfs.GridFS(database, collection=CollectionObjs.FS.name)
 
-    def save_faiss_index(self, index_bytes: bytes, metadata_bytes: bytes) -> None:
+    def save_faiss_index(self, index_bytes: bytes, metadata_bytes: bytes,
+                         vectors_bytes: Optional[bytes] = None, shard: Optional[str] = None) -> None:
         fs = self._get_faiss_gridfs()
 
         # Remove previous versions first so we don't accumulate orphaned files
         # (GridFS has no upsert semantics; each put() creates a new file).
-        for old_file in fs.find({"filename": {"$in": [_FAISS_INDEX_FILENAME, _METADATA_FILENAME]}}):
+        filenames = [_filename(name, shard)
+                     for name in (_FAISS_INDEX_FILENAME, _METADATA_FILENAME, _VECTORS_FILENAME, _DELTA_FILENAME)]
+        for old_file in fs.find({"filename": {"$in": filenames}}):
             fs.delete(old_file._id)
 
-        fs.put(index_bytes, filename=_FAISS_INDEX_FILENAME)
-        fs.put(metadata_bytes, filename=_METADATA_FILENAME)
+        # Vectors go first, so by the time a reader sees the new index file
+        # (the one its uploadDate freshness check looks at) they already exist.
+        if vectors_bytes is not None:
+            fs.put(vectors_bytes, filename=_filename(_VECTORS_FILENAME, shard))
+        fs.put(metadata_bytes, filename=_filename(_METADATA_FILENAME, shard))
+        fs.put(index_bytes, filename=_filename(_FAISS_INDEX_FILENAME, shard))
 
-    def load_faiss_index(self) -> Optional[Tuple[bytes, bytes]]:
+    def load_faiss_index(self, shard: Optional[str] = None) -> Optional[Tuple[bytes, bytes]]:
         fs = self._get_faiss_gridfs()
 
-        index_file = fs.find_one({"filename": _FAISS_INDEX_FILENAME}, sort=[("uploadDate", -1)])
-        metadata_file = fs.find_one({"filename": _METADATA_FILENAME}, sort=[("uploadDate", -1)])
+        index_file = fs.find_one({"filename": _filename(_FAISS_INDEX_FILENAME, shard)}, sort=[("uploadDate", -1)])
+        metadata_file = fs.find_one({"filename": _filename(_METADATA_FILENAME, shard)}, sort=[("uploadDate", -1)])
 
         if index_file is None or metadata_file is None:
             return None
 
         return index_file.read(), metadata_file.read()
 
-    def clear_faiss_index(self) -> None:
-        """Remove all persisted FAISS index/metadata files from GridFS."""
+    def load_faiss_index_with_upload_date(self, shard: Optional[str] = None) -> Optional[Tuple[bytes, bytes, datetime]]:
+        """Same as load_faiss_index(), but also returns the freshness stamp
+        (see get_faiss_index_upload_date) as of the read, so callers can stamp
+        a local cache with it without a separate round trip."""
         fs = self._get_faiss_gridfs()
-        for grid_out in fs.find():
+
+        # Stamp first: if a delta lands while we read, the stamp is older than
+        # the data and the next freshness check merely reloads once more.
+        upload_date = self._latest_faiss_upload_date(fs, shard)
+        index_file = fs.find_one({"filename": _filename(_FAISS_INDEX_FILENAME, shard)}, sort=[("uploadDate", -1)])
+        metadata_file = fs.find_one({"filename": _filename(_METADATA_FILENAME, shard)}, sort=[("uploadDate", -1)])
+
+        if index_file is None or metadata_file is None:
+            return None
+
+        return index_file.read(), metadata_file.read(), upload_date
+
+    def append_faiss_delta(self, delta_bytes: bytes, shard: Optional[str] = None) -> int:
+        """Store one delta segment after the existing ones; returns its sequence number."""
+        fs = self._get_faiss_gridfs()
+        filename = _filename(_DELTA_FILENAME, shard)
+        last = fs.find_one({"filename": filename}, sort=[("seq", -1)])
+        seq = last.seq + 1 if last is not None else 1
+        fs.put(delta_bytes, filename=filename, seq=seq)
+        return seq
+
+    def load_faiss_deltas(self, shard: Optional[str] = None) -> List[bytes]:
+        """All delta segments on top of the base index, oldest first."""
+        fs = self._get_faiss_gridfs()
+        return [grid_out.read()
+                for grid_out in fs.find({"filename": _filename(_DELTA_FILENAME, shard)}, sort=[("seq", 1)])]
+
+    def load_faiss_vectors(self, shard: Optional[str] = None) -> Optional[bytes]:
+        """Return the full-precision vectors saved with the index, if any
+        (a serialized numpy array; only stored for compressed indexes)."""
+        fs = self._get_faiss_gridfs()
+        vectors_file = fs.find_one({"filename": _filename(_VECTORS_FILENAME, shard)}, sort=[("uploadDate", -1)])
+        return vectors_file.read() if vectors_file is not None else None
+
+    def save_lexical_index(self, name: str, index_bytes: bytes) -> None:
+        fs = self._get_faiss_gridfs()
+        filename = _LEXICAL_FILENAME_PREFIX + name
+        for old_file in fs.find({"filename": filename}):
+            fs.delete(old_file._id)
+        fs.put(index_bytes, filename=filename)
+
+    def load_lexical_index(self, name: str) -> Optional[bytes]:
+        fs = self._get_faiss_gridfs()
+        index_file = fs.find_one({"filename": _LEXICAL_FILENAME_PREFIX + name}, sort=[("uploadDate", -1)])
+        return index_file.read() if index_file is not None else None
+
+    def get_lexical_index_upload_date(self, name: str) -> Optional[datetime]:
+        """Cheap freshness check of one lexical index: its uploadDate, no bytes downloaded."""
+        index_file = self._get_faiss_gridfs().find_one({"filename": _LEXICAL_FILENAME_PREFIX + name},
+                                                       sort=[("uploadDate", -1)])
+        return index_file.uploadDate if index_file is not None else None
+
+    def clear_faiss_index(self, shard: Optional[str] = None) -> None:
+        """Remove the persisted files of one shard, or (shard=None) every
+        FAISS index/metadata file in GridFS, shards included."""
+        fs = self._get_faiss_gridfs()
+        query = {"filename": {"$regex": f"^{re.escape(shard + _SHARD_SEPARATOR)}"}} if shard else {}
+        for grid_out in fs.find(query):
             fs.delete(grid_out._id)
 
-    def get_faiss_index_upload_date(self) -> Optional[datetime]:
+    def list_faiss_shards(self) -> List[str]:
+        """Names of the shards that have a persisted base index, sorted."""
+        fs = self._get_faiss_gridfs()
+        suffix = _SHARD_SEPARATOR + _FAISS_INDEX_FILENAME
+        filenames = fs.find({"filename": {"$regex": f"{re.escape(suffix)}$"}})
+        return sorted({grid_out.filename[:-len(suffix)] for grid_out in filenames})
+
+    def get_faiss_index_upload_date(self, shard: Optional[str] = None) -> Optional[datetime]:
         """Cheap freshness check: return just the uploadDate of the latest
-        persisted index file (no bytes downloaded), so callers can tell
+        persisted index file or delta segment (no bytes downloaded), so callers can tell
         whether an in-memory cache is stale without paying the cost of a
         full reload."""
-        fs = self._get_faiss_gridfs()
-        index_file = fs.find_one({"filename": _FAISS_INDEX_FILENAME}, sort=[("uploadDate", -1)])
-        return index_file.uploadDate if index_file is not None else None
+        return self._latest_faiss_upload_date(self._get_faiss_gridfs(), shard)
+
+    def get_latest_faiss_upload_date(self) -> Optional[datetime]:
+        """get_faiss_index_upload_date() over the combined index, every shard and
+        the lexical indexes: changes whenever any of them is saved or gets a
+        delta segment."""
+        pattern = (f"(^|{re.escape(_SHARD_SEPARATOR)})({_FAISS_INDEX_FILENAME}|{_DELTA_FILENAME})$"
+                   f"|^{re.escape(_LEXICAL_FILENAME_PREFIX)}")
+        latest = self._get_faiss_gridfs().find_one({"filename": {"$regex": pattern}}, sort=[("uploadDate", -1)])
+        return latest.uploadDate if latest is not None else None
+
+    @staticmethod
+    def _latest_faiss_upload_date(fs: gridfs.GridFS, shard: Optional[str] = None) -> Optional[datetime]:
+        # Newest of the base index and its delta segments: appending a delta
+        # must count as "the index changed" for freshness checks.
+        filenames = [_filename(_FAISS_INDEX_FILENAME, shard), _filename(_DELTA_FILENAME, shard)]
+        latest = fs.find_one({"filename": {"$in": filenames}}, sort=[("uploadDate", -1)])
+        return latest.uploadDate if latest is not None else None
 
 
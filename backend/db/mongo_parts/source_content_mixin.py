@@ -1,10 +1,18 @@
 import re
-from typing import Any, Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional
+
+from pymongo import ASCENDING, UpdateOne
 
 from backend.db.Collections import Collection, CollectionObjs
+from backend.db.DBConstants import DBFields, DBOperators, SrcContentProjections
 from backend.db.data_names.Books import Book
+from backend.models_db.SourceClasses.SourceClass import SourceClass
 from backend.models_db.SourceClasses.SourceContent import SourceContent
 
+# Documents per cursor round trip when streaming (a passage is a few KB of HTML).
+CURSOR_BATCH_SIZE = 256
+
 
 class SourceContentMongoMixin:
     client: Any
@@ -27,6 +35,44 @@ class SourceContentMongoMixin:
             content=db_object["content"],
         )
 
+    def find_source_contents(self, keys: List[str]) -> List[SourceContent]:
+        """Bulk find_one_source_content: one $in query per collection (the
+        collections queried concurrently), so the number of round trips
+        doesn't grow with len(keys). Returns the contents in the order of keys."""
+        if not self.client:
+            raise Exception("Database connection is not established.")
+
+        keys_by_col: Dict[str, List[str]] = {}
+        for key in dict.fromkeys(keys):
+            col_code = SourceClass.get_collection_name_from_key(key)
+            if not col_code:
+                raise KeyError(key)
+            keys_by_col.setdefault(col_code, []).append(key)
+        if not keys_by_col:
+            return []
+
+        found: Dict[str, SourceContent] = {}
+        with ThreadPoolExecutor(max_workers=len(keys_by_col)) as executor:
+            futures = [
+                executor.submit(self._find_source_contents_by_col, CollectionObjs.get_col_obj_from_str(col_code), col_keys)
+                for col_code, col_keys in keys_by_col.items()
+            ]
+            for future in futures:
+                found.update(future.result())
+
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        if missing:
+            raise Exception(f"Documents with keys {missing} not found.")
+        return [found[key] for key in keys]
+
+    def _find_source_contents_by_col(self, collection: Collection, keys: List[str]) -> Dict[str, SourceContent]:
+        docs = self.get_collection(collection).find(
+            {DBFields.KEY: {DBOperators.IN: keys}},
+            SrcContentProjections.FULL,
+            batch_size=len(keys),  # the whole answer in one round trip
+        )
+        return {doc[DBFields.KEY]: SourceContent(key=doc[DBFields.KEY], content=doc[DBFields.CONTENT]) for doc in docs}
+
     def get_all_src_contents_of_collection(self, collection: Collection) -> List[SourceContent]:
         """Get all SourceContent documents from a given collection."""
         if not self.client:
@@ -41,6 +87,22 @@ class SourceContentMongoMixin:
             for doc in docs
         ]
 
+    def iter_src_contents_of_collection(self, collection: Collection, batch_size: int = CURSOR_BATCH_SIZE,
+                                        projection: Optional[Dict[str, Any]] = None) -> Iterator[SourceContent]:
+        """Like get_all_src_contents_of_collection, but yields documents as the
+        cursor streams them (batch_size per round trip) instead of materializing
+        the whole collection. projection defaults to SrcContentProjections.FULL."""
+        if not self.client:
+            raise Exception("Database connection is not established.")
+
+        docs = self.get_collection(collection).find(
+            {DBFields.KEY: {DBOperators.EXISTS: True}, DBFields.CONTENT: {DBOperators.EXISTS: True}},
+            projection or SrcContentProjections.FULL,
+            batch_size=batch_size,
+        )
+        for doc in docs:
+            yield SourceContent(key=doc[DBFields.KEY], content=doc[DBFields.CONTENT])
+
     def get_all_src_contents_by_book(self, book: Book) -> List[SourceContent]:
         """Get all SourceContent documents that belong to a specific book.
 
@@ -69,3 +131,59 @@ class SourceContentMongoMixin:
         ]
         results.sort()  # Uses SourceClass.__lt__ (book order, then section)
         return results
+
+    def iter_src_contents_by_book(self, book: Book, batch_size: int = CURSOR_BATCH_SIZE,
+                                  projection: Optional[Dict[str, Any]] = None) -> Iterator[SourceContent]:
+        """Streaming get_all_src_contents_by_book: same order, constant memory.
+
+        Every source of a book shares the prefix SourceClass.book_sort_key_prefix(book)
+        of its stored sort key, so the book is one range scan over the sort-key
+        index, already in canonical order - nothing is sorted in memory.
+        Only sees documents that have DBFields.SORT_KEY (set on insert; older
+        collections need backfill_src_content_sort_keys once).
+        """
+        if not self.client:
+            raise Exception("Database connection is not established.")
+
+        collection = CollectionObjs.get_col_obj_from_str(book.source_type.name)
+        if collection is None:
+            raise Exception(f"No collection found for source type '{book.source_type.name}'.")
+
+        prefix = SourceClass.book_sort_key_prefix(book)
+        query = {
+            # '/' is the character right after the '.' separator, so this is exactly "starts with prefix"
+            DBFields.SORT_KEY: {DBOperators.GTE: prefix, DBOperators.LT: prefix[:-1] + "/"},
+            DBFields.CONTENT: {DBOperators.EXISTS: True},
+        }
+        docs = self.get_collection(collection).find(
+            query,
+            projection or SrcContentProjections.FULL,
+            sort=[(DBFields.SORT_KEY, ASCENDING)],
+            batch_size=batch_size,
+        )
+        for doc in docs:
+            yield SourceContent(key=doc[DBFields.KEY], content=doc[DBFields.CONTENT])
+
+    def backfill_src_content_sort_keys(self, collection: Collection, batch_size: int = 1000) -> int:
+        """Set DBFields.SORT_KEY on every document of collection that lacks it.
+        Returns the number of documents updated."""
+        if not self.client:
+            raise Exception("Database connection is not established.")
+
+        col = self.get_collection(collection)
+        docs = col.find(
+            {DBFields.KEY: {DBOperators.EXISTS: True}, DBFields.SORT_KEY: {DBOperators.EXISTS: False}},
+            {DBFields.KEY: 1},
+            batch_size=batch_size,
+        )
+        updated = 0
+        operations = []
+        for doc in docs:
+            sort_key = SourceContent(key=doc[DBFields.KEY], content=[]).stored_sort_key()
+            operations.append(UpdateOne({"_id": doc["_id"]}, {DBOperators.SET: {DBFields.SORT_KEY: sort_key}}))
+            if len(operations) >= batch_size:
+                updated += col.bulk_write(operations).modified_count
+                operations = []
+        if operations:
+            updated += col.bulk_write(operations).modified_count
+        return updated
@@ -1,12 +1,17 @@
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
 
 from backend.db.Collections import CollectionObjs
-from backend.db.DBConstants import DBFields, DBOperators
-from backend.models_db.Enums import PassageType
+from backend.db.DBConstants import DBFields, DBOperators, SrcMetadataProjections
+from backend.models_db.Enums import PassageType, SourceType
 from backend.models_db.SourceClasses.SourceMetadata import SourceMetadata
 
 
 class SourceMetadataMongoMixin:
+    # Canonical source order; key breaks ties between equal sort keys so page boundaries are stable.
+    PAGE_SORT = [(DBFields.SORT_KEY, ASCENDING), (DBFields.KEY, ASCENDING)]
+
     def get_collection(self, collection):
         raise NotImplementedError
 
@@ -15,11 +20,15 @@ class SourceMetadataMongoMixin:
 
     def insert_source_metadata(self, src_metadata: SourceMetadata) -> str:
         data = self._src_metadata_to_doc(src_metadata)
+        data[DBFields.WRITE_VERSION] = self._bump_src_metadata_version()
         result = self.get_collection(CollectionObjs.SRC_METADATA).insert_one(data)
         return str(result.inserted_id)
 
     def update_source_metadata(self, src_metadata: SourceMetadata) -> int:
+        if not src_metadata.hydrated:
+            raise ValueError(f"Cannot update un-hydrated SourceMetadata {src_metadata.key!r}; hydrate it first")
         data = self._src_metadata_to_doc(src_metadata)
+        data[DBFields.WRITE_VERSION] = self._bump_src_metadata_version()
         key = data.pop(DBFields.KEY)
         result = self.get_collection(CollectionObjs.SRC_METADATA).update_one(
             {DBFields.KEY: key},
@@ -27,6 +36,35 @@ class SourceMetadataMongoMixin:
         )
         return result.modified_count
 
+    def get_src_metadata_version(self) -> int:
+        """
+        Counter bumped on every SourceMetadata insert/update (0 if never), so
+        caches of search results can tell they are stale with one tiny read.
+        """
+        doc = self.get_collection(CollectionObjs.VERSIONS).find_one({DBFields.KEY: CollectionObjs.SRC_METADATA.name})
+        return doc[DBFields.VERSION] if doc is not None else 0
+
+    def get_src_metadata_structure(self, min_write_version: Optional[int] = None,
+                                   batch_size: int = 5000) -> Iterator[Dict[str, Any]]:
+        """
+        The structural fields (SrcMetadataProjections.STRUCTURAL) of every
+        SourceMetadata document, in one streamed scan; with min_write_version,
+        only of those inserted/updated since the version counter reached it.
+        """
+        query = {DBFields.WRITE_VERSION: {DBOperators.GTE: min_write_version}} if min_write_version is not None else {}
+        return iter(self.get_collection(CollectionObjs.SRC_METADATA).find(
+            query, SrcMetadataProjections.STRUCTURAL, batch_size=batch_size))
+
+    def _bump_src_metadata_version(self) -> int:
+        """Atomically increment the version counter; the value it reached, unique to this write."""
+        doc = self.get_collection(CollectionObjs.VERSIONS).find_one_and_update(
+            {DBFields.KEY: CollectionObjs.SRC_METADATA.name},
+            {DBOperators.INC: {DBFields.VERSION: 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return doc[DBFields.VERSION]
+
     def get_source_metadata_by_key(self, key: str) -> Optional[SourceMetadata]:
         doc = self.get_collection(CollectionObjs.SRC_METADATA).find_one({DBFields.KEY: key})
         if doc is None:
@@ -64,13 +102,124 @@ class SourceMetadataMongoMixin:
         passage_types: Optional[List[PassageType]] = None,
         entity_ids: Optional[List[str]] = None,
         rel_ids: Optional[List[str]] = None,
+        src_types: Optional[List[SourceType]] = None,
+        books: Optional[List[str]] = None,
+        slim: bool = False,
     ) -> List[SourceMetadata]:
         """
         Fetch every SourceMetadata document matching the given filters in a
         single query. Each dimension is OR'd internally (matching any one of
         its selected values is enough) while the dimensions themselves are
         AND'd together. A dimension left empty/None is not filtered on at all.
+
+        slim=True reads only keys and sort info (SrcMetadataProjections.SLIM)
+        and returns un-hydrated SourceMetadata: for broad filters whose results
+        are mostly never shown. Hydrate the ones that are with hydrate_source_metadata.
+        """
+        query = self._src_metadata_filter(passage_types, entity_ids, rel_ids, src_types, books)
+        if slim:
+            docs = self.get_collection(CollectionObjs.SRC_METADATA).find(query, SrcMetadataProjections.SLIM)
+            return [SourceMetadata(doc[DBFields.KEY], hydrated=False) for doc in docs]
+        docs = self.get_collection(CollectionObjs.SRC_METADATA).find(query)
+        return [self._doc_to_src_metadata(doc) for doc in docs]
+
+    def get_source_metadata_keys_filtered(
+        self,
+        passage_types: Optional[List[PassageType]] = None,
+        entity_ids: Optional[List[str]] = None,
+        rel_ids: Optional[List[str]] = None,
+        src_types: Optional[List[SourceType]] = None,
+        books: Optional[List[str]] = None,
+    ) -> List[str]:
+        """Keys only of get_source_metadata_filtered: nothing else is sent or deserialized."""
+        query = self._src_metadata_filter(passage_types, entity_ids, rel_ids, src_types, books)
+        docs = self.get_collection(CollectionObjs.SRC_METADATA).find(query, {DBFields.KEY: 1, "_id": 0})
+        return [doc[DBFields.KEY] for doc in docs]
+
+    def get_source_metadata_page(
+        self,
+        passage_types: Optional[List[PassageType]] = None,
+        entity_ids: Optional[List[str]] = None,
+        rel_ids: Optional[List[str]] = None,
+        src_types: Optional[List[SourceType]] = None,
+        books: Optional[List[str]] = None,
+        offset: int = 0,
+        limit: int = 0,
+    ) -> Tuple[List[SourceMetadata], int]:
+        """
+        One page of the get_source_metadata_filtered results in canonical
+        order, sorted and cut by the db on the stored sort key, plus how many
+        match in total. limit=0 means no limit.
+        """
+        collection = self.get_collection(CollectionObjs.SRC_METADATA)
+        query = self._src_metadata_filter(passage_types, entity_ids, rel_ids, src_types, books)
+        docs = collection.find(query, sort=self.PAGE_SORT, skip=offset, limit=limit)
+        return [self._doc_to_src_metadata(doc) for doc in docs], collection.count_documents(query)
+
+    def get_source_metadata_by_keys(self, keys: List[str]) -> List[SourceMetadata]:
+        """The SourceMetadata of the given keys in one query, in the order of keys (missing ones left out)."""
+        by_key = self._find_src_metadata_docs(keys)
+        return [self._doc_to_src_metadata(by_key[key]) for key in keys if key in by_key]
+
+    def hydrate_source_metadata(self, src_metadata_lst: List[SourceMetadata]) -> List[SourceMetadata]:
+        """
+        Fill in, in place and with one query, the fields of every un-hydrated
+        SourceMetadata in the list. Returns the list without those whose
+        document no longer exists.
         """
+        by_key = self._find_src_metadata_docs([sm.key for sm in src_metadata_lst if not sm.hydrated])
+        hydrated = []
+        for sm in src_metadata_lst:
+            if not sm.hydrated:
+                doc = by_key.get(sm.key)
+                if doc is None:
+                    continue
+                self._fill_src_metadata(sm, doc)
+            hydrated.append(sm)
+        return hydrated
+
+    def _find_src_metadata_docs(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        if not keys:
+            return {}
+        docs = self.get_collection(CollectionObjs.SRC_METADATA).find({DBFields.KEY: {DBOperators.IN: list(keys)}})
+        return {doc[DBFields.KEY]: doc for doc in docs}
+
+    def backfill_src_metadata_type_fields(self, batch_size: int = 1000) -> int:
+        """Set DBFields.SOURCE_TYPE and DBFields.BOOK (derived from the key) on every
+        SourceMetadata document that lacks either. Returns the number of documents updated."""
+        col = self.get_collection(CollectionObjs.SRC_METADATA)
+        docs = col.find(
+            {DBOperators.OR: [{DBFields.SOURCE_TYPE: {DBOperators.EXISTS: False}},
+                              {DBFields.BOOK: {DBOperators.EXISTS: False}}]},
+            {DBFields.KEY: 1},
+            batch_size=batch_size,
+        )
+        updated = 0
+        operations = []
+        for doc in docs:
+            src_metadata = SourceMetadata(doc[DBFields.KEY])
+            fields = {
+                DBFields.SOURCE_TYPE: src_metadata.source_type.value,
+                DBFields.BOOK: SourceMetadata.get_book_name_from_key(src_metadata.key),
+            }
+            operations.append(UpdateOne({"_id": doc["_id"]}, {DBOperators.SET: fields}))
+            if len(operations) >= batch_size:
+                updated += col.bulk_write(operations).modified_count
+                operations = []
+        if operations:
+            updated += col.bulk_write(operations).modified_count
+        if updated:
+            self._bump_src_metadata_version()
+        return updated
+
+    @staticmethod
+    def _src_metadata_filter(
+        passage_types: Optional[List[PassageType]],
+        entity_ids: Optional[List[str]],
+        rel_ids: Optional[List[str]],
+        src_types: Optional[List[SourceType]],
+        books: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
         conditions: List[Dict[str, Any]] = []
 
         if passage_types:
@@ -79,15 +228,20 @@ class SourceMetadataMongoMixin:
             conditions.append({DBFields.ENTITY_KEYS: {DBOperators.IN: list(entity_ids)}})
         if rel_ids:
             conditions.append({DBFields.REL_KEYS: {DBOperators.IN: list(rel_ids)}})
+        # Stored fields (see backfill_src_metadata_type_fields), each leading a compound index with passage_types.
+        if src_types:
+            conditions.append({DBFields.SOURCE_TYPE: {DBOperators.IN: [src_type.value for src_type in src_types]}})
+        if books:
+            conditions.append({DBFields.BOOK: {DBOperators.IN: list(books)}})
 
-        query: Dict[str, Any] = {DBOperators.AND: conditions} if conditions else {}
-        docs = self.get_collection(CollectionObjs.SRC_METADATA).find(query)
-        return [self._doc_to_src_metadata(doc) for doc in docs]
+        return {DBOperators.AND: conditions} if conditions else {}
 
     def _src_metadata_to_doc(self, src_metadata: SourceMetadata) -> Dict[str, Any]:
         return {
             DBFields.KEY: src_metadata.key,
+            DBFields.SORT_KEY: src_metadata.stored_sort_key(),
             DBFields.SOURCE_TYPE: src_metadata.source_type.value,
+            DBFields.BOOK: SourceMetadata.get_book_name_from_key(src_metadata.key),
             DBFields.SUMMARY_EN: src_metadata.summary_en,
             DBFields.SUMMARY_HEB: src_metadata.summary_heb,
             DBFields.PASSAGE_TYPES: [pt.value for pt in src_metadata.passage_types],
@@ -98,11 +252,16 @@ class SourceMetadataMongoMixin:
     def _doc_to_src_metadata(self, doc: Dict[str, Any]) -> SourceMetadata:
 
         sm = SourceMetadata(doc.get(DBFields.KEY))
+        self._fill_src_metadata(sm, doc)
+        return sm
+
+    @staticmethod
+    def _fill_src_metadata(sm: SourceMetadata, doc: Dict[str, Any]) -> None:
         sm.summary_en = doc.get(DBFields.SUMMARY_EN)
         sm.summary_heb = doc.get(DBFields.SUMMARY_HEB)
         sm.passage_types = [PassageType(pt) for pt in doc.get(DBFields.PASSAGE_TYPES, [])]
         sm.entity_keys = set(doc.get(DBFields.ENTITY_KEYS, []))
         sm.rel_keys = set(doc.get(DBFields.REL_KEYS, []))
-        return sm
+        sm.hydrated = True
 
 
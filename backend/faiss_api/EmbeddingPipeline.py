@@ -0,0 +1,124 @@
+# bs"d - lehagdil torah velahadir
+"""
+Multi-process embedding for bulk (re)population of the FAISS index.
+
+Three stages, so a CPU-only box uses every core and nothing holds the whole
+corpus in memory:
+  1. reader  - the caller's iterator of (key, raw English HTML), typically a
+               streaming Mongo cursor; consumed lazily, already-indexed keys
+               are skipped here.
+  2. workers - a process pool; each worker loads its own SentenceTransformer
+               once, then cleans, chunks and encodes whole batches.
+  3. writer  - this process, via FaissEngine.populate_encoded(): the only one
+               touching the index, adding batches in input order and
+               checkpointing as usual.
+
+At most max_in_flight batches are queued or being encoded at a time, so the
+reader never runs far ahead of the encoders.
+"""
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from backend.common.miscFuncs import clean_en_text_from_html_tags
+from backend.faiss_api.FaissEngine import EncodedBatch, FaissEngine
+from backend.faiss_api.PassageChunker import split_passages
+
+# Per-worker-process state, set once by _init_worker.
+_worker_model = None
+_worker_chunking: Tuple[Optional[int], int] = (None, 0)
+
+
+def _init_worker(model_name: str, chunk_words: Optional[int], overlap_words: int, torch_threads: int) -> None:
+    global _worker_model, _worker_chunking
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    # N workers x all-cores torch threads would just thrash; split the cores instead.
+    torch.set_num_threads(torch_threads)
+    _worker_model = SentenceTransformer(model_name, device="cpu")
+    _worker_chunking = (chunk_words, overlap_words)
+
+
+def _encode_batch(batch: List[Tuple[str, str]]) -> EncodedBatch:
+    """Worker side: clean the raw HTML, chunk if configured, and embed."""
+    keys = [key for key, _ in batch]
+    texts = [clean_en_text_from_html_tags(html) for _, html in batch]
+    texts, chunk_counts = split_passages(texts, *_worker_chunking)
+    embeddings = _worker_model.encode(texts, convert_to_numpy=True, show_progress_bar=False,
+                                      batch_size=len(texts))
+    return keys, np.asarray(embeddings, dtype="float32"), chunk_counts
+
+
+class EmbeddingPipeline:
+
+    def __init__(self, engine: FaissEngine, workers: Optional[int] = None, batch_size: int = 128,
+                 max_in_flight: Optional[int] = None):
+        """
+        :param engine: The FaissEngine to write into (its model name and
+                       chunking settings are used by the workers).
+        :param workers: Worker processes (default: one per core).
+        :param batch_size: Passages per task sent to a worker.
+        :param max_in_flight: Batches queued/encoding at once (default: 2 per worker).
+        """
+        self.engine = engine
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight or 2 * self.workers
+
+    def run(self, sources: Iterable[Tuple[str, str]], total: Optional[int] = None,
+            checkpoint_every: int = 1000, train_sample_size: int = 20000) -> None:
+        """
+        Embed and index every (key, raw English HTML) pair from sources that
+        isn't indexed yet.
+
+        :param total: Expected number of passages (progress/ETA only).
+        """
+        self.engine.populate_encoded(
+            self.encode(sources),
+            total=total,
+            checkpoint_every=checkpoint_every,
+            train_sample_size=train_sample_size,
+        )
+
+    def encode(self, sources: Iterable[Tuple[str, str]]) -> Iterator[EncodedBatch]:
+        """Yield encoded batches in input order while workers encode the next ones."""
+        torch_threads = max(1, (os.cpu_count() or 1) // self.workers)
+        # spawn, not fork: forking a process that already imported torch can deadlock.
+        context = multiprocessing.get_context("spawn")
+        chunking = (self.engine.chunk_words, self.engine.CHUNK_OVERLAP_WORDS)
+
+        print(f"[EmbeddingPipeline] Encoding with {self.workers} worker processes "
+              f"({torch_threads} torch threads each), batches of {self.batch_size}.")
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(self.engine.model_name, *chunking, torch_threads)) as pool:
+            in_flight = deque()
+            for batch in self._batches(sources):
+                in_flight.append(pool.submit(_encode_batch, batch))
+                if len(in_flight) >= self.max_in_flight:
+                    yield in_flight.popleft().result()
+            while in_flight:
+                yield in_flight.popleft().result()
+
+    def _batches(self, sources: Iterable[Tuple[str, str]]) -> Iterator[List[Tuple[str, str]]]:
+        _ = self.engine.index  # make sure the persisted keys are loaded before diffing against them
+        seen = set(self.engine.metadata)
+        skipped = 0
+        batch: List[Tuple[str, str]] = []
+        for key, html in sources:
+            if key in seen:
+                skipped += 1
+                continue
+            seen.add(key)
+            batch.append((key, html))
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+        if skipped:
+            print(f"[EmbeddingPipeline] Skipped {skipped} already-indexed passages.")
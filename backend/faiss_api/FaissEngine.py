@@ -1,30 +1,109 @@
 
 
 import faiss
+import io
+import itertools
+import os
 import pickle
+import threading
 import time
+from array import array
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
 
-from sentence_transformers import SentenceTransformer
 import numpy as np
 
+from backend.common import Paths
 from backend.db.Collections import CollectionObjs
+from backend.faiss_api.FaissIndexFactory import FaissIndexFactory, FaissIndexType
+from backend.faiss_api.PassageChunker import ChunkAggregation, aggregate_chunk_scores, split_passages
+from backend.faiss_api.QueryEmbeddingCache import QueryEmbeddingCache
+from backend.faiss_api.QueryEncoder import OnnxQueryEncoder, QueryEncoderBackend
+from backend.models_db.Enums import SourceType
+from backend.models_db.SourceClasses.SourceClass import SourceClass
+
+# Flat indexes only support memory-mapping their vector storage through
+# IO_FLAG_MMAP_IFC (newer faiss builds); older builds fall back to IO_FLAG_MMAP.
+_MMAP_READ_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+_CACHE_INDEX_SUFFIX = ".faiss"
+_CACHE_METADATA_SUFFIX = ".meta.pkl"
+_CACHE_VECTORS_SUFFIX = ".vectors.npy"
+
+# (passage key, score) - one search result; score is the cosine similarity to the query
+# (summed over the best chunks for a SUM_TOP_N chunked index).
+SearchHit = Tuple[str, float]
+
+# (passage keys, their embeddings, chunks per passage or None) - one unit of bulk ingestion.
+EncodedBatch = Tuple[List[str], np.ndarray, Optional[np.ndarray]]
+
+# Everything a (re)load replaces. The background refresher loads into a
+# throwaway instance and then copies exactly these over in one locked step.
+_SNAPSHOT_FIELDS = (
+    "_index", "metadata", "_loaded_at", "_mmap_path", "index_type",
+    "store_exact_vectors", "_exact_chunks", "_persisted_count", "_pending_delta",
+    "chunk_words", "_chunk_owner", "_persisted_key_count", "_base_count",
+)
 
 
 class FaissEngine:
     _instance = None
 
+    # With exact vectors stored, a compressed index fetches this many times
+    # top_k candidates and re-ranks them by their full-precision distance.
+    RERANK_FACTOR = 4
+    # Chunked (multi-vector) indexes: words shared by consecutive windows, and
+    # how many times top_k chunks a search fetches before folding them into passages.
+    CHUNK_OVERLAP_WORDS = 32
+    CHUNK_OVERFETCH = 4
+    # search_within_many scores this many queries per matrix product, bounding
+    # its (queries x candidates) distance block.
+    QUERY_BLOCK = 64
+    # add_documents folds the delta segments back into the base (compact())
+    # once there are this many of them, or once they hold this fraction of
+    # the base's rows: every cold load has to merge them all.
+    MAX_DELTA_SEGMENTS = 32
+    MAX_DELTA_FRACTION = 0.25
+
     def __new__(cls, *args, **kwargs):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
         return cls._instance
 
-    def __init__(self, dbapi, model_name="all-MiniLM-L6-v2", dim=384):
+    def __init__(self, dbapi, model_name="all-MiniLM-L6-v2", dim=384,
+                 cache_dir: Optional[str] = Paths.FAISS_CACHE_DIR,
+                 index_type: FaissIndexType = FaissIndexType.FLAT,
+                 store_exact_vectors: bool = False,
+                 query_cache_size: int = 1024,
+                 refresh_interval_s: float = 30.0,
+                 chunk_words: Optional[int] = None,
+                 chunk_aggregation: ChunkAggregation = ChunkAggregation.MAX,
+                 chunk_top_n: int = 3,
+                 query_encoder: QueryEncoderBackend = QueryEncoderBackend.TORCH):
         """
         :param dbapi: An instance of DBapiMongoDB (must have dbs dict with FAISS db).
         :param model_name: SentenceTransformer model to use.
         :param dim: Dimensionality of the embedding vectors.
+        :param cache_dir: Local directory for the memory-mapped index cache,
+                          or None to always deserialize straight from GridFS.
+        :param index_type: Index type used when building a *new* index. A
+                           persisted index keeps the type it was built with.
+        :param store_exact_vectors: For a *new* compressed index (SQ8/PQ/IVF_PQ),
+                           also persist the float32 vectors so results can be
+                           re-ranked exactly. Fetched lazily, only on first use.
+        :param query_cache_size: How many query embeddings to keep in the LRU
+                           (0 disables it).
+        :param refresh_interval_s: How often a background thread polls Mongo for
+                           a newer index and swaps it in. 0 falls back to
+                           checking synchronously at the top of every search.
+        :param chunk_words: For a *new* index, embed each passage as overlapping
+                           windows of this many words instead of one vector
+                           (None = one vector per passage).
+        :param chunk_aggregation: How a chunked index folds chunk hits into a
+                           passage score: its best chunk, or the sum of its
+                           chunk_top_n best chunks.
+        :param query_encoder: What encodes search queries: the SentenceTransformer
+                           itself, or its ONNX Runtime export (fp32 or int8),
+                           see QueryEncoder. Indexing always uses the former.
         """
         # NOTE: FaissEngine is a singleton (one shared model/index per process),
         # but the dbapi passed in must always be refreshed. Previously this was
@@ -47,65 +126,404 @@ class FaissEngine:
 
         self.model_name = model_name
         self.dim = dim
+        self.index_type = index_type
+        self.store_exact_vectors = store_exact_vectors
+        # Full-precision vectors, as a list of row blocks (None = not loaded
+        # yet). Only used when store_exact_vectors is set.
+        self._exact_chunks: Optional[List[np.ndarray]] = None
         self._model = None
+        self.query_encoder_backend = query_encoder
+        self._onnx_encoder: Optional[OnnxQueryEncoder] = None
         self._index = None
         self.metadata = []
         # Mongo uploadDate of the index currently cached in self._index, used
         # to detect when a *different* process has repopulated the index so
         # this one can pick up the change without needing a restart.
         self._loaded_at: Optional[datetime] = None
+        # Local on-disk copy of the index, keyed by that same uploadDate. When
+        # set, self._index is a read-only mmap view of this file (shared via
+        # the OS page cache between every process on the machine).
+        self.cache_dir = cache_dir
+        self._mmap_path: Optional[str] = None
+        # key -> FAISS id lookup, rebuilt lazily whenever self.metadata is
+        # replaced or grows (see _key_to_id_map).
+        self._key_to_id: Dict[str, int] = {}
+        self._key_to_id_version = None
+        # Chunked indexes: the inverse of _chunk_owner, CSR-style (the chunks of
+        # passage p are _passage_chunks[_passage_chunk_offsets[p]:_passage_chunk_offsets[p+1]]),
+        # rebuilt lazily like the key map (see _chunk_ranges).
+        self._passage_chunks: Optional[np.ndarray] = None
+        self._passage_chunk_offsets: Optional[np.ndarray] = None
+        self._passage_chunks_version = None
+        # Combined index searched by src_types: every passage's SourceType (as
+        # its position in SourceType, -1 if none), rebuilt lazily like the key map.
+        self._passage_src_types: Optional[np.ndarray] = None
+        self._passage_src_types_version = None
+        # Encoding the query is the most expensive CPU step of a search, and
+        # the same strings come in over and over.
+        self._query_cache = QueryEmbeddingCache(max_size=query_cache_size)
+        # How many of the index's vectors are already persisted in Mongo (base
+        # + delta segments), and the embeddings added since then. Checkpoints
+        # only upload the latter, as a new delta segment.
+        self._persisted_count = 0
+        self._persisted_key_count = 0
+        self._pending_delta: List[np.ndarray] = []
+        self._base_count = 0  # vectors in the persisted base index; the rest are in delta segments
+        # Multi-vector mode: FAISS id -> index into self.metadata, one int32 per
+        # chunk (None = one vector per passage, FAISS id == metadata index).
+        self.chunk_words = chunk_words
+        self.chunk_aggregation = chunk_aggregation
+        self.chunk_top_n = chunk_top_n
+        self._chunk_owner: Optional[array] = array("i") if chunk_words else None
+        # Searches hold this while reading the index; a background refresh
+        # only holds it for the instant it takes to swap the new one in.
+        self._state_lock = threading.RLock()
+        self.refresh_interval_s = refresh_interval_s
+        self._refresher: Optional[threading.Thread] = None
+        self._stop_refresher = threading.Event()
+        # Per-SourceType shards (see get_shard). This engine is either the
+        # combined index (shard=None, the singleton) or one shard of it.
+        self.shard: Optional[str] = None
+        self._shard_parent: Optional["FaissEngine"] = None
+        self._shards: Dict[SourceType, "FaissEngine"] = {}
+        self._persisted_shards: Optional[List[SourceType]] = None  # None = not listed yet
 
 
     @property
     def model(self):
+        if self._shard_parent is not None:
+            return self._shard_parent.model  # one model per process, shared by every shard
         if self._model is None:
+            # Imported here: torch takes seconds to import, and a process
+            # serving queries through ONNX never needs it.
+            from sentence_transformers import SentenceTransformer
             self._model = SentenceTransformer(self.model_name)
         return self._model
 
+    @property
+    def query_encoder(self):
+        """The model that embeds search queries (see the query_encoder param)."""
+        if self._shard_parent is not None:
+            return self._shard_parent.query_encoder
+        if self.query_encoder_backend == QueryEncoderBackend.TORCH:
+            return self.model
+        if self._onnx_encoder is None:
+            try:
+                self._onnx_encoder = OnnxQueryEncoder.load(
+                    self.model_name, quantized=self.query_encoder_backend == QueryEncoderBackend.ONNX_INT8)
+            except ImportError as e:
+                # onnxruntime/tokenizers are optional; without them, keep searching with the torch model.
+                print(f"[FaissEngine] {self.query_encoder_backend.value} query encoder unavailable ({e}); "
+                      f"using {QueryEncoderBackend.TORCH.value}.")
+                self.query_encoder_backend = QueryEncoderBackend.TORCH
+                return self.model
+        return self._onnx_encoder
+
     @property
     def index(self):
         if self._index is None:
-            if self._load_from_mongo():
-                pass
-            else:
-                self._index = faiss.IndexFlatL2(self.dim)
-                self.metadata = []
+            # Concurrent first searches load once: the loser of the race finds the index swapped in.
+            with self._state_lock:
+                if self._index is None:
+                    snapshot = self._load_snapshot()
+                    if snapshot is not None:
+                        self._swap_in(snapshot)
+                    else:
+                        self._start_empty()
         return self._index
 
+    @property
+    def loaded_at(self) -> Optional[datetime]:
+        """
+        uploadDate stamp of the index currently in memory (None if nothing
+        persisted was loaded). With shards, the newest stamp among the loaded
+        ones, so it still changes whenever any of them is reloaded.
+        """
+        stamps = [e._loaded_at for e in (self, *self._shards.values()) if e._loaded_at is not None]
+        return max(stamps) if stamps else None
+
     def _load_from_mongo(self) -> bool:
         """
-        Load and deserialize the FAISS index and metadata from the database via dbapi.
+        Load the FAISS index and metadata, preferring the local mmap cache
+        (when its uploadDate stamp still matches Mongo) and falling back to
+        downloading from the database via dbapi.
 
         Returns:
             bool: True if loading was successful, False otherwise.
         """
-        # Ask db API to load raw bytes from the db
-        data = self.dbapi.load_faiss_index()
+        if self.cache_dir and self._load_from_local_cache():
+            return True
+
+        # Ask db API to load raw bytes (plus their uploadDate) from the db
+        data = self.dbapi.load_faiss_index_with_upload_date(shard=self.shard)
         if not data:
             # No data found in db
             return False
 
-        index_bytes, metadata_bytes = data
-        index_np_array = np.frombuffer(index_bytes, dtype='uint8')
-        # # Deserialize the FAISS index bytes back into a FAISS index object
-        self._index = faiss.deserialize_index(index_np_array)
+        index_bytes, metadata_bytes, upload_date = data
+        deltas = self.dbapi.load_faiss_deltas(shard=self.shard)
+        vectors_bytes = None
+
+        if deltas:
+            # Fold the delta segments into the base in memory, then cache and
+            # serve the merged result just like a plain downloaded index.
+            self._merge_deltas(index_bytes, metadata_bytes, deltas)
+            index_bytes = faiss.serialize_index(self._index).tobytes()
+            metadata_bytes = pickle.dumps(self._persisted_metadata())
+            vectors_bytes = self._serialize_exact_vectors() if self.store_exact_vectors else None
+
+        # Write through to the local cache and serve from the mmap'd copy, so
+        # the downloaded bytes aren't also held as a private in-RAM index.
+        if self.cache_dir and self._write_local_cache(upload_date, index_bytes, metadata_bytes, vectors_bytes):
+            if self._open_local_cache(upload_date):
+                print(f"[FaissEngine] Loaded index from Mongo into local cache: {self._index.ntotal} vectors, "
+                      f"{len(self.metadata)} metadata keys, {len(deltas)} delta segments "
+                      f"(uploaded {self._loaded_at}).")
+                return True
 
-        # Deserialize the metadata bytes back into a Python list using pickle
-        self.metadata = pickle.loads(metadata_bytes)
+        if not deltas:
+            index_np_array = np.frombuffer(index_bytes, dtype='uint8')
+            # # Deserialize the FAISS index bytes back into a FAISS index object
+            self._index = faiss.deserialize_index(index_np_array)
+
+            # Deserialize the metadata bytes back into the key list (+ index type) using pickle
+            self._apply_persisted_metadata(pickle.loads(metadata_bytes))
+        self._mmap_path = None
+        self._mark_persisted()
 
         # Record what we just loaded is current as of Mongo's own timestamp
         # (not local wall-clock, so it's comparable across processes/machines).
+        self._loaded_at = upload_date
+
+        print(f"[FaissEngine] Loaded index from Mongo: {self._index.ntotal} vectors, "
+              f"{len(self.metadata)} metadata keys, {len(deltas)} delta segments (uploaded {self._loaded_at}).")
+
+        return True
+
+    def _merge_deltas(self, index_bytes: bytes, metadata_bytes: bytes, deltas: List[bytes]) -> None:
+        self._index = faiss.deserialize_index(np.frombuffer(index_bytes, dtype='uint8'))
+        self._mmap_path = None
+        self._loaded_at = None  # keeps exact-vector loading off the not-yet-written local cache
+        self._apply_persisted_metadata(pickle.loads(metadata_bytes))
+        if self.store_exact_vectors:
+            self._exact_vectors()  # base rows first, so the delta rows line up behind them
+
+        for delta_bytes in deltas:
+            delta = pickle.loads(delta_bytes)
+            self._add_vectors(delta["vectors"], delta.get("chunk_owner"))
+            self.metadata.extend(delta["keys"])
+
+    ############################################ Local mmap cache ############################################
+
+    def _cache_prefix(self) -> str:
+        # Shards share the cache directory; each only ever prunes its own files.
+        return f"faiss_{self.shard}_index_" if self.shard else "faiss_index_"
+
+    @staticmethod
+    def _cache_stamp(upload_date: datetime) -> str:
+        return upload_date.strftime("%Y%m%dT%H%M%S%f")
+
+    def _cache_paths(self, upload_date: datetime):
+        base = os.path.join(self.cache_dir, f"{self._cache_prefix()}{self._cache_stamp(upload_date)}")
+        return base + _CACHE_INDEX_SUFFIX, base + _CACHE_METADATA_SUFFIX, base + _CACHE_VECTORS_SUFFIX
+
+    def _load_from_local_cache(self) -> bool:
+        """
+        Open the locally cached index if it was written for the same
+        uploadDate Mongo currently reports (metadata-only query, no bytes
+        downloaded). Returns False on a cache miss or a stale stamp.
+        """
         try:
-            self._loaded_at = self.dbapi.get_faiss_index_upload_date()
+            latest = self.dbapi.get_faiss_index_upload_date(shard=self.shard)
         except Exception as e:
             print(f"[FaissEngine] Could not read FAISS index upload date: {e}")
-            self._loaded_at = None
+            return False
 
-        print(f"[FaissEngine] Loaded index from Mongo: {self._index.ntotal} vectors, "
+        if latest is None:
+            return False
+
+        if not self._open_local_cache(latest):
+            return False
+
+        print(f"[FaissEngine] Loaded index from local cache: {self._index.ntotal} vectors, "
               f"{len(self.metadata)} metadata keys (uploaded {self._loaded_at}).")
+        return True
 
+    def _open_local_cache(self, upload_date: datetime) -> bool:
+        index_path, metadata_path, _ = self._cache_paths(upload_date)
+        if not (os.path.exists(index_path) and os.path.exists(metadata_path)):
+            return False
+
+        try:
+            index = faiss.read_index(index_path, _MMAP_READ_FLAGS)
+            with open(metadata_path, "rb") as f:
+                metadata = pickle.load(f)
+        except Exception as e:
+            print(f"[FaissEngine] Could not open local index cache {index_path}: {e}")
+            return False
+
+        self._index = index
+        self._apply_persisted_metadata(metadata)
+        self._loaded_at = upload_date
+        self._mmap_path = index_path
+        self._mark_persisted()
         return True
 
+    def _write_local_cache(self, upload_date: Optional[datetime], index_bytes: bytes, metadata_bytes: bytes,
+                           vectors_bytes: Optional[bytes] = None) -> bool:
+        """
+        Persist the serialized index/metadata (and exact vectors, if given)
+        under their uploadDate stamp and drop older stamps. Files are written
+        to a temp name and renamed, so a concurrent reader never sees a
+        half-written index.
+        """
+        if upload_date is None:
+            return False
+
+        index_path, metadata_path, vectors_path = self._cache_paths(upload_date)
+        files = [(metadata_path, metadata_bytes), (index_path, index_bytes)]
+        if vectors_bytes is not None:
+            files.insert(0, (vectors_path, vectors_bytes))
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            for path, payload in files:
+                self._write_cache_file(path, payload)
+        except OSError as e:
+            print(f"[FaissEngine] Could not write local index cache to {self.cache_dir}: {e}")
+            return False
+
+        self._prune_local_cache(keep_prefix=f"{self._cache_prefix()}{self._cache_stamp(upload_date)}")
+        return True
+
+    @staticmethod
+    def _write_cache_file(path: str, payload: bytes) -> None:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+    def _prune_local_cache(self, keep_prefix: str) -> None:
+        for name in os.listdir(self.cache_dir):
+            if not name.startswith(self._cache_prefix()) or name.startswith(keep_prefix):
+                continue
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                # Still mapped by another process (Windows); retry next time.
+                pass
+
+    def _ensure_writable_index(self) -> None:
+        """
+        mmap'd indexes are read-only views; adding to one aborts inside faiss.
+        Before any write, swap in a private in-memory copy of the same file.
+        """
+        _ = self.index  # trigger the lazy load first; it may hand back an mmap view
+        if self.store_exact_vectors:
+            self._exact_vectors()  # new rows get appended to the full set
+        if self._mmap_path is None:
+            return
+        self._index = faiss.read_index(self._mmap_path)
+        self._mmap_path = None
+
+    def _persisted_metadata(self) -> Dict:
+        return {
+            "keys": self.metadata,
+            "index_type": self.index_type.value,
+            "exact_vectors": self.store_exact_vectors,
+            "chunk_words": self.chunk_words,
+            "chunk_owner": self._chunk_owner,
+            "base_count": self._base_count,
+        }
+
+    def _apply_persisted_metadata(self, persisted) -> None:
+        # Indexes saved before the type was recorded pickled a bare key list.
+        if isinstance(persisted, list):
+            self.metadata = persisted
+            self.index_type = FaissIndexFactory.get_type(self._index)
+            self.store_exact_vectors = False
+            self.chunk_words, self._chunk_owner = None, None
+            self._base_count = self._index.ntotal
+        else:
+            self.metadata = persisted["keys"]
+            self.index_type = FaissIndexType(persisted["index_type"])
+            self.store_exact_vectors = persisted.get("exact_vectors", False)
+            self.chunk_words = persisted.get("chunk_words")
+            self._chunk_owner = persisted.get("chunk_owner")
+            # Saved before base_count was recorded: that index had no deltas merged in.
+            self._base_count = persisted.get("base_count", self._index.ntotal)
+        self._exact_chunks = None
+        self._key_to_id_version = None
+        self._passage_chunks_version = None
+        self._passage_src_types_version = None
+
+    ############################################ Exact vectors (re-ranking) ############################################
+
+    def _add_vectors(self, embeddings: np.ndarray, owners: Optional[np.ndarray] = None) -> None:
+        """Add embeddings (and, for a chunked index, the metadata index each chunk belongs to)."""
+        self.index.add(embeddings)
+        self._pending_delta.append(embeddings)
+        if self._chunk_owner is not None:
+            self._chunk_owner.frombytes(np.asarray(owners, dtype=np.int32).tobytes())
+        if self.store_exact_vectors:
+            self._exact_chunks.append(np.asarray(embeddings, dtype="float32"))
+
+    def _exact_vectors(self) -> Optional[np.ndarray]:
+        """
+        Full-precision vectors in FAISS id order, or None if this index
+        doesn't keep them. Loaded lazily (local cache first, then GridFS).
+        """
+        if not self.store_exact_vectors:
+            return None
+        if self._exact_chunks is None:
+            self._exact_chunks = self._load_exact_vectors()
+            if self._exact_chunks is None:
+                return None
+        if not self._exact_chunks:
+            return np.empty((0, self.dim), dtype="float32")
+        if len(self._exact_chunks) > 1:
+            self._exact_chunks = [np.vstack(self._exact_chunks)]
+        return self._exact_chunks[0]
+
+    def _load_exact_vectors(self) -> Optional[List[np.ndarray]]:
+        vectors_path = self._cache_paths(self._loaded_at)[2] if self.cache_dir and self._loaded_at else None
+
+        if vectors_path is None or not os.path.exists(vectors_path):
+            vectors_bytes = self.dbapi.load_faiss_vectors(shard=self.shard)
+            if vectors_bytes is None:
+                print("[FaissEngine] Index expects exact vectors but none are persisted; re-ranking disabled.")
+                self.store_exact_vectors = False
+                return None
+            if vectors_path is not None:
+                try:
+                    self._write_cache_file(vectors_path, vectors_bytes)
+                except OSError as e:
+                    print(f"[FaissEngine] Could not cache exact vectors locally: {e}")
+                    vectors_path = None
+
+        # mmap'd from the local cache when possible, so only touched rows are paged in.
+        if vectors_path is not None and os.path.exists(vectors_path):
+            vectors = np.load(vectors_path, mmap_mode="r")
+        else:
+            vectors = np.load(io.BytesIO(vectors_bytes))
+
+        if len(vectors) != self.index.ntotal:
+            print(f"[FaissEngine] Exact vectors ({len(vectors)}) do not match index size "
+                  f"({self.index.ntotal}); re-ranking disabled.")
+            self.store_exact_vectors = False
+            return None
+        return [vectors]
+
+    def _serialize_exact_vectors(self) -> Optional[bytes]:
+        vectors = self._exact_vectors()
+        if vectors is None:
+            return None
+        buffer = io.BytesIO()
+        np.save(buffer, np.ascontiguousarray(vectors))
+        return buffer.getvalue()
+
+    def _can_rerank(self) -> bool:
+        return self.store_exact_vectors and FaissIndexFactory.is_compressed(self.index_type)
+
     def refresh(self) -> bool:
         """
         Force-reload the FAISS index/metadata from Mongo, discarding whatever
@@ -116,26 +534,43 @@ class FaissEngine:
         Mongo has nothing persisted (in which case a fresh empty index is
         used, same as on first access).
         """
-        self._index = None
+        snapshot = self._load_snapshot()
+        with self._state_lock:
+            if snapshot is not None:
+                self._swap_in(snapshot)
+                return True
+            self._start_empty()
+            return False
+
+    def _start_empty(self) -> None:
+        """Nothing persisted: use a fresh empty index."""
+        # caller holds self._state_lock
+        self._index = FaissIndexFactory.create(self.index_type, self.dim)
         self.metadata = []
         self._loaded_at = None
-        if self._load_from_mongo():
-            return True
-        self._index = faiss.IndexFlatL2(self.dim)
-        return False
+        self._mmap_path = None
+        self._exact_chunks = []
+        self._chunk_owner = array("i") if self.chunk_words else None
+        self._base_count = 0
+        self._key_to_id_version = None
+        self._passage_chunks_version = None
+        self._passage_src_types_version = None
+        self._mark_persisted()
 
     def _refresh_if_stale(self) -> None:
         """
         Cheaply check Mongo for a newer persisted index than what's cached in
-        memory (metadata-only query, no bytes downloaded) and reload if so.
+        memory (metadata-only query, no bytes downloaded) and, if so, load it
+        on the side and swap it in atomically.
 
         This is what lets a long-running process (e.g. a Streamlit server
         that never restarts between reruns, or one instantiated before data
         was populated) automatically pick up newly-populated data instead of
-        silently returning zero results forever.
+        silently returning zero results forever. Normally it runs on the
+        background refresher thread, not inside a search.
         """
         try:
-            latest = self.dbapi.get_faiss_index_upload_date()
+            latest = self.dbapi.get_faiss_index_upload_date(shard=self.shard)
         except Exception as e:
             print(f"[FaissEngine] Could not check FAISS index freshness: {e}")
             return
@@ -144,9 +579,143 @@ class FaissEngine:
             return  # nothing persisted in Mongo yet; keep whatever is in memory
 
         if self._index is None or self._loaded_at is None or latest > self._loaded_at:
+            if self._pending_delta:
+                return  # this process is mid-population; never drop its unsaved rows
             print(f"[FaissEngine] Newer FAISS index detected in Mongo "
                   f"(uploaded {latest}, last loaded {self._loaded_at}); reloading.")
-            self._load_from_mongo()
+            snapshot = self._load_snapshot()
+            if snapshot is not None:
+                with self._state_lock:
+                    self._swap_in(snapshot)
+
+    def _load_snapshot(self) -> Optional["FaissEngine"]:
+        """Load the persisted index into a detached copy of this engine, leaving self untouched."""
+        snapshot = object.__new__(FaissEngine)
+        snapshot.__dict__.update(self.__dict__)  # config, dbapi, model, caches
+        snapshot._index = None
+        snapshot.metadata = []
+        snapshot._loaded_at = None
+        snapshot._mmap_path = None
+        snapshot._exact_chunks = None
+        snapshot._pending_delta = []  # merging deltas appends here; don't share self's list
+        return snapshot if snapshot._load_from_mongo() else None
+
+    def _swap_in(self, snapshot: "FaissEngine") -> None:
+        for field_name in _SNAPSHOT_FIELDS:
+            setattr(self, field_name, getattr(snapshot, field_name))
+        self._key_to_id_version = None
+        self._passage_chunks_version = None
+        self._passage_src_types_version = None
+
+    ############################################ Background refresher ############################################
+
+    def _ensure_background_refresh(self) -> None:
+        """Start (once per process) the thread that keeps the index fresh off the request path."""
+        if not self.refresh_interval_s or (self._refresher is not None and self._refresher.is_alive()):
+            return
+        with self._state_lock:
+            if self._refresher is not None and self._refresher.is_alive():
+                return
+            self._stop_refresher.clear()
+            self._refresher = threading.Thread(
+                target=self._refresh_loop, name="FaissEngine-refresher", daemon=True,
+            )
+            self._refresher.start()
+
+    def _refresh_loop(self) -> None:
+        while not self._stop_refresher.wait(self.refresh_interval_s):
+            try:
+                if self.shard is None:
+                    self._relist_shards()  # pick up shards populated by another process
+                if self._index is not None:  # sharded: the combined index is never loaded
+                    self._refresh_if_stale()
+            except Exception as e:
+                # Keep serving the current snapshot; try again next tick.
+                print(f"[FaissEngine] Background refresh failed: {e}")
+
+    def warm_up(self) -> None:
+        """
+        Load up front what the first search would otherwise load lazily: the
+        index (every persisted shard of it) and the query encoder's model.
+        Also starts the background refreshers (this engine's always: it keeps
+        the shard list current).
+        """
+        if self.shard is None:
+            self._ensure_background_refresh()
+        for engine in (self._shards_for(None) if self.shard is None else []) or [self]:
+            engine._keep_fresh()
+        self.query_encoder.encode(["warm up"], convert_to_numpy=True)  # not cached: not a real query
+
+    def stop_background_refresh(self) -> None:
+        for shard in self._shards.values():
+            shard.stop_background_refresh()
+        self._stop_refresher.set()
+        if self._refresher is not None:
+            self._refresher.join(timeout=5)
+        self._refresher = None
+
+    ############################################ Per-SourceType shards ############################################
+
+    def get_shard(self, src_type: SourceType) -> "FaissEngine":
+        """
+        The engine for one SourceType's own index, persisted separately
+        under that type's name. Created on first use; like this engine, it
+        only loads its index on first search. It starts with this engine's
+        settings for a new index and shares its model and query cache.
+        Populate a shard by calling populate_bulk / populate_encoded on it.
+        """
+        if self.shard is not None:
+            raise ValueError(f"[FaissEngine] {self.shard} is itself a shard.")
+        with self._state_lock:
+            if src_type not in self._shards:
+                shard = object.__new__(FaissEngine)
+                shard.__dict__.update(self.__dict__)  # config, dbapi, query cache
+                shard._index = None
+                shard.metadata = []
+                shard._loaded_at = None
+                shard._mmap_path = None
+                shard._exact_chunks = None
+                shard._chunk_owner = array("i") if self.chunk_words else None
+                shard._key_to_id, shard._key_to_id_version = {}, None
+                shard._passage_chunks_version = None
+                shard._passage_src_types_version = None
+                shard._pending_delta = []
+                shard._persisted_count = shard._persisted_key_count = shard._base_count = 0
+                shard._state_lock = threading.RLock()
+                shard._refresher, shard._stop_refresher = None, threading.Event()
+                shard.shard, shard._shard_parent, shard._shards = src_type.name, self, {}
+                self._shards[src_type] = shard
+            return self._shards[src_type]
+
+    def persisted_shards(self) -> List[SourceType]:
+        """
+        SourceTypes that have their own persisted index (empty: the combined
+        index is used). Listed on first use; after that the background
+        refresher re-lists them, so a search never waits for the listing.
+        """
+        if self._persisted_shards is None and not self._relist_shards():
+            return []
+        return self._persisted_shards
+
+    def _relist_shards(self) -> bool:
+        """Re-read the shard list from Mongo and swap it in whole (kept as is if it can't be read)."""
+        try:
+            names = self.dbapi.list_faiss_shards()
+        except Exception as e:
+            print(f"[FaissEngine] Could not list FAISS shards: {e}")
+            return False
+        self._persisted_shards = [SourceType[name] for name in names if name in SourceType.__members__]
+        return True
+
+    def _shards_for(self, src_types: Optional[Iterable[SourceType]]) -> List["FaissEngine"]:
+        """The shards a search over src_types (all types when empty) should read."""
+        persisted = self.persisted_shards()
+        wanted = set(src_types) if src_types else set(persisted)
+        return [self.get_shard(src_type) for src_type in persisted if src_type in wanted]
+
+    @staticmethod
+    def _merge_shard_hits(per_shard: List[List[SearchHit]]) -> List[SearchHit]:
+        return sorted(itertools.chain.from_iterable(per_shard), key=lambda hit: hit[1], reverse=True)
 
     def _save_to_mongo(self):
         """
@@ -157,49 +726,128 @@ class FaissEngine:
         # bytes object, so it must be converted before handing it to
         # GridFS (which only accepts bytes/str/file-like objects).
         index_bytes = faiss.serialize_index(self.index).tobytes()
+        self._base_count = self._index.ntotal
 
-        # Serialize the Python metadata list to bytes using pickle
-        metadata_bytes = pickle.dumps(self.metadata)
+        # Serialize the metadata (key list + index type) to bytes using pickle
+        metadata_bytes = pickle.dumps(self._persisted_metadata())
+        vectors_bytes = self._serialize_exact_vectors() if self.store_exact_vectors else None
 
         # Delegate saving the serialized bytes to the db API's method
-        self.dbapi.save_faiss_index(index_bytes, metadata_bytes)
+        self.dbapi.save_faiss_index(index_bytes, metadata_bytes, vectors_bytes, shard=self.shard)
+        self._mark_persisted()
 
         # What we just wrote is now the freshest copy, so keep _loaded_at in
         # sync — otherwise _refresh_if_stale() would immediately think its
         # own just-saved index is "stale" and reload it right back from Mongo.
         try:
-            self._loaded_at = self.dbapi.get_faiss_index_upload_date()
+            self._loaded_at = self.dbapi.get_faiss_index_upload_date(shard=self.shard)
         except Exception as e:
             print(f"[FaissEngine] Could not read FAISS index upload date after save: {e}")
+            return
+
+        if self._shard_parent is not None:
+            self._shard_parent._relist_shards()
+
+        # Seed the local cache too, so the next process on this machine opens
+        # it straight from disk instead of downloading what we just uploaded.
+        if self.cache_dir:
+            self._write_local_cache(self._loaded_at, index_bytes, metadata_bytes, vectors_bytes)
+
+    def _save_delta_to_mongo(self) -> int:
+        """
+        Persist only the vectors/keys added since the last save, as a new
+        append-only delta segment, so checkpoint I/O stays proportional to
+        what was added rather than to the whole index. Returns how many delta
+        segments are now on top of the base (0 if the base itself was saved).
+        """
+        if self._persisted_count == 0:
+            # Nothing to append to yet (and IVF/PQ need their trained base saved).
+            self._save_to_mongo()
+            return 0
+        if not self._pending_delta:
+            return 0
+
+        delta = {
+            "keys": self.metadata[self._persisted_key_count:],
+            "vectors": np.vstack(self._pending_delta).astype("float32"),
+        }
+        if self._chunk_owner is not None:
+            delta["chunk_owner"] = self._owner_ids()[self._persisted_count:].copy()
+        seq = self.dbapi.append_faiss_delta(pickle.dumps(delta), shard=self.shard)
+        self._mark_persisted()
+
+        # Same reasoning as in _save_to_mongo: don't treat our own write as stale.
+        try:
+            self._loaded_at = self.dbapi.get_faiss_index_upload_date(shard=self.shard)
+        except Exception as e:
+            print(f"[FaissEngine] Could not read FAISS index upload date after delta {seq}: {e}")
+        return seq
+
+    def _needs_compaction(self, delta_segments: int) -> bool:
+        delta_rows = self._index.ntotal - self._base_count
+        return (delta_segments >= self.MAX_DELTA_SEGMENTS
+                or delta_rows > self.MAX_DELTA_FRACTION * max(self._base_count, 1))
+
+    def _mark_persisted(self) -> None:
+        self._persisted_count = self._index.ntotal if self._index is not None else 0
+        self._persisted_key_count = len(self.metadata)
+        self._pending_delta = []
+
+    def compact(self):
+        """
+        Fold every delta segment back into a single base index in Mongo
+        (one full serialize/upload; the deltas are deleted by the save).
+        """
+        self._save_to_mongo()
 
-    # faiss_engine.py  — only the changed/added methods shown
 
     def add_documents(self, docs: List[Dict[str, str]]):
         """
-        One-off addition (small batches). Saves to Mongo after every call.
+        One-off addition (small batches). Appends a delta segment to Mongo after
+        every call, and compacts once the segments pile up (see MAX_DELTA_SEGMENTS).
         For bulk population of thousands of docs, use populate_bulk() instead.
+        With a sharded index, each doc goes to the shard of its SourceType.
         """
+        if self.shard is None and self.persisted_shards():
+            by_type: Dict[SourceType, List[Dict[str, str]]] = {}
+            for doc in docs:
+                src_type = SourceClass.get_src_type_from_key(doc["key"])
+                if src_type is None:
+                    print(f"[FaissEngine] No SourceType for key {doc['key']!r}; not indexed.")
+                    continue
+                by_type.setdefault(src_type, []).append(doc)
+            for src_type, type_docs in by_type.items():
+                self.get_shard(src_type).add_documents(type_docs)
+            return
+
         new_docs = self.get_new_docs(docs)
         if not new_docs:
             return
 
-        texts = [doc["content"] for doc in new_docs]
-        embeddings = self.model.encode(texts, convert_to_numpy=True, show_progress_bar=False)
-        self.index.add(embeddings)
-        self.metadata.extend([doc["key"] for doc in new_docs])
-        self._save_to_mongo()
+        with self._state_lock:
+            self._ensure_writable_index()
+            embeddings, chunk_counts = self._encode_docs(new_docs)
+            self._append_encoded([doc["key"] for doc in new_docs], embeddings, chunk_counts)
+            delta_segments = self._save_delta_to_mongo()
+            if delta_segments and self._needs_compaction(delta_segments):
+                print(f"[FaissEngine] {delta_segments} delta segments, {self._index.ntotal - self._base_count} "
+                      f"rows on a base of {self._base_count}; compacting.")
+                self.compact()
 
     def populate_bulk(
             self,
             docs: List[Dict[str, str]],
             batch_size: int = 256,
             checkpoint_every: int = 1000,
+            train_sample_size: int = 20000,
     ):
         """
         Efficient bulk ingestion for thousands of documents.
 
         - Encodes in batches (GPU/CPU-friendly, uses SentenceTransformer parallelism).
         - Saves to Mongo only at checkpoints and at the end — not per document.
+          Checkpoints upload just the rows added since the previous one (a delta
+          segment); the end compacts everything into a single base index.
         - Skips already-indexed keys automatically, so safe to re-run after a crash.
 
         :param docs:              List of {"key": str, "content": str} dicts.
@@ -207,6 +855,14 @@ class FaissEngine:
                                   raise to 512-1024 if you have a GPU.
         :param checkpoint_every:  Save to Mongo every N *new* documents added.
                                   Lower = safer on flaky connections; higher = faster.
+        :param train_sample_size: For index types that need training (IVF), how many
+                                  randomly sampled docs to train the quantizer on.
+
+        A chunked index (see clear_index(chunk_words=...)) embeds every window
+        of each passage; progress/checkpoints still count passages.
+
+        Encoding here runs in this one process; to spread it over every core,
+        feed an EmbeddingPipeline into populate_encoded() instead.
         """
         new_docs = self.get_new_docs(docs)
         if not new_docs:
@@ -216,58 +872,180 @@ class FaissEngine:
         total = len(new_docs)
         print(f"[FaissEngine] Indexing {total} new documents ({len(docs) - total} already present).")
 
-        added_since_checkpoint = 0
-        start_time = time.time()
+        self._ensure_writable_index()
+        if not self.index.is_trained:
+            self._train_index(new_docs, batch_size, train_sample_size)
 
-        for batch_start in range(0, total, batch_size):
-            batch = new_docs[batch_start: batch_start + batch_size]
-            texts = [doc["content"] for doc in batch]
+        batches = (
+            ([doc["key"] for doc in batch], *self._encode_docs(batch, batch_size))
+            for batch in (new_docs[i: i + batch_size] for i in range(0, total, batch_size))
+        )
+        self._write_encoded(batches, total, checkpoint_every)
 
-            embeddings = self.model.encode(
-                texts,
-                convert_to_numpy=True,
-                show_progress_bar=False,  # we handle progress ourselves
-                batch_size=batch_size,
-            )
+    def populate_encoded(
+            self,
+            batches: Iterable[EncodedBatch],
+            total: Optional[int] = None,
+            checkpoint_every: int = 1000,
+            train_sample_size: int = 20000,
+    ):
+        """
+        Bulk ingestion of batches someone else already embedded (e.g. the
+        worker processes of an EmbeddingPipeline): this is just the single
+        writer, adding to the index and checkpointing exactly like populate_bulk().
 
-            self.index.add(embeddings)
-            self.metadata.extend([doc["key"] for doc in batch])
-            added_since_checkpoint += len(batch)
+        :param batches:           (keys, embeddings, chunk counts or None) tuples. Keys
+                                  must be new; the caller is responsible for skipping
+                                  what's already indexed (see get_new_docs()).
+        :param total:             Expected number of passages, for progress/ETA and
+                                  IVF sizing only.
+        :param train_sample_size: For index types that need training, the first this
+                                  many embeddings are buffered and trained on (a stream
+                                  can't be sampled at random up front).
+        """
+        self._ensure_writable_index()
+        batches = iter(batches)
+        if not self.index.is_trained:
+            batches = self._train_on_leading_batches(batches, total, train_sample_size)
+        self._write_encoded(batches, total, checkpoint_every)
+
+    def _write_encoded(self, batches: Iterable[EncodedBatch], total: Optional[int], checkpoint_every: int) -> None:
+        added_since_checkpoint = 0
+        done = 0
+        start_time = time.time()
+
+        for keys, embeddings, chunk_counts in batches:
+            self._append_encoded(keys, embeddings, chunk_counts)
+            added_since_checkpoint += len(keys)
 
             # Progress log
-            done = batch_start + len(batch)
+            done += len(keys)
             elapsed = time.time() - start_time
-            rate = done / elapsed  # docs/sec
-            eta = (total - done) / rate if rate > 0 else 0
-            print(
-                f"  {done}/{total} docs "
-                f"({done * 100 // total}%)  "
-                f"{rate:.1f} docs/s  "
-                f"ETA {eta / 60:.1f} min"
-            )
+            rate = done / elapsed if elapsed > 0 else 0  # docs/sec
+            if total:
+                eta = (total - done) / rate if rate > 0 else 0
+                print(
+                    f"  {done}/{total} docs "
+                    f"({done * 100 // total}%)  "
+                    f"{rate:.1f} docs/s  "
+                    f"ETA {eta / 60:.1f} min"
+                )
+            else:
+                print(f"  {done} docs  {rate:.1f} docs/s")
 
             # Checkpoint save — recovers gracefully if Mongo drops mid-run
             if added_since_checkpoint >= checkpoint_every:
-                print(f"  [checkpoint] Saving to Mongo at {done} docs…")
-                self._save_to_mongo()
+                print(f"  [checkpoint] Saving delta to Mongo at {done} docs…")
+                self._save_delta_to_mongo()
                 added_since_checkpoint = 0
 
         # Final save (always, even if last batch didn't hit the checkpoint threshold)
-        print("[FaissEngine] Saving final index to Mongo…")
-        self._save_to_mongo()
+        print("[FaissEngine] Compacting final index to Mongo…")
+        self.compact()
         elapsed = time.time() - start_time
-        print(f"[FaissEngine] Done. {total} documents indexed in {elapsed / 60:.1f} min.")
+        print(f"[FaissEngine] Done. {done} documents indexed in {elapsed / 60:.1f} min.")
+
+    def _train_index(self, docs: List[Dict[str, str]], batch_size: int, sample_size: int) -> None:
+        """
+        Train an empty IVF index on a random sample of the docs about to be
+        added. The index is rebuilt first so its cell count / code size fit
+        the actual corpus size rather than a guess made at clear_index() time.
+        """
+        if self.index.ntotal > 0:
+            raise RuntimeError("[FaissEngine] Cannot (re)train an index that already holds vectors.")
+
+        self._index = FaissIndexFactory.create(self.index_type, self.dim, expected_size=len(docs))
+
+        rng = np.random.default_rng(0)
+        sample_ids = rng.choice(len(docs), size=min(sample_size, len(docs)), replace=False)
+
+        print(f"[FaissEngine] Training {self.index_type.value} index on {len(sample_ids)} sampled docs…")
+        sample, _ = self._encode_docs([docs[i] for i in sample_ids], batch_size)
+        self._index.train(sample)
+
+    def _train_on_leading_batches(self, batches: Iterator[EncodedBatch], total: Optional[int],
+                                  sample_size: int) -> Iterator[EncodedBatch]:
+        """Streaming counterpart of _train_index: train on the first sample_size
+        embeddings, then hand back every batch (the buffered ones included)."""
+        if self.index.ntotal > 0:
+            raise RuntimeError("[FaissEngine] Cannot (re)train an index that already holds vectors.")
+
+        buffered: List[EncodedBatch] = []
+        n_buffered = 0
+        for batch in batches:
+            buffered.append(batch)
+            n_buffered += len(batch[1])
+            if n_buffered >= sample_size:
+                break
+
+        self._index = FaissIndexFactory.create(self.index_type, self.dim, expected_size=total or n_buffered)
+        print(f"[FaissEngine] Training {self.index_type.value} index on the first {n_buffered} embeddings…")
+        self._index.train(np.vstack([embeddings for _, embeddings, _ in buffered]))
+        return itertools.chain(buffered, batches)
+
+    def _encode_docs(self, docs: List[Dict[str, str]], batch_size: int = 32) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        Embed docs in this process. Returns the vectors and, for a chunked
+        index, how many chunks (consecutive vectors) each doc produced.
+        """
+        texts, chunk_counts = split_passages([doc["content"] for doc in docs],
+                                             self.chunk_words, self.CHUNK_OVERLAP_WORDS)
+        embeddings = self.model.encode(
+            texts,
+            convert_to_numpy=True,
+            show_progress_bar=False,  # we handle progress ourselves
+            batch_size=batch_size,
+        )
+        return embeddings, chunk_counts
 
-    def clear_index(self):
+    def _append_encoded(self, keys: List[str], embeddings: np.ndarray, chunk_counts: Optional[np.ndarray]) -> None:
+        owners = None
+        if self._chunk_owner is not None:
+            first = len(self.metadata)
+            owners = np.repeat(np.arange(first, first + len(keys), dtype=np.int32), chunk_counts)
+        self._add_vectors(embeddings, owners)
+        self.metadata.extend(keys)
+
+    def clear_index(self, index_type: Optional[FaissIndexType] = None,
+                    store_exact_vectors: Optional[bool] = None,
+                    chunk_words: Optional[int] = None):
         """
         Totally wipes the FAISS index: resets the in-memory index/metadata
         and deletes the persisted copy in the db (via dbapi), so a fresh,
         empty index is used from here on.
+
+        :param index_type: Switch to a different index type for the rebuilt
+                           index (defaults to the current one).
+        :param store_exact_vectors: Whether the rebuilt index also keeps the
+                           full-precision vectors for re-ranking (defaults to
+                           the current setting).
+        :param chunk_words: Rebuild as a chunked (multi-vector) index with windows
+                           of this many words; 0 switches back to one vector per
+                           passage (defaults to the current setting).
         """
-        self._index = faiss.IndexFlatL2(self.dim)
+        if index_type is not None:
+            self.index_type = index_type
+        if store_exact_vectors is not None:
+            self.store_exact_vectors = store_exact_vectors
+        if chunk_words is not None:
+            self.chunk_words = chunk_words or None
+        self._exact_chunks = []
+        self._chunk_owner = array("i") if self.chunk_words else None
+        self._index = FaissIndexFactory.create(self.index_type, self.dim)
         self.metadata = []
+        self._mark_persisted()
         self._loaded_at = None
-        self.dbapi.clear_faiss_index()
+        self._mmap_path = None
+        if self.shard is None:
+            # Wipes every shard's files too; drop their in-memory copies with them.
+            for shard in self._shards.values():
+                shard.stop_background_refresh()
+            self._shards = {}
+        self.dbapi.clear_faiss_index(shard=self.shard)
+        if self.shard is None:
+            self._persisted_shards = []
+        else:
+            self._shard_parent._relist_shards()
 
     def get_new_docs(self, docs):
         existing_keys = set(self.metadata)
@@ -279,31 +1057,348 @@ class FaissEngine:
         new_docs = [doc for doc in docs if doc["key"] not in existing_keys]
         return new_docs
 
-    def search(self, query: str, top_k: int = 100000) -> List[str]:
-        # Cheap freshness check first: if a different process/script has
-        # (re)populated the index since we last loaded it, pick that up now
-        # instead of silently searching a stale/empty in-memory copy.
-        self._refresh_if_stale()
+    def search(self, query: str, limit: int = 100, offset: int = 0,
+               max_distance: Optional[float] = None,
+               src_types: Optional[List[SourceType]] = None) -> List[SearchHit]:
+        """
+        Nearest passages to query as (key, score) pairs, best first; score is
+        the cosine similarity (the embeddings are unit length).
 
+        :param limit: Page size: at most this many hits are returned.
+        :param offset: Hits to skip, for fetching later pages. Only
+                       offset + limit hits are ever retrieved from FAISS.
+        :param max_distance: Drop hits whose (squared L2) distance is above
+                       this, so a page may come back short, or empty.
+        :param src_types: Only return passages of these SourceTypes (all when
+                       empty). With a sharded index only their shards are
+                       loaded and searched.
+        """
+        return self.search_many([query], limit, offset, max_distance, src_types)[0]
+
+    def search_many(self, queries: List[str], limit: int = 100, offset: int = 0,
+                    max_distance: Optional[float] = None,
+                    src_types: Optional[List[SourceType]] = None) -> List[List[SearchHit]]:
+        """
+        search() for several queries at once: one batched encoder call for
+        the queries not cached yet, and one FAISS search over the whole
+        query matrix. Returns one hit list per query, in order.
+        """
+        if not queries:
+            return []
+        if self.shard is None:
+            self._ensure_background_refresh()  # keeps the shard list current, sharded or not
+        if self.shard is None and self.persisted_shards():
+            shards = self._shards_for(src_types)
+            query_vecs = self.encode_queries(queries)
+            per_shard = [shard._search_vecs(queries, query_vecs, offset + limit, 0, max_distance)
+                         for shard in shards]
+            return [self._merge_shard_hits(hits)[offset:offset + limit] for hits in zip(*per_shard)] \
+                if per_shard else [[] for _ in queries]
+
+        return self._search_vecs(queries, self.encode_queries(queries), limit, offset, max_distance, src_types)
+
+    def _search_vecs(self, queries: List[str], query_vecs: np.ndarray, limit: int, offset: int,
+                     max_distance: Optional[float],
+                     src_types: Optional[List[SourceType]] = None) -> List[List[SearchHit]]:
+        self._keep_fresh()
+        with self._state_lock:
+            # Combined (unsharded) index: other SourceTypes are dropped before the page is cut.
+            passage_mask = self._src_type_mask(src_types) if src_types else None
+            return self._search_locked(queries, query_vecs, limit, offset, max_distance, passage_mask)
+
+    def _search_locked(self, queries: List[str], query_vecs: np.ndarray, limit: int, offset: int,
+                       max_distance: Optional[float],
+                       passage_mask: Optional[np.ndarray] = None) -> List[List[SearchHit]]:
         ntotal = self.index.ntotal
         if ntotal == 0:
             print("[FaissEngine] search() called but the index has 0 vectors "
                   "in memory — nothing has been indexed yet, or reload failed.")
-            return []
+            return [[] for _ in queries]
 
-        if len(self.metadata) != ntotal:
-            print(f"[FaissEngine] WARNING: metadata length ({len(self.metadata)}) "
+        n_mapped = len(self._chunk_owner) if self._chunk_owner is not None else len(self.metadata)
+        if n_mapped != ntotal:
+            print(f"[FaissEngine] WARNING: metadata length ({n_mapped}) "
                   f"does not match index size ({ntotal}); some results may be dropped.")
 
-        query_vec = self.model.encode([query], convert_to_numpy=True)
-        distances, indices = self.index.search(query_vec, top_k)
+        top_k = offset + limit
+        # A chunked index returns chunks; fetch extra so enough distinct passages remain.
+        fetch = min(top_k, ntotal) if self._chunk_owner is None else min(top_k * self.CHUNK_OVERFETCH, ntotal)
+        ranked: List[Optional[Tuple[np.ndarray, np.ndarray]]] = [None] * len(queries)
+        pending = list(range(len(queries)))
+        while pending:
+            deeper = []
+            for row, (passage_ids, scores, complete) in zip(
+                    pending, self._ranked_passages(query_vecs[pending], fetch, max_distance, passage_mask)):
+                ranked[row] = passage_ids, scores
+                # Filtered by SourceType, a page can run short: search deeper for the rows it left short.
+                if passage_mask is not None and not complete and len(passage_ids) < top_k:
+                    deeper.append(row)
+            pending = deeper
+            fetch = min(fetch * 2, ntotal)
+
+        results = []
+        for query, (passage_ids, scores) in zip(queries, ranked):
+            hits = self._hits(passage_ids[offset:top_k], scores[offset:top_k])
+            if not hits and offset == 0:
+                print(f"[FaissEngine] search({query!r}) matched 0 keys out of "
+                      f"{ntotal} indexed vectors (limit={limit}, max_distance={max_distance}).")
+            results.append(hits)
+        return results
 
-        # Return only the reference keys
-        results = [self.metadata[i] for i in indices[0] if 0 <= i < len(self.metadata)]
+    def _ranked_passages(self, query_vecs: np.ndarray, fetch: int, max_distance: Optional[float],
+                         passage_mask: Optional[np.ndarray]) -> List[Tuple[np.ndarray, np.ndarray, bool]]:
+        """
+        The passages of the nearest fetch vectors of every query, best first,
+        with their scores, and whether searching deeper can't add any (the
+        index ran out, or max_distance already cut the ranking short).
+        """
+        ntotal = self.index.ntotal
+        rerank = self._can_rerank()
+        # Over-fetch from the compressed codes, then order exactly.
+        k = min(fetch * self.RERANK_FACTOR, ntotal) if rerank else fetch
+        all_distances, all_indices = self.index.search(query_vecs, k)
 
-        if not results:
-            print(f"[FaissEngine] search({query!r}) matched 0 keys out of "
-                  f"{ntotal} indexed vectors (top_k={top_k}).")
+        ranked = []
+        for row in range(len(query_vecs)):
+            found = all_indices[row] >= 0
+            ids, distances = all_indices[row][found], all_distances[row][found]
+            complete = k >= ntotal or len(ids) < k
+            if rerank:
+                ids, distances = self._rank_ids(query_vecs[row:row + 1], ids)
+                ids, distances = ids[:fetch], distances[:fetch]
+            if max_distance is not None:
+                within = distances <= max_distance
+                complete = complete or not within.all()
+                ids, distances = ids[within], distances[within]
+
+            passage_ids, scores = self._passages_for_hits(ids, distances)
+            if passage_mask is not None:
+                keep = passage_ids < len(passage_mask)
+                keep[keep] = passage_mask[passage_ids[keep]]
+                passage_ids, scores = passage_ids[keep], scores[keep]
+            ranked.append((passage_ids, scores, complete))
+        return ranked
+
+    def _src_type_mask(self, src_types: Iterable[SourceType]) -> np.ndarray:
+        """Mask over metadata indexes of the passages of src_types."""
+        # metadata is only ever replaced or extended.
+        version = (id(self.metadata), len(self.metadata))
+        if self._passage_src_types_version != version:
+            positions = {src_type: i for i, src_type in enumerate(SourceType)}
+            self._passage_src_types = np.fromiter(
+                (positions.get(SourceClass.get_src_type_from_key(key), -1) for key in self.metadata),
+                dtype=np.int16, count=len(self.metadata))
+            self._passage_src_types_version = version
+        wanted = set(src_types)
+        return np.isin(self._passage_src_types, [i for i, src_type in enumerate(SourceType) if src_type in wanted])
 
-        return results
 
+    def search_within(self, query: str, candidate_keys: Iterable[str],
+                      max_distance: Optional[float] = None) -> List[SearchHit]:
+        """
+        Rank only the given candidate keys (e.g. the keys of an already
+        structurally-filtered SourceMetadata list) by similarity to query,
+        nearest-first, as (key, score) pairs like search(). Cost is
+        O(len(candidate_keys)) rather than ranking the whole index.
+        Candidates that aren't in the index, or are further than
+        max_distance, are left out.
+        """
+        return self.search_within_many([query], [candidate_keys], max_distance)[0]
+
+    def search_within_many(self, queries: List[str], candidate_keys: List[Iterable[str]],
+                           max_distance: Optional[float] = None) -> List[List[SearchHit]]:
+        """
+        search_within() for several queries, each with its own candidates.
+        The queries are encoded in one batch, and every distinct candidate
+        vector is fetched once and scored against all the queries in one
+        matrix product.
+        """
+        if not queries:
+            return []
+        query_vecs = self.encode_queries(queries)
+        if self.shard is None:
+            self._ensure_background_refresh()  # keeps the shard list current, sharded or not
+        if self.shard is None and self.persisted_shards():
+            return self._search_within_shards(queries, query_vecs, candidate_keys, max_distance)
+        return self._search_within_vecs(query_vecs, candidate_keys, max_distance)
+
+    def _search_within_shards(self, queries: List[str], query_vecs: np.ndarray,
+                              candidate_keys: List[Iterable[str]], max_distance: Optional[float]
+                              ) -> List[List[SearchHit]]:
+        """Split every query's candidates by SourceType; a shard none of them fall in is never loaded."""
+        persisted = set(self.persisted_shards())
+        by_shard: Dict[SourceType, List[List[str]]] = {}
+        for row, keys in enumerate(candidate_keys):
+            for key in keys:
+                src_type = SourceClass.get_src_type_from_key(key)
+                if src_type in persisted:
+                    by_shard.setdefault(src_type, [[] for _ in queries])[row].append(key)
+
+        per_shard = [self.get_shard(src_type)._search_within_vecs(query_vecs, keys, max_distance)
+                     for src_type, keys in by_shard.items()]
+        return [self._merge_shard_hits(hits) for hits in zip(*per_shard)] \
+            if per_shard else [[] for _ in queries]
+
+    def _search_within_vecs(self, query_vecs: np.ndarray, candidate_keys: List[Iterable[str]],
+                            max_distance: Optional[float]) -> List[List[SearchHit]]:
+        self._keep_fresh()
+        with self._state_lock:
+            id_lists = [self._ids_for_keys(keys) for keys in candidate_keys]
+            union = np.unique(np.concatenate(id_lists)) if any(ids.size for ids in id_lists) \
+                else np.empty(0, dtype="int64")
+            vectors = self._reconstruct_batch(union) if union.size else None
+
+            results = []
+            for start in range(0, len(query_vecs), self.QUERY_BLOCK):
+                block = slice(start, start + self.QUERY_BLOCK)
+                distances = None
+                if vectors is not None:
+                    # ||q - v||^2 for every (query, candidate) pair of this block.
+                    q = query_vecs[block]
+                    distances = ((q ** 2).sum(axis=1)[:, None] + (vectors ** 2).sum(axis=1)[None, :]
+                                 - 2.0 * q @ vectors.T)
+                for row, ids in enumerate(id_lists[block]):
+                    if ids.size == 0:
+                        results.append([])
+                        continue
+                    if distances is not None:
+                        d = distances[row, np.searchsorted(union, ids)]
+                        order = np.argsort(d, kind="stable")
+                        ranked_ids, d = ids[order], d[order]
+                    else:
+                        ranked_ids, d = self._rank_ids(query_vecs[start + row:start + row + 1], ids)
+                    if max_distance is not None:
+                        within = d <= max_distance
+                        ranked_ids, d = ranked_ids[within], d[within]
+                    results.append(self._hits(*self._passages_for_hits(ranked_ids, d)))
+            return results
+
+    def _hits(self, passage_ids: np.ndarray, scores: np.ndarray) -> List[SearchHit]:
+        return [(self.metadata[i], float(score)) for i, score in zip(passage_ids.tolist(), scores.tolist())
+                if 0 <= i < len(self.metadata)]
+
+    def _keep_fresh(self) -> None:
+        """
+        Make sure a search sees newly-populated data. With the background
+        refresher running this is just a liveness check; with it disabled
+        (refresh_interval_s=0) it falls back to the synchronous per-query
+        uploadDate check.
+        """
+        if self.refresh_interval_s:
+            self.index  # first search still loads synchronously
+            self._ensure_background_refresh()
+        else:
+            self._refresh_if_stale()
+
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        (len(queries), dim) query embeddings. Cached ones come from the LRU;
+        the rest (deduplicated) are encoded in a single batched call.
+        """
+        # Backends differ slightly (int8 most of all), so each gets its own cache entries.
+        encoder_id = self.model_name
+        if self.query_encoder_backend != QueryEncoderBackend.TORCH:
+            encoder_id = f"{self.model_name}:{self.query_encoder_backend.value}"
+
+        vecs: Dict[str, Optional[np.ndarray]] = {}
+        missing: Dict[str, str] = {}  # normalized -> first query text seen for it
+        for query in queries:
+            norm = QueryEmbeddingCache.normalize(query)
+            if norm not in vecs:
+                vecs[norm] = self._query_cache.get(encoder_id, query)
+                if vecs[norm] is None:
+                    missing[norm] = query
+        if missing:
+            encoded = self.query_encoder.encode(list(missing.values()), convert_to_numpy=True)
+            for norm, vec in zip(missing, np.asarray(encoded, dtype="float32")):
+                vecs[norm] = vec.reshape(1, -1)
+                self._query_cache.put(encoder_id, missing[norm], vecs[norm])
+        return np.vstack([vecs[QueryEmbeddingCache.normalize(q)] for q in queries])
+
+    def query_cache_stats(self) -> Dict[str, float]:
+        """Hit/miss counters of the query-embedding LRU (hits, misses, size, max_size, hit_rate)."""
+        return self._query_cache.stats()
+
+    def _key_to_id_map(self) -> Dict[str, int]:
+        # metadata is only ever replaced or extended, so (identity, length)
+        # is enough to tell whether the cached map is still valid.
+        version = (id(self.metadata), len(self.metadata))
+        if self._key_to_id_version != version:
+            self._key_to_id = {key: i for i, key in enumerate(self.metadata)}
+            self._key_to_id_version = version
+        return self._key_to_id
+
+    def _ids_for_keys(self, keys: Iterable[str]) -> np.ndarray:
+        """FAISS ids of the given keys (every chunk of them, for a chunked index)."""
+        key_to_id = self._key_to_id_map()
+        ids = [key_to_id[k] for k in keys if k in key_to_id]
+        if self._chunk_owner is not None:
+            return self._chunks_of(np.asarray(ids, dtype=np.int64))
+        ntotal = self.index.ntotal
+        return np.fromiter((i for i in ids if i < ntotal), dtype="int64")
+
+    def _chunks_of(self, passage_ids: np.ndarray) -> np.ndarray:
+        """Sorted FAISS ids of every chunk of the given passages, gathered from the CSR map."""
+        chunks, offsets = self._chunk_ranges()
+        passage_ids = passage_ids[passage_ids < len(offsets) - 1]
+        starts, ends = offsets[passage_ids], offsets[passage_ids + 1]
+        lengths = ends - starts
+        if not lengths.sum():
+            return np.empty(0, dtype="int64")
+        # Concatenated aranges: each range's start, shifted by where it lands in the output.
+        shifts = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        return np.sort(chunks[np.arange(lengths.sum()) + shifts])
+
+    def _chunk_ranges(self) -> Tuple[np.ndarray, np.ndarray]:
+        # _chunk_owner is only ever replaced or extended, like metadata.
+        version = (id(self._chunk_owner), len(self._chunk_owner), len(self.metadata))
+        if self._passage_chunks_version != version:
+            owners = self._owner_ids()
+            self._passage_chunks = np.argsort(owners, kind="stable").astype("int64")
+            self._passage_chunk_offsets = np.searchsorted(owners[self._passage_chunks],
+                                                          np.arange(len(self.metadata) + 1))
+            self._passage_chunks_version = version
+        return self._passage_chunks, self._passage_chunk_offsets
+
+    def _owner_ids(self) -> np.ndarray:
+        """Zero-copy int32 view of the chunk -> metadata index map."""
+        return np.frombuffer(self._chunk_owner, dtype=np.int32)
+
+    def _passages_for_hits(self, ids: np.ndarray, distances: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Metadata indexes for nearest-first FAISS hits, best passage first, with their scores."""
+        # Embeddings are unit length, so squared L2 d maps to cosine similarity 1 - d/2.
+        similarities = 1.0 - distances / 2.0
+        if self._chunk_owner is None:
+            return ids, similarities
+        return aggregate_chunk_scores(self._owner_ids()[ids], similarities,
+                                      self.chunk_aggregation, self.chunk_top_n)
+
+    def _rank_ids(self, query_vec: np.ndarray, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return ids ordered by ascending L2 distance to query_vec, with those distances."""
+        vectors = self._reconstruct_batch(ids)
+        if vectors is not None:
+            # Pull just the candidate rows and score them directly with one
+            # vectorized pass (exact when the original vectors are available,
+            # decoded approximations for SQ/PQ codes otherwise).
+            distances = ((vectors - query_vec[0]) ** 2).sum(axis=1)
+            order = np.argsort(distances, kind="stable")
+            return ids[order], distances[order]
+
+        params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(ids))
+        distances, indices = self.index.search(query_vec, len(ids), params=params)
+        found = indices[0] >= 0
+        return indices[0][found], distances[0][found]
+
+    def _reconstruct_batch(self, ids: np.ndarray) -> Optional[np.ndarray]:
+        exact = self._exact_vectors()
+        if exact is not None:
+            return np.asarray(exact[ids])
+
+        ivf = faiss.try_extract_index_ivf(self.index)
+        try:
+            if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+                ivf.make_direct_map()  # id -> (list, offset) lookup, needed to reconstruct
+            return self.index.reconstruct_batch(ids)
+        except RuntimeError as e:
+            print(f"[FaissEngine] Cannot reconstruct vectors from {self.index_type.value} index: {e}")
+            return None
@@ -0,0 +1,109 @@
+# bs"d - lehagdil torah velahadir
+"""
+Builds the FAISS index behind FaissEngine.
+
+FLAT is exact brute force (what the engine always used). The approximate
+types trade a little recall for sub-linear search once the corpus grows:
+  - HNSW:    graph index, no training, good recall at low latency.
+  - IVF_FLAT: inverted lists over k-means cells, needs training.
+  - IVF_PQ:   IVF plus product-quantized codes (much smaller), needs training.
+
+SQ8 and PQ are compressed brute-force indexes: same exhaustive scan as FLAT,
+but each 384-dim float32 vector (1536 bytes) is stored as 384 bytes (SQ8, 4x)
+or 96 bytes (PQ, 16x). Both need a short training pass.
+"""
+import math
+from enum import Enum
+
+import faiss
+
+
+class FaissIndexType(Enum):
+    FLAT = "Flat"
+    HNSW = "HNSW"
+    IVF_FLAT = "IVF_Flat"
+    IVF_PQ = "IVF_PQ"
+    SQ8 = "SQ8"
+    PQ = "PQ"
+
+
+class FaissIndexFactory:
+
+    HNSW_M = 32                 # graph neighbours per node
+    HNSW_EF_SEARCH = 64
+    IVF_MIN_POINTS_PER_CELL = 39  # faiss warns below this when training k-means
+    IVF_NPROBE = 16
+    PQ_SUB_VECTOR_DIM = 8       # 384-dim -> 48 sub-quantizers
+    FLAT_PQ_SUB_VECTOR_DIM = 4  # 384-dim -> 96 one-byte codes (16x smaller than float32)
+
+    @staticmethod
+    def requires_training(index_type: FaissIndexType) -> bool:
+        return index_type in (FaissIndexType.IVF_FLAT, FaissIndexType.IVF_PQ,
+                              FaissIndexType.SQ8, FaissIndexType.PQ)
+
+    @staticmethod
+    def is_compressed(index_type: FaissIndexType) -> bool:
+        """True when the index only keeps lossy codes, not the original vectors."""
+        return index_type in (FaissIndexType.IVF_PQ, FaissIndexType.SQ8, FaissIndexType.PQ)
+
+    @staticmethod
+    def create(index_type: FaissIndexType, dim: int, expected_size: int = 0) -> faiss.Index:
+        """
+        Create an empty index of the given type. expected_size (number of
+        vectors about to be indexed) sizes the IVF cell count and PQ code
+        width; it is ignored for FLAT/HNSW.
+        """
+        if index_type == FaissIndexType.FLAT:
+            return faiss.IndexFlatL2(dim)
+
+        if index_type == FaissIndexType.HNSW:
+            index = faiss.IndexHNSWFlat(dim, FaissIndexFactory.HNSW_M)
+            index.hnsw.efSearch = FaissIndexFactory.HNSW_EF_SEARCH
+            return index
+
+        if index_type == FaissIndexType.SQ8:
+            return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit)
+
+        if index_type == FaissIndexType.PQ:
+            m = dim // FaissIndexFactory.FLAT_PQ_SUB_VECTOR_DIM
+            return faiss.IndexPQ(dim, m, FaissIndexFactory.pq_nbits(expected_size))
+
+        nlist = FaissIndexFactory.ivf_nlist(expected_size)
+        if index_type == FaissIndexType.IVF_FLAT:
+            index = faiss.index_factory(dim, f"IVF{nlist},Flat")
+        elif index_type == FaissIndexType.IVF_PQ:
+            m = dim // FaissIndexFactory.PQ_SUB_VECTOR_DIM
+            nbits = FaissIndexFactory.pq_nbits(expected_size)
+            index = faiss.index_factory(dim, f"IVF{nlist},PQ{m}x{nbits}")
+        else:
+            raise ValueError(f"Unsupported FAISS index type: {index_type}")
+
+        faiss.extract_index_ivf(index).nprobe = min(nlist, FaissIndexFactory.IVF_NPROBE)
+        return index
+
+    @staticmethod
+    def ivf_nlist(n: int) -> int:
+        """~4*sqrt(n) cells, capped so every cell still gets enough training points."""
+        by_sqrt = 4 * int(math.sqrt(max(n, 1)))
+        by_points = max(1, n // FaissIndexFactory.IVF_MIN_POINTS_PER_CELL)
+        return max(1, min(by_sqrt, by_points))
+
+    @staticmethod
+    def pq_nbits(n: int) -> int:
+        """8-bit PQ codes need 256 centroids per sub-quantizer; shrink for tiny corpora."""
+        bits = int(math.log2(max(n, 16) / FaissIndexFactory.IVF_MIN_POINTS_PER_CELL)) if n else 8
+        return max(4, min(8, bits))
+
+    @staticmethod
+    def get_type(index: faiss.Index) -> FaissIndexType:
+        """Best-effort reverse lookup for indexes persisted before the type was recorded."""
+        if isinstance(index, faiss.IndexHNSW):
+            return FaissIndexType.HNSW
+        if isinstance(index, faiss.IndexScalarQuantizer):
+            return FaissIndexType.SQ8
+        if isinstance(index, faiss.IndexPQ):
+            return FaissIndexType.PQ
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            return FaissIndexType.IVF_PQ if isinstance(ivf, faiss.IndexIVFPQ) else FaissIndexType.IVF_FLAT
+        return FaissIndexType.FLAT
@@ -0,0 +1,86 @@
+# bs"d - lehagdil torah velahadir
+"""
+Splitting long passages into overlapping windows for multi-vector indexing,
+and folding chunk-level hits back into one score per passage.
+
+all-MiniLM-L6-v2 truncates its input at 256 word pieces, so a long sugya
+embedded as one vector is only represented by its opening. Embedding each
+window separately keeps the rest of it searchable.
+"""
+from enum import Enum
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+class ChunkAggregation(Enum):
+    MAX = "max"              # a passage scores as its single best chunk
+    SUM_TOP_N = "sum_top_n"  # sum of its n best chunks: rewards passages that match throughout
+
+
+def split_passage(text: str, chunk_words: int, overlap_words: int) -> List[str]:
+    """
+    Overlapping windows of chunk_words words (consecutive windows share
+    overlap_words). Passages that fit in one window come back unchanged.
+    """
+    words = text.split()
+    if len(words) <= chunk_words:
+        return [text]
+
+    step = max(1, chunk_words - overlap_words)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(" ".join(words[start:start + chunk_words]))
+        if start + chunk_words >= len(words):
+            break
+    return chunks
+
+
+def split_passages(texts: List[str], chunk_words: Optional[int],
+                   overlap_words: int) -> Tuple[List[str], Optional[np.ndarray]]:
+    """
+    Flatten several passages into the texts to embed. Returns those texts and
+    the number of chunks each passage produced (None when chunk_words is
+    unset, i.e. one vector per passage).
+    """
+    if not chunk_words:
+        return texts, None
+    flat, counts = [], []
+    for text in texts:
+        chunks = split_passage(text, chunk_words, overlap_words)
+        flat.extend(chunks)
+        counts.append(len(chunks))
+    return flat, np.asarray(counts, dtype=np.int32)
+
+
+def aggregate_chunk_hits(owners: np.ndarray, similarities: np.ndarray,
+                         mode: ChunkAggregation, top_n: int = 3) -> np.ndarray:
+    """
+    Collapse chunk hits into passages.
+
+    :param owners: Passage id of every hit chunk.
+    :param similarities: Matching similarity per chunk (higher is closer).
+    :return: The distinct passage ids, best first.
+    """
+    return aggregate_chunk_scores(owners, similarities, mode, top_n)[0]
+
+
+def aggregate_chunk_scores(owners: np.ndarray, similarities: np.ndarray,
+                           mode: ChunkAggregation, top_n: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+    """aggregate_chunk_hits, also returning each passage's aggregated score."""
+    if owners.size == 0:
+        return owners, similarities
+
+    n = 1 if mode == ChunkAggregation.MAX else top_n
+    order = np.lexsort((-similarities, owners))  # grouped by passage, best chunk first
+    owners, similarities = owners[order], similarities[order]
+
+    group_starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+    group_sizes = np.diff(np.r_[group_starts, owners.size])
+    rank_in_group = np.arange(owners.size) - np.repeat(group_starts, group_sizes)
+    group_of = np.repeat(np.arange(group_starts.size), group_sizes)
+
+    keep = rank_in_group < n
+    scores = np.bincount(group_of[keep], weights=similarities[keep], minlength=group_starts.size)
+    best = np.argsort(-scores, kind="stable")
+    return owners[group_starts][best], scores[best]
@@ -0,0 +1,68 @@
+# bs"d - lehagdil torah velahadir
+
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded, thread-safe LRU of query embeddings, keyed by (model name,
+    normalized query text). Streamlit reruns and different users asking the
+    same thing then skip the SentenceTransformer forward pass entirely.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        # Only differences the tokenizer can't see anyway: unicode form and whitespace.
+        return " ".join(unicodedata.normalize("NFC", query).split())
+
+    def get(self, model_name: str, query: str) -> Optional[np.ndarray]:
+        key = (model_name, self.normalize(query))
+        with self._lock:
+            vec = self._entries.get(key)
+            if vec is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vec
+
+    def put(self, model_name: str, query: str, vec: np.ndarray) -> None:
+        if self.max_size <= 0:
+            return
+        vec = np.array(vec, dtype="float32")
+        vec.setflags(write=False)  # shared between callers; nobody may mutate it
+        key = (model_name, self.normalize(query))
+        with self._lock:
+            self._entries[key] = vec
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,153 @@
+# bs"d - lehagdil torah velahadir
+"""
+Alternative backends for encoding search queries.
+
+TORCH is the SentenceTransformer model FaissEngine also indexes with. The
+ONNX backends run an ONNX Runtime export of that same model instead: no
+torch import at start-up and a faster CPU forward pass, optionally with
+dynamically int8-quantized weights. Only queries go through them; passages
+are always indexed with the reference (torch) model.
+
+The export is made once per model and backend, by export_onnx_model(), the
+first time it is needed (that one call still needs torch), and kept under
+Paths.ONNX_MODEL_DIR. onnxruntime is an optional dependency, only needed
+when an ONNX backend is selected.
+"""
+import os
+from enum import Enum
+from typing import List, Optional
+
+import numpy as np
+
+from backend.common import Paths
+
+_FP32_FILENAME = "model.onnx"
+_INT8_FILENAME = "model.int8.onnx"
+_TOKENIZER_FILENAME = "tokenizer.json"
+_MAX_SEQ_LENGTH_FILENAME = "max_seq_length.txt"
+_INPUT_NAMES = ("input_ids", "attention_mask", "token_type_ids")
+
+
+class QueryEncoderBackend(Enum):
+    TORCH = "torch"
+    ONNX = "onnx"
+    ONNX_INT8 = "onnx_int8"
+
+    @classmethod
+    def from_config(cls, value: Optional[str]) -> "QueryEncoderBackend":
+        """Parse a config/secret value; unset or empty means TORCH."""
+        if not value or not value.strip():
+            return cls.TORCH
+        try:
+            return cls(value.strip().lower())
+        except ValueError:
+            print(f"[QueryEncoder] Unknown query encoder backend {value!r}; using {cls.TORCH.value}.")
+            return cls.TORCH
+
+
+def mean_pool_normalize(token_embeddings: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+    """
+    The Pooling(mean) + Normalize head of all-MiniLM-L6-v2, in numpy: average
+    the token vectors over the real (unpadded) tokens, then scale to unit length.
+    """
+    mask = attention_mask[..., None].astype(np.float32)
+    summed = (token_embeddings * mask).sum(axis=1)
+    pooled = summed / np.clip(mask.sum(axis=1), 1e-9, None)
+    norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+    return (pooled / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+
+def onnx_model_dir(model_name: str) -> str:
+    return os.path.join(Paths.ONNX_MODEL_DIR, model_name.replace("/", "__"))
+
+
+def export_onnx_model(model_name: str, out_dir: Optional[str] = None, quantize_int8: bool = True) -> str:
+    """
+    Export the transformer of SentenceTransformer(model_name) to ONNX (plus its
+    tokenizer), and a dynamically int8-quantized copy if quantize_int8.
+    Weights come from the very model the torch backend loads, so both
+    backends encode with the same parameters. Returns the output directory.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    out_dir = out_dir or onnx_model_dir(model_name)
+    os.makedirs(out_dir, exist_ok=True)
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0]
+    hf_model = transformer.auto_model.eval()
+    tokenizer = transformer.tokenizer
+
+    dummy = tokenizer(["export"], return_tensors="pt")
+    fp32_path = os.path.join(out_dir, _FP32_FILENAME)
+    with torch.no_grad():
+        torch.onnx.export(
+            hf_model,
+            tuple(dummy[name] for name in _INPUT_NAMES),
+            fp32_path,
+            input_names=list(_INPUT_NAMES),
+            output_names=["token_embeddings"],
+            dynamic_axes={name: {0: "batch", 1: "seq"} for name in (*_INPUT_NAMES, "token_embeddings")},
+            opset_version=17,
+            dynamo=False,
+        )
+    tokenizer.backend_tokenizer.save(os.path.join(out_dir, _TOKENIZER_FILENAME))
+    with open(os.path.join(out_dir, _MAX_SEQ_LENGTH_FILENAME), "w") as f:
+        f.write(str(transformer.max_seq_length))
+
+    if quantize_int8:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(fp32_path, os.path.join(out_dir, _INT8_FILENAME), weight_type=QuantType.QInt8)
+
+    print(f"[QueryEncoder] Exported {model_name} to {out_dir}{' (fp32 + int8)' if quantize_int8 else ''}.")
+    return out_dir
+
+
+class OnnxQueryEncoder:
+    """
+    ONNX Runtime stand-in for SentenceTransformer.encode: HF fast tokenizer
+    (the Rust `tokenizers` package, no torch) -> exported transformer ->
+    mean pooling -> L2 normalization.
+    """
+
+    def __init__(self, model_dir: str, quantized: bool = False, intra_op_threads: int = 0):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = intra_op_threads  # 0 = one per core
+        model_path = os.path.join(model_dir, _INT8_FILENAME if quantized else _FP32_FILENAME)
+        self._session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self._session.get_inputs()}
+
+        with open(os.path.join(model_dir, _MAX_SEQ_LENGTH_FILENAME)) as f:
+            max_seq_length = int(f.read())
+        self._tokenizer = Tokenizer.from_file(os.path.join(model_dir, _TOKENIZER_FILENAME))
+        self._tokenizer.enable_truncation(max_length=max_seq_length)
+        self._tokenizer.enable_padding()
+
+    @classmethod
+    def load(cls, model_name: str, quantized: bool = False) -> "OnnxQueryEncoder":
+        """Open the export for model_name, exporting it first if it isn't there yet."""
+        model_dir = onnx_model_dir(model_name)
+        wanted = _INT8_FILENAME if quantized else _FP32_FILENAME
+        if not os.path.exists(os.path.join(model_dir, wanted)):
+            print(f"[QueryEncoder] No ONNX export of {model_name} in {model_dir}; exporting it now (one-time).")
+            export_onnx_model(model_name, model_dir, quantize_int8=quantized)
+        return cls(model_dir, quantized=quantized)
+
+    def encode(self, texts: List[str], convert_to_numpy: bool = True, show_progress_bar: bool = False,
+               batch_size: int = 32) -> np.ndarray:
+        """Same call shape as SentenceTransformer.encode; always returns a float32 numpy array."""
+        out = []
+        for start in range(0, len(texts), batch_size):
+            encodings = self._tokenizer.encode_batch(texts[start:start + batch_size])
+            input_ids = np.asarray([e.ids for e in encodings], dtype=np.int64)
+            attention_mask = np.asarray([e.attention_mask for e in encodings], dtype=np.int64)
+            feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self._input_names:
+                feeds["token_type_ids"] = np.zeros_like(input_ids)
+            token_embeddings = self._session.run(None, feeds)[0]
+            out.append(mean_pool_normalize(token_embeddings, attention_mask))
+        return np.vstack(out) if out else np.empty((0, 0), dtype=np.float32)
@@ -24,6 +24,7 @@ class HtmlWriter:
 .source-title-en { flex:1; text-align:left; }
 .source-title-right { display:flex; align-items:center; gap:8px; }
 .source-title-heb { direction:rtl; text-align:right; font-weight:bold; }
+.source-score { font-size:0.75em; font-weight:normal; color:#bdc3c7; white-space:nowrap; }
 .source-arrow { font-size:12px; transition:transform 0.25s; flex-shrink:0; }
 .source-header.open .source-arrow { transform:rotate(90deg); }
 .source-summary-row { display:flex; justify-content:space-between; align-items:baseline; gap:12px; }
@@ -103,8 +104,10 @@ function toggleCollapsible(contentId) {
         summary_heb: str = "",
         start_open: bool = False,
         passage_types: Optional[List[PassageType]] = None,
+        score: Optional[float] = None,
     ) -> str:
         """Build a source section div (collapsible header + body).
+        score, if given, is the text-similarity score shown in the header.
         Shared with the frontend popup component."""
         t_en  = HtmlWriter._escape_html(title_en)
         t_heb = HtmlWriter._escape_html(title_heb)
@@ -121,6 +124,7 @@ function toggleCollapsible(contentId) {
             )
 
         badges_row = HtmlWriter.build_passage_badges_html(passage_types)
+        score_html = f'<span class="source-score">{score:.2f}</span>' if score is not None else ""
 
         open_cls = " open" if start_open else ""
         return (
@@ -130,6 +134,7 @@ function toggleCollapsible(contentId) {
             f'<div class="source-title-row">'
             f'<span class="source-title-en">{t_en}</span>'
             f'<div class="source-title-right">'
+            f'{score_html}'
             f'<span class="source-title-heb">{t_heb}</span>'
             f'<span class="source-arrow">▶</span>'
             f'</div></div>'
@@ -229,11 +234,13 @@ body { font-family:'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; margin:8px;
         html = ""
         for i, src_metadata in enumerate(ans.src_metadata_lst):
             source = ans.src_contents[i] if i < len(ans.src_contents) else None
-            html += self._get_reference_section(src_metadata, source, i)
+            html += self._get_reference_section(src_metadata, source, ans.offset + i,
+                                                ans.scores.get(src_metadata.key))
         html += self._get_javascript()
         return html
 
-    def _get_reference_section(self, src_metadata: SourceMetadata, source: SourceContent, index: int) -> str:
+    def _get_reference_section(self, src_metadata: SourceMetadata, source: SourceContent, index: int,
+                               score: Optional[float] = None) -> str:
         body_id   = f"src-body-{index}"
         header_id = f"src-hdr-{index}"
 
@@ -257,6 +264,7 @@ body { font-family:'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; margin:8px;
             summary_en=summary_en,
             summary_heb=summary_heb,
             passage_types=getattr(src_metadata, 'passage_types', None),
+            score=score,
         )
 
     def _get_source_content(self, source, index: int) -> str:
@@ -0,0 +1,279 @@
+# bs"d - lehagdil torah velahadir
+
+import io
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+# A quoted run of words ("...") that must appear contiguously. The quotes must
+# sit on word boundaries, so in-word quote marks (Hebrew acronyms) are left alone.
+_PHRASE_RE = re.compile(r'(?:^|(?<=\s))"([^"]+)"(?=\s|$)')
+
+# Only words so common they never help tell passages apart. Kept short on
+# purpose: names and rare terms are exactly what the lexical index is for.
+_EN_STOPWORDS = frozenset(
+    "a an and are as at be but by for from had has have he her his i in is it its "
+    "of on or s she that the their them they this to was were which who will with".split()
+)
+
+
+class BM25Index:
+    """
+    In-memory BM25 inverted index over passage text, keyed by source key.
+
+    Postings are stored CSR-style in a handful of flat numpy arrays instead
+    of per-term Python lists: the postings of term t are
+    doc_ids[offsets[t]:offsets[t+1]] (with matching term_freqs). That keeps
+    the whole index a few contiguous buffers, so (de)serializing it is a
+    straight memory copy, like the FAISS index it is persisted next to.
+
+    Subclasses with STORE_POSITIONS also keep every token position (again
+    CSR-style: the positions of posting p are positions[pos_offsets[p]:pos_offsets[p+1]]),
+    which is what quoted phrase queries are matched against.
+    """
+
+    NAME = "bm25_en"
+    STORE_POSITIONS = False
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, keys: List[str], vocab: List[str], offsets: np.ndarray,
+                 doc_ids: np.ndarray, term_freqs: np.ndarray, doc_lens: np.ndarray,
+                 pos_offsets: Optional[np.ndarray] = None, positions: Optional[np.ndarray] = None):
+        self.keys = keys
+        self.vocab = vocab
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lens = doc_lens
+        self.pos_offsets = pos_offsets
+        self.positions = positions
+        self._term_ids: Dict[str, int] = {term: i for i, term in enumerate(vocab)}
+        self._key_to_id: Optional[Dict[str, int]] = None
+        self._avg_doc_len = float(doc_lens.mean()) if len(doc_lens) and doc_lens.mean() > 0 else 1.0
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        # Same ASCII folding clean_en_text_from_html_tags applies to the corpus,
+        # so a query typed as "Ḥisda" still matches "Hisda" in the text.
+        text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("utf-8")
+        return [tok for tok in _TOKEN_RE.findall(text.lower()) if tok not in _EN_STOPWORDS]
+
+    ############################################ Building ############################################
+
+    @classmethod
+    def build(cls, docs: Iterable[Dict[str, str]]) -> "BM25Index":
+        """
+        Build from the same {"key", "content"} dicts FaissEngine.populate_bulk
+        takes. Later duplicates of a key are ignored.
+        """
+        keys: List[str] = []
+        seen = set()
+        term_ids: Dict[str, int] = {}
+        posting_terms, posting_docs, posting_tfs, doc_lens = [], [], [], []
+        posting_positions: List[List[int]] = []
+
+        for doc in docs:
+            if doc["key"] in seen:
+                continue
+            seen.add(doc["key"])
+            doc_id = len(keys)
+            keys.append(doc["key"])
+
+            tokens = cls.tokenize(doc["content"])
+            doc_lens.append(len(tokens))
+            if cls.STORE_POSITIONS:
+                by_term: Dict[str, List[int]] = {}
+                for pos, term in enumerate(tokens):
+                    by_term.setdefault(term, []).append(pos)
+                term_counts = ((term, len(pos_list)) for term, pos_list in by_term.items())
+                posting_positions.extend(by_term.values())
+            else:
+                term_counts = Counter(tokens).items()
+            for term, tf in term_counts:
+                posting_terms.append(term_ids.setdefault(term, len(term_ids)))
+                posting_docs.append(doc_id)
+                posting_tfs.append(tf)
+
+        posting_terms = np.asarray(posting_terms, dtype=np.int64)
+        # Group postings by term; the stable sort keeps each list in doc order.
+        order = np.argsort(posting_terms, kind="stable")
+        counts = np.bincount(posting_terms, minlength=len(term_ids))
+        offsets = np.zeros(len(term_ids) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        pos_offsets = positions = None
+        if cls.STORE_POSITIONS:
+            ordered_positions = [posting_positions[i] for i in order]
+            pos_offsets = np.zeros(len(ordered_positions) + 1, dtype=np.int64)
+            np.cumsum([len(p) for p in ordered_positions], out=pos_offsets[1:])
+            positions = np.fromiter((p for pos_list in ordered_positions for p in pos_list),
+                                    dtype=np.int32, count=int(pos_offsets[-1]))
+
+        return cls(
+            keys=keys,
+            vocab=list(term_ids),
+            offsets=offsets,
+            doc_ids=np.asarray(posting_docs, dtype=np.int32)[order],
+            term_freqs=np.minimum(np.asarray(posting_tfs, dtype=np.int64), np.iinfo(np.uint16).max)
+                        .astype(np.uint16)[order],
+            doc_lens=np.asarray(doc_lens, dtype=np.int32),
+            pos_offsets=pos_offsets,
+            positions=positions,
+        )
+
+    ############################################ Scoring ############################################
+
+    def _term_ids_for(self, term: str) -> List[int]:
+        """Vocabulary entries a query term matches (subclasses may expand, e.g. by prefix)."""
+        term_id = self._term_ids.get(term)
+        return [] if term_id is None else [term_id]
+
+    def _postings(self, term: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(doc ids, term frequencies, posting indexes) for every vocabulary entry term matches."""
+        slices = [np.arange(self.offsets[t], self.offsets[t + 1]) for t in self._term_ids_for(term)]
+        posting_idx = np.concatenate(slices) if slices else np.empty(0, dtype=np.int64)
+        return self.doc_ids[posting_idx], self.term_freqs[posting_idx], posting_idx
+
+    def scores(self, query: str) -> np.ndarray:
+        """
+        BM25 score of every indexed passage for query (0 where no term matches).
+        With positions stored, passages missing any quoted phrase score 0.
+        """
+        scores = np.zeros(len(self.keys), dtype=np.float32)
+        n_docs = len(self.keys)
+        for term in set(self.tokenize(query)):
+            ids, tf, _ = self._postings(term)
+            if ids.size == 0:
+                continue
+            if ids.size > 1 and np.any(np.diff(ids) <= 0):
+                # several matching variants in one passage: pool their counts
+                ids, inverse = np.unique(ids, return_inverse=True)
+                tf = np.bincount(inverse, weights=tf)
+            tf = tf.astype(np.float32)
+            df = ids.size
+            idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+            norm = self.K1 * (1.0 - self.B + self.B * self.doc_lens[ids] / self._avg_doc_len)
+            # ids are unique here, so fancy-index += is safe.
+            scores[ids] += idf * tf * (self.K1 + 1.0) / (tf + norm)
+
+        if self.positions is not None:
+            for phrase in _PHRASE_RE.findall(query):
+                scores[~self._phrase_mask(phrase)] = 0.0
+        return scores
+
+    def _phrase_mask(self, phrase: str) -> np.ndarray:
+        """Boolean per passage: does it contain the phrase's tokens contiguously?"""
+        mask = np.zeros(len(self.keys), dtype=bool)
+        tokens = self.tokenize(phrase)
+        if not tokens:
+            return ~mask
+
+        postings = [self._postings(token) for token in tokens]
+        # Cheap doc-level intersection first; positions are only read for passages holding every token.
+        docs = postings[0][0]
+        for ids, _, _ in postings[1:]:
+            docs = np.intersect1d(docs, ids)
+        if docs.size == 0:
+            return mask
+
+        # doc -> positions where the phrase could start, narrowed one token at a time
+        starts: Optional[Dict[int, set]] = None
+        for offset, (ids, _, posting_idx) in enumerate(postings):
+            keep = np.isin(ids, docs)
+            found: Dict[int, set] = {}
+            for doc_id, p in zip(ids[keep].tolist(), posting_idx[keep].tolist()):
+                token_positions = self.positions[self.pos_offsets[p]:self.pos_offsets[p + 1]]
+                found.setdefault(doc_id, set()).update((token_positions - offset).tolist())
+            starts = found if starts is None else {
+                doc_id: doc_starts & found[doc_id] for doc_id, doc_starts in starts.items()
+                if doc_id in found and doc_starts & found[doc_id]
+            }
+            if not starts:
+                return mask
+
+        mask[list(starts)] = True
+        return mask
+
+    def search(self, query: str, top_k: int = 100) -> List[str]:
+        """Best top_k matching keys across the whole corpus."""
+        scores = self.scores(query)
+        matched = np.flatnonzero(scores > 0)
+        if matched.size > top_k:
+            matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        order = np.argsort(-scores[matched], kind="stable")
+        return [self.keys[i] for i in matched[order]]
+
+    def rank_within(self, query: str, candidate_keys: Iterable[str]) -> List[str]:
+        """
+        The candidate keys that contain at least one query term, best BM25
+        score first. Candidates that don't match (or aren't indexed) are left out.
+        """
+        if self._key_to_id is None:
+            self._key_to_id = {key: i for i, key in enumerate(self.keys)}
+        ids = np.fromiter((self._key_to_id[k] for k in candidate_keys if k in self._key_to_id), dtype=np.int64)
+        if ids.size == 0:
+            return []
+
+        candidate_scores = self.scores(query)[ids]
+        matched = candidate_scores > 0
+        ids, candidate_scores = ids[matched], candidate_scores[matched]
+        order = np.argsort(-candidate_scores, kind="stable")
+        return [self.keys[i] for i in ids[order]]
+
+    ############################################ Persistence ############################################
+
+    def to_bytes(self) -> bytes:
+        buffer = io.BytesIO()
+        arrays = dict(
+            keys=self._pack_strings(self.keys),
+            vocab=self._pack_strings(self.vocab),
+            offsets=self.offsets,
+            doc_ids=self.doc_ids,
+            term_freqs=self.term_freqs,
+            doc_lens=self.doc_lens,
+        )
+        if self.positions is not None:
+            arrays.update(pos_offsets=self.pos_offsets, positions=self.positions)
+        np.savez(buffer, **arrays)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "BM25Index":
+        arrays = np.load(io.BytesIO(data), allow_pickle=False)
+        return cls(
+            keys=cls._unpack_strings(arrays["keys"]),
+            vocab=cls._unpack_strings(arrays["vocab"]),
+            offsets=arrays["offsets"],
+            doc_ids=arrays["doc_ids"],
+            term_freqs=arrays["term_freqs"],
+            doc_lens=arrays["doc_lens"],
+            pos_offsets=arrays["pos_offsets"] if "positions" in arrays else None,
+            positions=arrays["positions"] if "positions" in arrays else None,
+        )
+
+    def save_to_db(self, dbapi) -> None:
+        dbapi.save_lexical_index(self.NAME, self.to_bytes())
+        print(f"[{type(self).__name__}] Saved {self.NAME} ({len(self.keys)} passages, {len(self.vocab)} terms).")
+
+    @classmethod
+    def load_from_db(cls, dbapi) -> Optional["BM25Index"]:
+        """The persisted index, or None if it was never built."""
+        data = dbapi.load_lexical_index(cls.NAME)
+        return cls.from_bytes(data) if data is not None else None
+
+    @staticmethod
+    def _pack_strings(strings: List[str]) -> np.ndarray:
+        # One utf-8 blob instead of a fixed-width unicode array (4 bytes/char,
+        # padded to the longest key).
+        return np.frombuffer("\n".join(strings).encode("utf-8"), dtype=np.uint8)
+
+    @staticmethod
+    def _unpack_strings(packed: np.ndarray) -> List[str]:
+        text = packed.tobytes().decode("utf-8")
+        return text.split("\n") if text else []
@@ -0,0 +1,70 @@
+# bs"d - lehagdil torah velahadir
+
+import re
+from typing import Dict, List, Optional
+
+from backend.lexical_api.BM25Index import BM25Index
+
+# Cantillation (te'amim) and vowel points (niqqud), i.e. the Hebrew combining
+# marks. Maqaf, paseq, sof pasuq and nun hafukha are punctuation, not marks,
+# and are left to split words like any other non-letter.
+_HEB_MARKS_RE = re.compile(r"[\u0591-\u05BD\u05BF\u05C1\u05C2\u05C4\u05C5\u05C7]")
+# Geresh/gershayim (or ASCII quotes) inside a word mark an acronym or
+# abbreviation (רש"י, ר'); drop them so the acronym stays one token.
+_IN_WORD_QUOTE_RE = re.compile(r"(?<=[\u05D0-\u05EA])[\"'\u05F3\u05F4](?=[\u05D0-\u05EA])")
+_HEB_WORD_RE = re.compile(r"[\u05D0-\u05EA]+")
+_FINAL_LETTERS = str.maketrans("ךםןףץ", "כמנפצ")
+
+# One-letter prefixes (and, the, in, to, from, that) that attach to the word
+# they modify, possibly stacked: ובבית, שמהבית.
+_PREFIX_LETTERS = "והבלמש"
+_MAX_PREFIXES = 3
+_MIN_STEM_LEN = 2
+
+
+class HebrewTextIndex(BM25Index):
+    """
+    BM25 inverted index over the cleaned Hebrew text of each passage
+    (SourceContent.get_clean_heb_text), with token positions so quoted
+    phrases can be matched.
+
+    Tokens are the letters only: niqqud and cantillation stripped, final
+    forms folded (ם -> מ) so a prefix-stripped or inflected form lines up
+    with its base. Prefix letters are resolved at query time: a query word
+    matches every indexed word that is that word with up to three prefix
+    letters in front (בית matches הבית, ובבית, לבית), never the other way
+    around, so משה doesn't match שה.
+    """
+
+    NAME = "heb"
+    STORE_POSITIONS = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._by_stem: Optional[Dict[str, List[int]]] = None  # built on first query
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        text = _HEB_MARKS_RE.sub("", text)
+        text = _IN_WORD_QUOTE_RE.sub("", text)
+        return [word.translate(_FINAL_LETTERS) for word in _HEB_WORD_RE.findall(text)]
+
+    @staticmethod
+    def is_hebrew(text: str) -> bool:
+        return _HEB_WORD_RE.search(text) is not None
+
+    def _term_ids_for(self, term: str) -> List[int]:
+        if self._by_stem is None:
+            self._by_stem = self._build_stem_map()
+        return self._by_stem.get(term, [])
+
+    def _build_stem_map(self) -> Dict[str, List[int]]:
+        """Word -> ids of itself and of every indexed word that is it plus prefix letters."""
+        by_stem: Dict[str, List[int]] = {}
+        for term_id, term in enumerate(self.vocab):
+            by_stem.setdefault(term, []).append(term_id)
+            for n in range(1, _MAX_PREFIXES + 1):
+                if len(term) - n < _MIN_STEM_LEN or term[n - 1] not in _PREFIX_LETTERS:
+                    break
+                by_stem.setdefault(term[n:], []).append(term_id)
+        return by_stem
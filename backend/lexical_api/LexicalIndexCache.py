@@ -0,0 +1,76 @@
+# bs"d - lehagdil torah velahadir
+
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Optional, Type
+
+from backend.lexical_api.BM25Index import BM25Index
+
+
+@dataclass
+class _Entry:
+    index: Optional[BM25Index] = None
+    stamp: Optional[datetime] = None  # uploadDate of the persisted file index was loaded from
+    loaded: bool = False
+    checked_at: float = 0.0
+    # Held while this class's index is downloaded, so concurrent searches load it once.
+    load_lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class LexicalIndexCache:
+    """
+    Process-wide cache of the persisted lexical indexes (BM25Index and its
+    subclasses), shared by every SourceSearchHandler the way FaissEngine is,
+    so a handler built per search doesn't download and deserialize them again.
+
+    Each entry is keyed on its own GridFS file's uploadDate, read at most once
+    per check_interval_s: the populate script rebuilds the lexical indexes
+    after FAISS, on their own schedule. A reload happens under that class's
+    load lock only; meanwhile other searches keep using the previous index.
+    """
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self, check_interval_s: float = 30.0):
+        if getattr(self, "_initialized", False):
+            return
+        self._initialized = True
+
+        self.check_interval_s = check_interval_s
+        self._entries: Dict[Type[BM25Index], _Entry] = {}
+        self._lock = threading.Lock()  # guards _entries only; never held while loading
+
+    def get(self, index_cls: Type[BM25Index], dbapi) -> Optional[BM25Index]:
+        """The persisted index_cls, reloaded once its file changes; None if it was never built."""
+        with self._lock:
+            entry = self._entries.setdefault(index_cls, _Entry())
+        if entry.loaded and time.monotonic() - entry.checked_at < self.check_interval_s:
+            return entry.index
+        if entry.loaded:
+            if not entry.load_lock.acquire(blocking=False):
+                return entry.index  # another search is checking/reloading it
+        else:
+            entry.load_lock.acquire()  # nothing to serve yet: wait for the first load
+        try:
+            if entry.loaded and time.monotonic() - entry.checked_at < self.check_interval_s:
+                return entry.index
+            # Stamp first: a file replaced mid-download is merely loaded once more next time.
+            stamp = dbapi.get_lexical_index_upload_date(index_cls.NAME)
+            if not entry.loaded or stamp != entry.stamp:
+                entry.index = index_cls.load_from_db(dbapi)
+                entry.stamp = stamp
+                entry.loaded = True
+            entry.checked_at = time.monotonic()
+            return entry.index
+        finally:
+            entry.load_lock.release()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries = {}
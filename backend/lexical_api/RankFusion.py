@@ -0,0 +1,21 @@
+# bs"d - lehagdil torah velahadir
+
+from typing import Dict, List, Sequence
+
+# Standard RRF constant: damps the weight of the very top ranks so one list
+# can't dominate the fused order on its own.
+RRF_K = 60
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = RRF_K) -> List[str]:
+    """
+    Fuse several best-first key rankings into one. Every key scores
+    sum(1 / (k + rank)) over the lists it appears in, so agreeing lists
+    reinforce each other and only the ranks, never the raw (incomparable)
+    scores, matter. Ties keep the order keys were first seen in.
+    """
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(fused, key=fused.__getitem__, reverse=True)
@@ -1,8 +1,9 @@
 # bs"d - lehagdil torah velahadir
 
 from dataclasses import dataclass, field
-from typing import List
+from typing import Dict, List, Optional
 
+from backend.app.SourceSearchQuery import SourceSearchQuery
 from backend.models_db.EntityObjects.Entity import Entity
 from backend.models_db.Rel import Rel
 from backend.models_db.SourceClasses.SourceMetadata import SourceMetadata
@@ -19,4 +20,19 @@ class Answer:
     key: str = field(default="0")  # TODO: assign proper unique db key later
     ts: str = field(default_factory=lambda: SystemFunctions.get_ts_str())
     src_contents: List[SourceContent] = field(default_factory=list) #optional..
+    # src_metadata_lst is one page of the results, starting at offset. With a
+    # similarity ranking, ranked_keys is all of it and later pages are cut from
+    # it (SourceSearchHandler.get_page) instead of searching again; without
+    # one (None), later pages of query come from the db, already in order.
+    scores: Dict[str, float] = field(default_factory=dict)  # key -> similarity to free_text_input
+    offset: int = 0
+    total: int = 0
+    ranked_keys: Optional[List[str]] = field(default=None, repr=False)
+    query: Optional[SourceSearchQuery] = field(default=None, repr=False)
+
+    def total_found(self) -> int:
+        return self.total
+
+    def has_more(self) -> bool:
+        return self.offset + len(self.src_metadata_lst) < self.total_found()
 
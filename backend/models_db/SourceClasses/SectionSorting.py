@@ -126,4 +126,24 @@ def source_entry_sort_key(entry: Tuple[str, dict]) -> Tuple:
     return (book_order, get_section_sort_key(src_type_name, section))
 
 
+# ─────────────────────────── Stored (string) sort key ───────────────────────────
+
+_SORT_KEY_FIELD_WIDTH = 5
+
+
+def encode_sort_key(sort_key: Tuple) -> str:
+    """
+    Flatten a (possibly nested) sort-key tuple into a string that sorts the
+    same way, so it can be stored on a document and sorted on by MongoDB,
+    which can't compare tuples the way Python does.
+    Every number is zero-padded to a fixed width, so plain string comparison
+    matches tuple comparison (including a shorter key sorting first).
+    e.g. (0, 1, (6, 14)) -> '00000.00001.00006.00014'
+    """
+    flat = []
+    for part in sort_key:
+        flat.extend(part if isinstance(part, tuple) else (part,))
+    return ".".join(f"{int(n):0{_SORT_KEY_FIELD_WIDTH}d}" for n in flat)
+
+
 
@@ -5,7 +5,7 @@ from typing import Any
 
 from backend.db.data_names.Books import Book
 from backend.models_db.Enums import SourceType
-from backend.models_db.SourceClasses.SectionSorting import get_section_sort_key
+from backend.models_db.SourceClasses.SectionSorting import encode_sort_key, get_section_sort_key
 
 """ must be init w key"""
 @total_ordering
@@ -34,6 +34,17 @@ class SourceClass(ABC):
         section = self.get_section_from_key(self.key) if self.key else ""
         return src_type_priority, book_order, get_section_sort_key(src_type_name, section)
 
+    def stored_sort_key(self) -> str:
+        """sort_key() as a string, stored on source content and metadata documents
+        (DBFields.SORT_KEY) so the db can return them in canonical order."""
+        return encode_sort_key(self.sort_key())
+
+    @classmethod
+    def book_sort_key_prefix(cls, book: Book) -> str:
+        """The prefix every stored_sort_key() of a source in book starts with."""
+        src_type_priority = cls._SOURCE_TYPE_ORDER.get(book.source_type.name, 3)
+        return encode_sort_key((src_type_priority, book.order)) + "."
+
     def __eq__(self, other):
         if not isinstance(other, SourceClass):
             return NotImplemented
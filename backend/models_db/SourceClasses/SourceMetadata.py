@@ -14,6 +14,9 @@ class SourceMetadata(SourceClass):
     passage_types: List[PassageType] = field(default_factory=list)
     entity_keys: Set[str] = field(default_factory=set)
     rel_keys: Set[str] = field(default_factory=set)
+    # False when read with a slim projection: only the key is real, the fields
+    # above are empty until it is hydrated (DBapi.hydrate_source_metadata).
+    hydrated: bool = field(default=True, compare=False, repr=False)
 
     def __post_init__(self):
         if self.passage_types is None:
@@ -0,0 +1,219 @@
+# bs'd
+"""
+Recall / latency / size benchmarks of the approximate and compressed FAISS
+index types against the exact Flat index, and of chunked (multi-vector)
+passages against one vector per passage, on the real BT+TN corpus. Nothing
+is written to Mongo: the corpus is embedded once per test and every index
+type is built in memory.
+"""
+import time
+from typing import List, Tuple
+
+import faiss
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from backend.common import Paths
+from backend.db.Collections import CollectionObjs
+from backend.db.DBConstants import SrcContentProjections
+from backend.faiss_api.FaissEngine import FaissEngine
+from backend.faiss_api.FaissIndexFactory import FaissIndexFactory, FaissIndexType
+from backend.faiss_api.PassageChunker import ChunkAggregation, aggregate_chunk_hits, split_passage
+from backend.file_utils.FileTypeEnum import FileType
+from backend_pipeline.data_pipeline.DBScriptParentClass import DBParentClass
+from backend_pipeline.file_utils_pipeline import LocalPrinter
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+DIM = 384
+
+
+############################################## Shared helpers ###############################################
+
+def load_corpus(db_api) -> Tuple[List[str], List[str]]:
+    """Return (keys, clean English texts) for every BT and TN passage."""
+    keys, texts = [], []
+    for col in (CollectionObjs.BT, CollectionObjs.TN):
+        for src in db_api.iter_src_contents_of_collection(col, projection=SrcContentProjections.EN_ONLY):
+            keys.append(src.key)
+            texts.append(src.get_clean_en_text())
+    return keys, texts
+
+
+def sample_queries(texts: List[str], n: int, words: int = 12, seed: int = 0) -> List[str]:
+    """Short pseudo-queries: the opening words of randomly chosen passages."""
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(texts), size=min(n, len(texts)), replace=False)
+    return [" ".join(texts[i].split()[:words]) for i in picks]
+
+
+def sample_late_queries(texts: List[str], n: int, min_words: int, words: int = 12,
+                        seed: int = 0) -> Tuple[List[int], List[str]]:
+    """Pseudo-queries taken from the *end* of passages longer than min_words,
+    i.e. text a single truncated embedding never sees. Returns (passage ids, queries)."""
+    long_ids = [i for i, t in enumerate(texts) if len(t.split()) > min_words]
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(long_ids), size=min(n, len(long_ids)), replace=False)
+    ids = [long_ids[i] for i in picks]
+    return ids, [" ".join(texts[i].split()[-words:]) for i in ids]
+
+
+def passage_hit_rate(ranked_passages: List[np.ndarray], targets: List[int], k: int) -> float:
+    """Share of queries whose source passage is among the first k results."""
+    return float(np.mean([t in r[:k] for r, t in zip(ranked_passages, targets)]))
+
+
+def timed_search(index, query_vecs: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Search one query at a time (like the app does) and return (ids, per-query ms)."""
+    ids = np.empty((len(query_vecs), k), dtype="int64")
+    latencies_ms = np.empty(len(query_vecs))
+    for i, q in enumerate(query_vecs):
+        start = time.perf_counter()
+        _, found = index.search(q.reshape(1, -1), k)
+        latencies_ms[i] = (time.perf_counter() - start) * 1000
+        ids[i] = found[0]
+    return ids, latencies_ms
+
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray) -> float:
+    hits = sum(len(set(t) & set(f)) for t, f in zip(truth, found))
+    return hits / truth.size
+
+
+def build_index(index_type: FaissIndexType, vectors: np.ndarray):
+    index = FaissIndexFactory.create(index_type, DIM, expected_size=len(vectors))
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def rerank_exact(index, vectors: np.ndarray, query_vecs: np.ndarray, k: int, factor: int) -> np.ndarray:
+    """What FaissEngine does for compressed indexes with exact vectors stored:
+    over-fetch k*factor candidates, then order them by full-precision distance."""
+    _, candidates = index.search(query_vecs, k * factor)
+    ranked = np.empty((len(query_vecs), k), dtype="int64")
+    for i, (q, ids) in enumerate(zip(query_vecs, candidates)):
+        ids = ids[ids >= 0]
+        distances = ((vectors[ids] - q) ** 2).sum(axis=1)
+        ranked[i] = ids[np.argsort(distances)][:k]
+    return ranked
+
+
+class FaissIndexBenchmark(DBParentClass):
+
+    def setUp(self):
+        super().setUp()
+        self.model = SentenceTransformer(MODEL_NAME)
+
+    def tearDown(self):
+        super().tearDown()
+
+        ############################################## Benchmarks ###############################################
+
+    def test_compare_index_types(self, k: int = 20, n_queries: int = 300):
+        keys, texts = load_corpus(self.db_api)
+        print(f"{len(keys)} sources found")
+
+        vectors = self.model.encode(texts, convert_to_numpy=True, batch_size=256, show_progress_bar=True)
+        query_vecs = self.model.encode(sample_queries(texts, n_queries), convert_to_numpy=True)
+
+        flat = FaissIndexFactory.create(FaissIndexType.FLAT, DIM)
+        flat.add(vectors)
+        truth, flat_ms = timed_search(flat, query_vecs, k)
+
+        lines = [f"corpus={len(keys)} vectors, queries={len(query_vecs)}, k={k}",
+                 f"{'index':<10}{'recall@k':>10}{'p50 ms':>10}{'p99 ms':>10}{'build s':>10}"]
+        lines.append(self._row(FaissIndexType.FLAT, 1.0, flat_ms, 0.0))
+
+        for index_type in (FaissIndexType.HNSW, FaissIndexType.IVF_FLAT, FaissIndexType.IVF_PQ):
+            start = time.perf_counter()
+            index = build_index(index_type, vectors)
+            build_s = time.perf_counter() - start
+
+            found, latencies = timed_search(index, query_vecs, k)
+            lines.append(self._row(index_type, recall_at_k(truth, found), latencies, build_s))
+
+        report = "\n".join(lines)
+        print(report)
+        LocalPrinter.print_to_file(report, FileType.TXT, Paths.get_test_output_path("faiss_index_benchmark", "txt"))
+
+    def test_compare_compression(self, k: int = 20, n_queries: int = 300):
+        """Serialized size (what GridFS stores and each process loads) vs ranking quality."""
+        keys, texts = load_corpus(self.db_api)
+        vectors = self.model.encode(texts, convert_to_numpy=True, batch_size=256, show_progress_bar=True)
+        query_vecs = self.model.encode(sample_queries(texts, n_queries), convert_to_numpy=True)
+
+        flat = build_index(FaissIndexType.FLAT, vectors)
+        flat_bytes = faiss.serialize_index(flat).nbytes
+        _, truth = flat.search(query_vecs, k)
+
+        lines = [f"corpus={len(keys)} vectors, queries={len(query_vecs)}, k={k}, "
+                 f"re-rank factor={FaissEngine.RERANK_FACTOR}",
+                 f"{'index':<10}{'MB':>10}{'ratio':>8}{'recall@k':>10}{'reranked':>10}"]
+        lines.append(f"{'Flat':<10}{flat_bytes / 2 ** 20:>10.2f}{1.0:>8.1f}{1.0:>10.3f}{'-':>10}")
+
+        for index_type in (FaissIndexType.SQ8, FaissIndexType.PQ, FaissIndexType.IVF_PQ):
+            index = build_index(index_type, vectors)
+            size = faiss.serialize_index(index).nbytes
+            _, found = index.search(query_vecs, k)
+            reranked = rerank_exact(index, vectors, query_vecs, k, FaissEngine.RERANK_FACTOR)
+            lines.append(f"{index_type.value:<10}{size / 2 ** 20:>10.2f}{flat_bytes / size:>8.1f}"
+                         f"{recall_at_k(truth, found):>10.3f}{recall_at_k(truth, reranked):>10.3f}")
+
+        report = "\n".join(lines)
+        print(report)
+        LocalPrinter.print_to_file(report, FileType.TXT, Paths.get_test_output_path("faiss_compression_benchmark", "txt"))
+
+    def test_compare_chunking(self, k: int = 20, n_queries: int = 300, chunk_words: int = 150):
+        """
+        Single-vector vs chunked passages: how often a query lifted from the
+        opening / the end of a passage finds that passage in the top k, and
+        what the extra vectors cost in index size.
+        """
+        keys, texts = load_corpus(self.db_api)
+        opening_ids = list(np.random.default_rng(0).choice(len(texts), size=min(n_queries, len(texts)), replace=False))
+        opening_queries = [" ".join(texts[i].split()[:12]) for i in opening_ids]
+        late_ids, late_queries = sample_late_queries(texts, n_queries, min_words=chunk_words)
+        query_sets = [(opening_ids, self.model.encode(opening_queries, convert_to_numpy=True)),
+                      (late_ids, self.model.encode(late_queries, convert_to_numpy=True))]
+
+        single = build_index(FaissIndexType.FLAT, self.model.encode(
+            texts, convert_to_numpy=True, batch_size=256, show_progress_bar=True))
+
+        chunk_texts, owners = [], []
+        for i, text in enumerate(texts):
+            chunks = split_passage(text, chunk_words, FaissEngine.CHUNK_OVERLAP_WORDS)
+            chunk_texts.extend(chunks)
+            owners.extend([i] * len(chunks))
+        owners = np.asarray(owners, dtype=np.int32)
+        chunked = build_index(FaissIndexType.FLAT, self.model.encode(
+            chunk_texts, convert_to_numpy=True, batch_size=256, show_progress_bar=True))
+
+        lines = [f"corpus={len(keys)} passages -> {len(chunk_texts)} chunks of {chunk_words} words "
+                 f"(overlap {FaissEngine.CHUNK_OVERLAP_WORDS}), queries={n_queries}, k={k}",
+                 f"{'mode':<16}{'MB':>10}{'opening hit@k':>15}{'late hit@k':>12}"]
+
+        hits = []
+        for targets, query_vecs in query_sets:
+            _, found = single.search(query_vecs, k)
+            hits.append(passage_hit_rate(list(found), targets, k))
+        lines.append(f"{'single':<16}{faiss.serialize_index(single).nbytes / 2 ** 20:>10.2f}"
+                     f"{hits[0]:>15.3f}{hits[1]:>12.3f}")
+
+        chunked_mb = (faiss.serialize_index(chunked).nbytes + owners.nbytes) / 2 ** 20
+        for mode in ChunkAggregation:
+            hits = []
+            for targets, query_vecs in query_sets:
+                distances, found = chunked.search(query_vecs, k * FaissEngine.CHUNK_OVERFETCH)
+                ranked = [aggregate_chunk_hits(owners[f], 1.0 - d / 2.0, mode) for f, d in zip(found, distances)]
+                hits.append(passage_hit_rate(ranked, targets, k))
+            lines.append(f"{'chunked/' + mode.value:<16}{chunked_mb:>10.2f}{hits[0]:>15.3f}{hits[1]:>12.3f}")
+
+        report = "\n".join(lines)
+        print(report)
+        LocalPrinter.print_to_file(report, FileType.TXT, Paths.get_test_output_path("faiss_chunking_benchmark", "txt"))
+
+    @staticmethod
+    def _row(index_type: FaissIndexType, recall: float, latencies_ms: np.ndarray, build_s: float) -> str:
+        p50, p99 = np.percentile(latencies_ms, [50, 99])
+        return f"{index_type.value:<10}{recall:>10.3f}{p50:>10.3f}{p99:>10.3f}{build_s:>10.1f}"
@@ -0,0 +1,134 @@
+# bs'd
+"""
+PyTorch vs ONNX Runtime (fp32 / int8) query encoders: do they rank the same
+passages, and what do they cost per query and at process start-up.
+
+Rankings are compared on the live FAISS index (built with the torch model,
+as it always is), so "equivalent" means: the same top-k passages for the
+same query. Requires onnxruntime; the ONNX exports are made on first use.
+"""
+import subprocess
+import sys
+import time
+from typing import List
+
+import numpy as np
+
+from backend.common import Paths
+from backend.faiss_api.FaissEngine import FaissEngine
+from backend.faiss_api.QueryEncoder import OnnxQueryEncoder, QueryEncoderBackend
+from backend.file_utils.FileTypeEnum import FileType
+from backend_pipeline.QA.Benchmarks.FaissIndexBenchmark import MODEL_NAME, recall_at_k
+from backend_pipeline.data_pipeline.DBScriptParentClass import DBParentClass
+from backend_pipeline.file_utils_pipeline import LocalPrinter
+
+# Fixed query set: short user-style questions plus longer descriptive ones.
+QUERIES = [
+    "leading the battle",
+    "who was Rav Hisda",
+    "honoring father and mother",
+    "the laws of returning a lost object",
+    "Abraham argues with God over Sodom",
+    "damages caused by an ox goring",
+    "what is hateful to you do not do to your friend",
+    "the splitting of the Red Sea",
+    "when may one recite the Shema in the evening",
+    "a king who goes out to war and the priest anointed for battle addresses the people",
+    "prophecy about the destruction of the Temple and the exile",
+    "Elijah on Mount Carmel and the prophets of Baal",
+    "inheritance of daughters when there are no sons",
+    "repentance on Yom Kippur",
+    "the tower of Babel",
+    "Rabbi Akiva and his students",
+    "a vow annulled by a husband",
+    "lending money with interest",
+    "the spies sent to scout the land of Canaan",
+    "David and Goliath",
+]
+MIN_RECALL = {QueryEncoderBackend.ONNX: 0.99, QueryEncoderBackend.ONNX_INT8: 0.90}
+
+_STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+from backend.faiss_api.QueryEncoder import OnnxQueryEncoder, QueryEncoderBackend
+backend = QueryEncoderBackend({backend!r})
+if backend == QueryEncoderBackend.TORCH:
+    from sentence_transformers import SentenceTransformer
+    encoder = SentenceTransformer({model!r})
+else:
+    encoder = OnnxQueryEncoder.load({model!r}, quantized=backend == QueryEncoderBackend.ONNX_INT8)
+encoder.encode(["warm up"], convert_to_numpy=True)
+print(time.perf_counter() - start)
+"""
+
+
+class QueryEncoderBenchmark(DBParentClass):
+
+    def setUp(self):
+        super().setUp()
+        self.faiss = FaissEngine(dbapi=self.db_api)
+        self.encoders = {QueryEncoderBackend.TORCH: self.faiss.model}
+        for backend in (QueryEncoderBackend.ONNX, QueryEncoderBackend.ONNX_INT8):
+            self.encoders[backend] = OnnxQueryEncoder.load(
+                MODEL_NAME, quantized=backend == QueryEncoderBackend.ONNX_INT8)
+
+    def tearDown(self):
+        super().tearDown()
+
+        ############################################## Benchmarks ###############################################
+
+    def test_rankings_equivalent(self, k: int = 20):
+        vecs = {backend: self._encode(encoder, QUERIES) for backend, encoder in self.encoders.items()}
+        _, truth = self.faiss.index.search(vecs[QueryEncoderBackend.TORCH], k)
+
+        lines = [f"index={self.faiss.index.ntotal} vectors, queries={len(QUERIES)}, k={k}",
+                 f"{'backend':<12}{'recall@k':>10}{'top-1 same':>12}{'min cos':>10}"]
+        for backend in (QueryEncoderBackend.ONNX, QueryEncoderBackend.ONNX_INT8):
+            _, found = self.faiss.index.search(vecs[backend], k)
+            recall = recall_at_k(truth, found)
+            top1 = float(np.mean(truth[:, 0] == found[:, 0]))
+            min_cos = float((vecs[backend] * vecs[QueryEncoderBackend.TORCH]).sum(axis=1).min())
+            lines.append(f"{backend.value:<12}{recall:>10.3f}{top1:>12.3f}{min_cos:>10.4f}")
+            self.assertGreaterEqual(recall, MIN_RECALL[backend], f"{backend.value} ranks differently from torch")
+
+        self._report(lines, "query_encoder_equivalence")
+
+    def test_latency_and_startup(self, repeats: int = 5):
+        latencies = {backend: self._per_query_ms(encoder, repeats) for backend, encoder in self.encoders.items()}
+        lines = [f"queries={len(QUERIES)} x {repeats}, one at a time",
+                 f"{'backend':<12}{'p50 ms':>10}{'p99 ms':>10}{'startup s':>12}"]
+        for backend, ms in latencies.items():
+            lines.append(f"{backend.value:<12}{np.percentile(ms, 50):>10.2f}{np.percentile(ms, 99):>10.2f}"
+                         f"{self._startup_s(backend):>12.2f}")
+        self._report(lines, "query_encoder_latency")
+
+    ############################################## Helpers ###############################################
+
+    @staticmethod
+    def _encode(encoder, texts: List[str]) -> np.ndarray:
+        return np.asarray(encoder.encode(texts, convert_to_numpy=True), dtype="float32")
+
+    @staticmethod
+    def _per_query_ms(encoder, repeats: int) -> np.ndarray:
+        encoder.encode(["warm up"], convert_to_numpy=True)
+        ms = []
+        for _ in range(repeats):
+            for query in QUERIES:
+                start = time.perf_counter()
+                encoder.encode([query], convert_to_numpy=True)
+                ms.append((time.perf_counter() - start) * 1000)
+        return np.asarray(ms)
+
+    @staticmethod
+    def _startup_s(backend: QueryEncoderBackend) -> float:
+        """Import + load + first query, in a fresh interpreter (so torch isn't already imported)."""
+        script = _STARTUP_SCRIPT.format(backend=backend.value, model=MODEL_NAME)
+        out = subprocess.run([sys.executable, "-c", script], cwd=Paths.PROJECT_ROOT_DIR,
+                             capture_output=True, text=True, check=True)
+        return float(out.stdout.strip().splitlines()[-1])
+
+    @staticmethod
+    def _report(lines: List[str], name: str) -> None:
+        report = "\n".join(lines)
+        print(report)
+        LocalPrinter.print_to_file(report, FileType.TXT, Paths.get_test_output_path(name, "txt"))
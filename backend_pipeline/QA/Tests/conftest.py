@@ -3,6 +3,8 @@
 Shared test fixtures: a fake DBapiMongoDB that uses mongomock collections
 so we never touch real data.
 """
+import asyncio
+import time
 from unittest.mock import MagicMock
 from collections import defaultdict
 from copy import deepcopy
@@ -25,7 +27,7 @@ class FakeCollection:
 
     # ---- helpers ----
     def _matches(self, doc, filt):
-        """Very small query evaluator – supports top-level eq, $in, $or, $and, $regex, $exists."""
+        """Very small query evaluator – supports top-level eq, $in, $or, $and, $regex, $exists, $gte, $lt."""
         for key, val in filt.items():
             if key == "$or":
                 if not any(self._matches(doc, sub) for sub in val):
@@ -40,6 +42,10 @@ class FakeCollection:
                         return False
                     if not val["$exists"] and exists:
                         return False
+                if "$gte" in val and not (key in doc and doc[key] >= val["$gte"]):
+                    return False
+                if "$lt" in val and not (key in doc and doc[key] < val["$lt"]):
+                    return False
                 if "$in" in val:
                     field_val = doc.get(key)
                     # Mirror real MongoDB semantics: if the field is itself an
@@ -85,25 +91,45 @@ class FakeCollection:
                 return deepcopy(d)
         return None
 
-    def find(self, filt=None, projection=None):
+    def find(self, filt=None, projection=None, sort=None, batch_size=None, skip=0, limit=0):
         filt = filt or {}
-        return [deepcopy(d) for d in self._docs if self._matches(d, filt)]
+        docs = [deepcopy(d) for d in self._docs if self._matches(d, filt)]
+        for field, direction in reversed(sort or []):
+            docs.sort(key=lambda d: d[field], reverse=direction < 0)
+        docs = docs[skip:]
+        return docs[:limit] if limit else docs
+
+    @staticmethod
+    def _apply_update(doc, update):
+        if "$set" in update:
+            doc.update(update["$set"])
+        for field, amount in update.get("$inc", {}).items():
+            doc[field] = doc.get(field, 0) + amount
 
     def update_one(self, filt, update, upsert=False):
         for d in self._docs:
             if self._matches(d, filt):
-                if "$set" in update:
-                    d.update(update["$set"])
+                self._apply_update(d, update)
                 return MagicMock(modified_count=1, upserted_count=0, upserted_id=None)
         if upsert:
             new_doc = {**filt}
-            if "$set" in update:
-                new_doc.update(update["$set"])
+            self._apply_update(new_doc, update)
             new_doc.setdefault("_id", ObjectId())
             self._docs.append(new_doc)
             return MagicMock(modified_count=0, upserted_count=1, upserted_id=new_doc["_id"])
         return MagicMock(modified_count=0, upserted_count=0, upserted_id=None)
 
+    def find_one_and_update(self, filt, update, upsert=False, return_document=False):
+        for d in self._docs:
+            if self._matches(d, filt):
+                before = deepcopy(d)
+                self._apply_update(d, update)
+                return deepcopy(d) if return_document else before
+        if upsert:
+            self.update_one(filt, update, upsert=True)
+            return self.find_one(filt) if return_document else None
+        return None
+
     def update_many(self, filt, update):
         count = 0
         for d in self._docs:
@@ -174,3 +200,64 @@ class FakeDBapi:
         return _TestDB()
 
 
+
+
+# ---------------------------------------------------------------------------
+# Async (AsyncMongoClient-like) view of the same in-memory collections
+# ---------------------------------------------------------------------------
+class FakeAsyncCursor:
+
+    def __init__(self, collection, docs):
+        self._collection = collection
+        self._docs = docs
+
+    async def to_list(self, length=None):
+        await self._collection.round_trip("find")
+        return self._docs if length is None else self._docs[:length]
+
+
+class FakeAsyncCollection:
+    """Awaitable front for a FakeCollection. Every round trip takes `delay`
+    seconds and is logged as (collection name, op, start, end) in `log`."""
+
+    def __init__(self, collection: FakeCollection, name: str, delay: float = 0.0, log=None):
+        self._collection = collection
+        self.name = name
+        self.delay = delay
+        self.log = log
+
+    async def round_trip(self, op):
+        start = time.perf_counter()
+        await asyncio.sleep(self.delay)
+        if self.log is not None:
+            self.log.append((self.name, op, start, time.perf_counter()))
+
+    def find(self, filt=None, projection=None, sort=None, batch_size=None, skip=0, limit=0):
+        return FakeAsyncCursor(self, self._collection.find(filt, projection, sort, batch_size, skip, limit))
+
+    async def find_one(self, filt=None):
+        await self.round_trip("find_one")
+        return self._collection.find_one(filt)
+
+    async def count_documents(self, filt=None):
+        await self.round_trip("count_documents")
+        return self._collection.count_documents(filt)
+
+
+class FakeAsyncDBapi:
+    """
+    An AsyncDBapiMongoDB reading the collections of a FakeDBapi.
+    Usage:
+        db = FakeDBapi.create()
+        async_db = FakeAsyncDBapi.create(db, delay=0.05, log=[])
+    """
+
+    @staticmethod
+    def create(sync_db, delay: float = 0.0, log=None):
+        from backend.db.AsyncDBapiMongoDB import AsyncDBapiMongoDB
+
+        class _TestAsyncDB(AsyncDBapiMongoDB):
+            def get_collection(self, collection: Collection):
+                return FakeAsyncCollection(sync_db.get_collection(collection), collection.name, delay, log)
+
+        return _TestAsyncDB(sync_db)
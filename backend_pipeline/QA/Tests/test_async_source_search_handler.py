@@ -0,0 +1,123 @@
+# bs"d
+"""
+Tests for AsyncSourceSearchHandler: it must answer exactly like
+SourceSearchHandler, while overlapping query encoding with the db queries
+and running per-collection content fetches concurrently. The db is the
+in-memory conftest fake behind an async front; FAISS is a stand-in.
+"""
+import threading
+import time
+import unittest
+
+from backend.app.AsyncSourceSearchHandler import AsyncSourceSearchHandler
+from backend.app.SourceSearchHandler import SourceSearchHandler
+from backend.app.SourceSearchQuery import SourceSearchQuery
+from backend.db.Collections import CollectionObjs
+from backend.models_db.Enums import SourceType
+from backend.models_db.SourceClasses.SourceMetadata import SourceMetadata
+from conftest import FakeAsyncDBapi, FakeDBapi
+from test_source_search_handler import FakeFaiss
+
+TN_KEYS = [f"TN_Genesis_0_{i}:1" for i in range(1, 9)]
+BT_KEYS = [f"BT_Berakhot_0_{i}a:1" for i in range(2, 6)]
+
+
+class TimedFakeFaiss(FakeFaiss):
+    """FakeFaiss whose query encoding takes encode_s, logged like the db round trips."""
+
+    def __init__(self, log, encode_s=0.0):
+        super().__init__()
+        self.log = log
+        self.encode_s = encode_s
+        self.encoded = []
+
+    def encode_queries(self, queries):
+        self.encoded.extend(queries)
+        start = time.perf_counter()
+        time.sleep(self.encode_s)
+        self.log.append(("faiss", "encode", start, time.perf_counter()))
+
+
+class TestAsyncSourceSearchHandler(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.db = FakeDBapi.create()
+        for key in TN_KEYS + BT_KEYS:
+            self.db.insert_source_metadata(SourceMetadata(key=key, summary_en=f"summary {key}"))
+            collection = CollectionObjs.TN if key.startswith("TN_") else CollectionObjs.BT
+            self.db.get_collection(collection).insert_one({"key": key, "content": [f"en {key}", "heb", ""]})
+        self.log = []
+
+    def _handlers(self, delay=0.0, encode_s=0.0):
+        handler = SourceSearchHandler.__new__(SourceSearchHandler)  # skip the real db/FAISS set-up
+        handler.db_api = self.db
+        handler.faiss = TimedFakeFaiss(self.log, encode_s)
+        handler.lexical_cache = None  # no lexical ranking
+        handler.filter_index = None  # filter in the (fake) db
+        handler.result_cache = None
+        return handler, AsyncSourceSearchHandler(handler, FakeAsyncDBapi.create(self.db, delay, self.log))
+
+    async def test_answers_match_the_sync_handler(self):
+        queries = [SourceSearchQuery(free_text_similarity="x", max_sources=5),
+                   SourceSearchQuery(free_text_similarity="y", max_sources=3, offset=2, src_types=[SourceType.BT]),
+                   SourceSearchQuery(free_text_similarity="", max_sources=4, offset=6)]
+        handler, async_handler = self._handlers()
+        expected = handler.get_full_answers(queries)
+        answers = await async_handler.get_full_answers(queries)
+
+        for exp, ans in zip(expected, answers):
+            self.assertEqual([m.key for m in ans.src_metadata_lst], [m.key for m in exp.src_metadata_lst])
+            self.assertEqual([m.summary_en for m in ans.src_metadata_lst], [m.summary_en for m in exp.src_metadata_lst])
+            self.assertEqual([s.key for s in ans.src_contents], [s.key for s in exp.src_contents])
+            self.assertEqual((ans.scores, ans.total_found(), ans.ranked_keys),
+                             (exp.scores, exp.total_found(), exp.ranked_keys))
+
+        for exp, ans in zip(expected, answers):
+            exp_page, page = handler.get_page(exp, 5, 5), await async_handler.get_page(ans, 5, 5)
+            self.assertEqual([m.key for m in page.src_metadata_lst], [m.key for m in exp_page.src_metadata_lst])
+            self.assertEqual([s.key for s in page.src_contents], [s.key for s in exp_page.src_contents])
+
+    async def test_stages_overlap(self):
+        _, async_handler = self._handlers(delay=0.05, encode_s=0.05)
+        await async_handler.get_full_answer(SourceSearchQuery(free_text_similarity="x", max_sources=20))
+
+        def interval(name, op):
+            return next((start, end) for n, o, start, end in self.log if (n, o) == (name, op))
+
+        def overlap(a, b):
+            return a[0] < b[1] and b[0] < a[1]
+
+        encode = interval("faiss", "encode")
+        keys_fetch = next((start, end) for n, o, start, end in self.log if n == CollectionObjs.SRC_METADATA.name)
+        self.assertTrue(overlap(encode, keys_fetch), "query encoding waited for the filter query")
+        self.assertTrue(overlap(interval(CollectionObjs.TN.name, "find"), interval(CollectionObjs.BT.name, "find")),
+                        "content fetches of the two collections ran one after the other")
+
+    async def test_hebrew_query_without_a_hebrew_index_is_pre_encoded(self):
+        # With no Hebrew index the sync handler ranks a Hebrew query by FAISS, so it must be encoded up front too.
+        handler, async_handler = self._handlers()
+        await async_handler.get_answer_w_source_metadata(SourceSearchQuery(free_text_similarity="בראשית", max_sources=5))
+        self.assertEqual(handler.faiss.encoded, ["בראשית"])
+
+    async def test_result_cache_is_read_and_written_off_the_event_loop(self):
+        handler, async_handler = self._handlers()
+        threads = []
+
+        class RecordingCache:
+            def current_version(self):
+                return "v1"
+
+            def get(self, query, version):
+                threads.append(threading.current_thread())
+
+            def put(self, query, ans, version):
+                threads.append(threading.current_thread())
+
+        handler.result_cache = RecordingCache()
+        await async_handler.get_answer_w_source_metadata(SourceSearchQuery(free_text_similarity="x", max_sources=5))
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.current_thread(), threads)
+
+
+if __name__ == "__main__":
+    unittest.main()
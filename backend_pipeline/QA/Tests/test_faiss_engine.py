@@ -0,0 +1,662 @@
+# bs"d
+"""
+Tests for FaissEngine persistence/search behaviour, using an in-memory stand-in
+for the GridFS-backed FAISS mixin and a deterministic fake encoder so no real
+db or SentenceTransformer model is touched.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import numpy as np
+
+from backend.db.Collections import CollectionObjs
+from backend.faiss_api.FaissEngine import FaissEngine
+from backend.faiss_api.FaissIndexFactory import FaissIndexType
+from backend.faiss_api.PassageChunker import ChunkAggregation, aggregate_chunk_hits, split_passage
+from backend.models_db.Enums import SourceType
+
+
+DIM = 384
+
+
+class FakeFaissDB:
+    """Mimics the FaissMongoMixin surface FaissEngine relies on (state kept per shard; None = combined index)."""
+
+    def __init__(self):
+        self.dbs = {CollectionObjs.FS.db_name: object()}
+        self._stored = {}
+        self._vectors = {}
+        self._deltas = {}
+        self._clock = datetime(2025, 1, 1)
+        self.downloads = 0
+        self.uploaded_bytes = 0
+        self.upload_date_checks = 0
+        self.shard_listings = 0
+
+    def _tick(self):
+        self._clock += timedelta(seconds=1)
+        return self._clock
+
+    def save_faiss_index(self, index_bytes, metadata_bytes, vectors_bytes=None, shard=None):
+        self._stored[shard] = (index_bytes, metadata_bytes, self._tick())
+        self._vectors[shard] = vectors_bytes
+        self._deltas[shard] = []
+        self.uploaded_bytes += len(index_bytes) + len(metadata_bytes)
+
+    def append_faiss_delta(self, delta_bytes, shard=None):
+        self._deltas.setdefault(shard, []).append((delta_bytes, self._tick()))
+        self.uploaded_bytes += len(delta_bytes)
+        return len(self._deltas[shard])
+
+    def load_faiss_deltas(self, shard=None):
+        return [d for d, _ in self._deltas.get(shard, [])]
+
+    def load_faiss_vectors(self, shard=None):
+        return self._vectors.get(shard)
+
+    def load_faiss_index(self, shard=None):
+        data = self.load_faiss_index_with_upload_date(shard)
+        return data[:2] if data else None
+
+    def load_faiss_index_with_upload_date(self, shard=None):
+        if shard not in self._stored:
+            return None
+        self.downloads += 1
+        return self._stored[shard][0], self._stored[shard][1], self.get_faiss_index_upload_date(shard)
+
+    def clear_faiss_index(self, shard=None):
+        for state in (self._stored, self._vectors, self._deltas):
+            if shard is None:
+                state.clear()
+            else:
+                state.pop(shard, None)
+
+    def list_faiss_shards(self):
+        self.shard_listings += 1
+        return sorted(shard for shard in self._stored if shard is not None)
+
+    def get_faiss_index_upload_date(self, shard=None):
+        self.upload_date_checks += 1
+        if shard not in self._stored:
+            return None
+        deltas = self._deltas.get(shard)
+        return deltas[-1][1] if deltas else self._stored[shard][2]
+
+
+class FakeEncoder:
+    """Deterministic text -> unit vector, so identical texts embed identically."""
+
+    def encode(self, texts, **kwargs):
+        vecs = []
+        for text in texts:
+            rng = np.random.default_rng(abs(hash(text)) % (2 ** 32))
+            v = rng.standard_normal(DIM).astype("float32")
+            vecs.append(v / np.linalg.norm(v))
+        return np.vstack(vecs)
+
+
+class RecordingEncoder(FakeEncoder):
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, **kwargs):
+        self.calls.append(list(texts))
+        return super().encode(texts, **kwargs)
+
+
+def _docs(n, prefix="TN_Genesis_0_"):
+    return [{"key": f"{prefix}{i}:1-2", "content": f"passage number {i}"} for i in range(n)]
+
+
+def _keys(hits):
+    return [key for key, _ in hits]
+
+
+class FaissEngineTestBase(unittest.TestCase):
+
+    def setUp(self):
+        FaissEngine._instance = None  # undo the singleton between tests
+        self.cache_dir = tempfile.mkdtemp()
+        self.db = FakeFaissDB()
+        self._engines = []
+        self.engine = self._new_engine()
+        self.engine.clear_index()
+
+    def tearDown(self):
+        for engine in self._engines:
+            engine.stop_background_refresh()
+        FaissEngine._instance = None
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def _new_engine(self, **kwargs):
+        FaissEngine._instance = None
+        engine = FaissEngine(dbapi=self.db, cache_dir=self.cache_dir, **kwargs)
+        engine._model = FakeEncoder()
+        self._engines.append(engine)
+        return engine
+
+
+class TestLocalIndexCache(FaissEngineTestBase):
+
+    def test_new_process_opens_cache_without_download(self):
+        self.engine.populate_bulk(_docs(30), batch_size=8, checkpoint_every=100)
+        downloads_before = self.db.downloads
+
+        fresh = self._new_engine()
+        self.assertEqual(fresh.index.ntotal, 30)
+        self.assertIsNotNone(fresh._mmap_path)
+        self.assertEqual(self.db.downloads, downloads_before)
+
+    def test_stale_stamp_falls_back_to_gridfs(self):
+        self.engine.populate_bulk(_docs(10), batch_size=8)
+        for name in os.listdir(self.cache_dir):
+            os.remove(os.path.join(self.cache_dir, name))
+
+        fresh = self._new_engine()
+        self.assertEqual(fresh.index.ntotal, 10)
+        self.assertEqual(self.db.downloads, 1)
+        self.assertTrue(os.listdir(self.cache_dir))
+
+    def test_write_after_mmap_load_uses_private_copy(self):
+        self.engine.populate_bulk(_docs(10), batch_size=8)
+
+        fresh = self._new_engine()
+        fresh.add_documents([{"key": "TN_Genesis_0_99:1", "content": "new"}])
+        self.assertEqual(fresh.index.ntotal, 11)
+        # only the newest stamp is kept on disk
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+
+class TestSearchWithin(FaissEngineTestBase):
+
+    def test_matches_full_ranking_restricted_to_candidates(self):
+        docs = _docs(40)
+        self.engine.populate_bulk(docs, batch_size=16)
+        candidates = {d["key"] for d in docs[::3]}
+
+        full = [k for k in _keys(self.engine.search("passage number 7")) if k in candidates]
+        self.assertEqual(_keys(self.engine.search_within("passage number 7", candidates)), full)
+
+    def test_unknown_candidates_are_skipped(self):
+        self.engine.populate_bulk(_docs(5), batch_size=8)
+        ranked = _keys(self.engine.search_within("passage number 1", ["TN_Genesis_0_1:1-2", "BT_Nope_0_1a"]))
+        self.assertEqual(ranked, ["TN_Genesis_0_1:1-2"])
+
+
+class TestScoredSearch(FaissEngineTestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.engine.populate_bulk(_docs(30), batch_size=8)
+
+    def test_scores_are_cosine_similarities_best_first(self):
+        hits = self.engine.search("passage number 5", limit=10)
+        self.assertEqual(hits[0][0], "TN_Genesis_0_5:1-2")
+        self.assertAlmostEqual(hits[0][1], 1.0, places=4)  # the query is that passage's exact text
+        scores = [score for _, score in hits]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertTrue(all(-1.0 <= score <= 1.0 + 1e-5 for score in scores))
+
+    def test_pages_are_slices_of_the_full_ranking(self):
+        full = self.engine.search("passage number 5", limit=30)
+        self.assertEqual(self.engine.search("passage number 5", limit=10, offset=10), full[10:20])
+        self.assertEqual(self.engine.search("passage number 5", limit=10, offset=25), full[25:])
+
+    def test_max_distance_cuts_off_far_hits(self):
+        self.assertEqual(_keys(self.engine.search("passage number 5", max_distance=0.01)), ["TN_Genesis_0_5:1-2"])
+        within = self.engine.search_within("passage number 5", [d["key"] for d in _docs(30)], max_distance=0.01)
+        self.assertEqual(_keys(within), ["TN_Genesis_0_5:1-2"])
+
+    def test_search_within_scores_match_search(self):
+        full = dict(self.engine.search("passage number 5", limit=30))
+        for key, score in self.engine.search_within("passage number 5", ["TN_Genesis_0_3:1-2", "TN_Genesis_0_9:1-2"]):
+            self.assertAlmostEqual(score, full[key], places=5)
+
+
+class TestBatchedSearch(FaissEngineTestBase):
+
+    QUERIES = ["passage number 2", "passage number 17", "passage number 2", "passage number 9"]
+
+    def setUp(self):
+        super().setUp()
+        self.engine.populate_bulk(_docs(30), batch_size=8)
+        self.engine._model = RecordingEncoder()
+
+    def test_search_many_matches_single_searches_with_one_encode(self):
+        batched = self.engine.search_many(self.QUERIES, limit=5, offset=1)
+        self.assertEqual(self.engine._model.calls, [["passage number 2", "passage number 17", "passage number 9"]])
+        self.assertEqual(batched, [self.engine.search(q, limit=5, offset=1) for q in self.QUERIES])
+
+    def test_search_within_many_matches_search_within(self):
+        keys = [d["key"] for d in _docs(30)]
+        candidates = [keys[::2], keys[1::3], [], keys]
+        batched = self.engine.search_within_many(self.QUERIES, candidates, max_distance=1.5)
+        self.assertEqual(len(self.engine._model.calls), 1)
+        for query, keys_, hits in zip(self.QUERIES, candidates, batched):
+            expected = [(k, s) for k, s in self.engine.search(query, limit=30, max_distance=1.5) if k in keys_]
+            self.assertEqual(_keys(hits), _keys(expected))
+            for (_, score), (_, full_score) in zip(hits, expected):
+                self.assertAlmostEqual(score, full_score, places=5)
+
+
+    def test_src_type_pages_on_a_combined_index_are_full_and_continuous(self):
+        self.engine.add_documents(_docs(6, prefix="BT_Berakhot_0_"))  # 6 BT among 30 TN, in one index
+        query = "passage number 20"
+        expected = [k for k in _keys(self.engine.search(query, limit=36)) if k.startswith("BT_")]
+        pages = [_keys(self.engine.search(query, limit=4, offset=offset, src_types=[SourceType.BT]))
+                 for offset in (0, 4)]
+        self.assertEqual(pages, [expected[:4], expected[4:]])
+        self.assertEqual(self.engine.search_many([query, query], limit=4, src_types=[SourceType.TN]),
+                         [self.engine.search(query, limit=4, src_types=[SourceType.TN])] * 2)
+
+
+class TestIndexTypes(FaissEngineTestBase):
+
+    def test_index_type_survives_reload(self):
+        for index_type in FaissIndexType:
+            with self.subTest(index_type=index_type):
+                self.engine.clear_index(index_type=index_type)
+                self.engine.populate_bulk(_docs(500), batch_size=128)
+
+                fresh = self._new_engine()
+                self.assertEqual(fresh.index.ntotal, 500)
+                self.assertEqual(fresh.index_type, index_type)
+                self.assertEqual(_keys(fresh.search_within("passage number 3", ["TN_Genesis_0_3:1-2"])),
+                                 ["TN_Genesis_0_3:1-2"])
+                self.engine = fresh
+
+    def test_legacy_key_list_metadata_still_loads(self):
+        self.engine._apply_persisted_metadata(["TN_Genesis_0_1:1-2"])
+        self.assertEqual(self.engine.metadata, ["TN_Genesis_0_1:1-2"])
+        self.assertEqual(self.engine.index_type, FaissIndexType.FLAT)
+
+
+class TestCompressedStorage(FaissEngineTestBase):
+
+    def test_exact_rerank_matches_flat_ranking(self):
+        docs = _docs(1000)
+        self.engine.populate_bulk(docs, batch_size=128)
+        flat_top = _keys(self.engine.search("passage number 42", limit=10))
+
+        self.engine.clear_index(index_type=FaissIndexType.PQ, store_exact_vectors=True)
+        self.engine.populate_bulk(docs, batch_size=128)
+
+        fresh = self._new_engine()
+        self.assertEqual(_keys(fresh.search("passage number 42", limit=10))[0], flat_top[0])
+        self.assertTrue(fresh._can_rerank())
+        subset = flat_top[::-1]
+        self.assertEqual(_keys(fresh.search_within("passage number 42", subset)), flat_top)
+
+    def test_compressed_index_is_smaller(self):
+        import faiss
+        docs = _docs(1000)
+        self.engine.populate_bulk(docs, batch_size=128)
+        flat_size = faiss.serialize_index(self.engine.index).nbytes
+
+        self.engine.clear_index(index_type=FaissIndexType.SQ8)
+        self.engine.populate_bulk(docs, batch_size=128)
+        self.assertLess(faiss.serialize_index(self.engine.index).nbytes * 3, flat_size)
+        self.assertIsNone(self.db.load_faiss_vectors())
+
+
+class TestQueryEmbeddingCache(FaissEngineTestBase):
+
+    def test_repeated_query_is_encoded_once(self):
+        self.engine.populate_bulk(_docs(20), batch_size=8)
+        calls = []
+        encode = self.engine._model.encode
+        self.engine._model.encode = lambda texts, **kw: calls.append(texts) or encode(texts, **kw)
+
+        first = _keys(self.engine.search("passage number 3", limit=5))
+        second = _keys(self.engine.search("  passage   number 3 ", limit=5))
+        self.engine.search_within("passage number 3", ["TN_Genesis_0_3:1-2"])
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(calls), 1)
+        stats = self.engine.query_cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 1))
+
+    def test_lru_evicts_oldest(self):
+        from backend.faiss_api.QueryEmbeddingCache import QueryEmbeddingCache
+        cache = QueryEmbeddingCache(max_size=2)
+        for q in ("a", "b", "c"):
+            cache.put("m", q, np.zeros((1, 2)))
+        self.assertIsNone(cache.get("m", "a"))
+        self.assertIsNotNone(cache.get("m", "c"))
+        self.assertIsNone(cache.get("other-model", "c"))
+
+
+class TestQueryEncoderBackend(FaissEngineTestBase):
+
+    def test_from_config(self):
+        from backend.faiss_api.QueryEncoder import QueryEncoderBackend
+        self.assertEqual(QueryEncoderBackend.from_config(None), QueryEncoderBackend.TORCH)
+        self.assertEqual(QueryEncoderBackend.from_config(" ONNX_int8 "), QueryEncoderBackend.ONNX_INT8)
+        self.assertEqual(QueryEncoderBackend.from_config("tensorrt"), QueryEncoderBackend.TORCH)
+
+    def test_mean_pooling_ignores_padding(self):
+        from backend.faiss_api.QueryEncoder import mean_pool_normalize
+        tokens = np.random.default_rng(0).standard_normal((1, 3, 4)).astype("float32")
+        padded = np.concatenate([tokens, np.full((1, 2, 4), 100.0, dtype="float32")], axis=1)
+        expected = tokens.mean(axis=1)
+        expected /= np.linalg.norm(expected)
+        np.testing.assert_allclose(mean_pool_normalize(tokens, np.ones((1, 3))), expected, rtol=1e-5)
+        np.testing.assert_allclose(mean_pool_normalize(padded, np.array([[1, 1, 1, 0, 0]])), expected, rtol=1e-5)
+
+    def test_onnx_backend_encodes_queries_only(self):
+        from backend.faiss_api.QueryEncoder import QueryEncoderBackend
+        engine = self._new_engine(query_encoder=QueryEncoderBackend.ONNX_INT8)
+        engine.clear_index()
+        engine._onnx_encoder = RecordingEncoder()
+
+        engine.add_documents(_docs(10))
+        self.assertEqual(_keys(engine.search("passage number 4", limit=1)), ["TN_Genesis_0_4:1-2"])
+        self.assertEqual(engine._onnx_encoder.calls, [["passage number 4"]])  # documents went through the torch model
+        self.assertEqual(engine.query_cache_stats()["size"], 1)
+
+    def test_onnx_backend_without_onnxruntime_falls_back_to_torch(self):
+        from backend.faiss_api.QueryEncoder import OnnxQueryEncoder, QueryEncoderBackend
+        engine = self._new_engine(query_encoder=QueryEncoderBackend.ONNX)
+        engine.clear_index()
+        engine.add_documents(_docs(10))
+
+        with mock.patch.object(OnnxQueryEncoder, "load", side_effect=ImportError("No module named 'onnxruntime'")):
+            self.assertEqual(_keys(engine.search("passage number 4", limit=1)), ["TN_Genesis_0_4:1-2"])
+        self.assertEqual(engine.query_encoder_backend, QueryEncoderBackend.TORCH)
+        self.assertIs(engine.query_encoder, engine.model)
+
+
+class TestDeltaSegments(FaissEngineTestBase):
+
+    def _populate_without_compaction(self, docs, checkpoint_every):
+        compact = self.engine.compact
+        self.engine.compact = self.engine._save_delta_to_mongo  # simulate a crash before compaction
+        try:
+            self.engine.populate_bulk(docs, batch_size=10, checkpoint_every=checkpoint_every)
+        finally:
+            self.engine.compact = compact
+
+    def test_checkpoints_append_deltas_and_reload_merges_them(self):
+        docs = _docs(50)
+        self._populate_without_compaction(docs, checkpoint_every=10)
+        self.assertEqual(len(self.db.load_faiss_deltas()), 4)  # first checkpoint writes the base
+
+        fresh = self._new_engine()
+        self.assertEqual(fresh.index.ntotal, 50)
+        self.assertEqual(fresh.metadata, [d["key"] for d in docs])
+        self.assertEqual(_keys(fresh.search("passage number 44", limit=1)), ["TN_Genesis_0_44:1-2"])
+
+    def test_concurrent_first_searches_load_once(self):
+        docs = _docs(30)
+        self._populate_without_compaction(docs, checkpoint_every=10)
+        fresh = self._new_engine(refresh_interval_s=0)
+        load_deltas = self.db.load_faiss_deltas
+        self.db.load_faiss_deltas = lambda shard=None: time.sleep(0.05) or load_deltas(shard)  # widen the race
+        downloads = self.db.downloads
+
+        threads = [threading.Thread(target=lambda: fresh.index) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(self.db.downloads, downloads + 1)
+        self.assertEqual(fresh.metadata, [d["key"] for d in docs])
+        self.assertEqual(fresh.index.ntotal, 30)
+
+    def test_compaction_folds_deltas_into_base(self):
+        self._populate_without_compaction(_docs(30), checkpoint_every=10)
+        fresh = self._new_engine()
+        fresh.compact()
+        self.assertEqual(self.db.load_faiss_deltas(), [])
+
+        again = self._new_engine()
+        self.assertEqual(again.index.ntotal, 30)
+
+    def test_add_documents_compacts_once_deltas_pile_up(self):
+        self.engine.populate_bulk(_docs(40), batch_size=10)
+        self.engine.MAX_DELTA_SEGMENTS = 3
+        for i in range(2):
+            self.engine.add_documents(_docs(1, prefix=f"TN_Exodus_{i}_"))
+        self.assertEqual(len(self.db.load_faiss_deltas()), 2)
+
+        self.engine.add_documents(_docs(1, prefix="TN_Exodus_9_"))  # the third segment: compacted
+        self.assertEqual(self.db.load_faiss_deltas(), [])
+        self.assertEqual(self._new_engine().index.ntotal, 43)
+
+        self.engine.add_documents(_docs(11, prefix="TN_Numbers_0_"))  # 11 rows on a base of 43: over a quarter
+        self.assertEqual(self.db.load_faiss_deltas(), [])
+
+    def test_checkpoint_upload_is_linear(self):
+        self.engine.populate_bulk(_docs(200), batch_size=10, checkpoint_every=10)
+        # 20 checkpoints + final compaction: roughly two full copies, not ~20/2.
+        full_copy = len(self.db._stored[None][0])
+        self.assertLess(self.db.uploaded_bytes, 3 * full_copy)
+
+
+class TestBackgroundRefresh(FaissEngineTestBase):
+
+    def test_newer_index_is_swapped_in_without_per_query_check(self):
+        self.engine.populate_bulk(_docs(10), batch_size=10)
+        reader = self._new_engine(refresh_interval_s=3600)
+        self.assertEqual(len(reader.search("passage number 3")), 10)
+
+        writer = self._new_engine()
+        writer.populate_bulk(_docs(5, prefix="TN_Exodus_0_"), batch_size=10)
+        checks = self.db.upload_date_checks
+        self.assertEqual(len(reader.search("passage number 3")), 10)  # stale until the next tick
+        self.assertEqual(self.db.upload_date_checks, checks)
+
+        reader._refresh_if_stale()  # what the refresher thread does every tick
+        self.assertEqual(len(reader.search("passage number 3")), 15)
+
+    def test_refresher_thread_picks_up_new_data(self):
+        self.engine.populate_bulk(_docs(10), batch_size=10)
+        reader = self._new_engine(refresh_interval_s=0.05)
+        reader.search("passage number 1")
+        self.assertTrue(reader._refresher.is_alive())
+
+        writer = self._new_engine()
+        writer.add_documents(_docs(3, prefix="TN_Exodus_0_"))
+        deadline = time.time() + 5
+        while reader.index.ntotal != 13 and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(reader.index.ntotal, 13)
+
+    def test_disabled_refresher_checks_per_query(self):
+        reader = self._new_engine(refresh_interval_s=0)
+        reader.search("anything")
+        self.assertIsNone(reader._refresher)
+        self.assertGreater(self.db.upload_date_checks, 0)
+
+
+class TestSourceTypeShards(FaissEngineTestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.tn_docs, self.bt_docs = _docs(20), _docs(20, prefix="BT_Berakhot_0_")
+        self.engine.get_shard(SourceType.TN).populate_bulk(self.tn_docs, batch_size=8)
+        self.engine.get_shard(SourceType.BT).populate_bulk(self.bt_docs, batch_size=8)
+
+    def test_restricted_search_loads_only_its_shard(self):
+        fresh = self._new_engine()
+        hits = fresh.search("passage number 3", limit=5, src_types=[SourceType.TN])
+
+        self.assertEqual(hits[0][0], "TN_Genesis_0_3:1-2")
+        self.assertTrue(all(key.startswith("TN_") for key, _ in hits))
+        self.assertEqual(set(fresh._shards), {SourceType.TN})
+        self.assertIsNone(fresh._index)  # the combined index is never touched
+
+    def test_unrestricted_search_merges_shards_by_score(self):
+        hits = self._new_engine().search("passage number 3", limit=6)
+        self.assertEqual({key for key, _ in hits[:2]}, {"TN_Genesis_0_3:1-2", "BT_Berakhot_0_3:1-2"})
+        scores = [score for _, score in hits]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_search_within_reads_only_the_candidates_shards(self):
+        fresh = self._new_engine()
+        hits = fresh.search_within("passage number 3", ["BT_Berakhot_0_3:1-2", "BT_Berakhot_0_9:1-2"])
+        self.assertEqual(_keys(hits), ["BT_Berakhot_0_3:1-2", "BT_Berakhot_0_9:1-2"])
+        self.assertEqual(set(fresh._shards), {SourceType.BT})
+
+    def test_rebuilding_one_shard_keeps_the_others(self):
+        bt = self.engine.get_shard(SourceType.BT)
+        bt.clear_index()
+        bt.populate_bulk(self.bt_docs[:5], batch_size=8)
+
+        fresh = self._new_engine()
+        self.assertEqual(fresh.get_shard(SourceType.BT).index.ntotal, 5)
+        self.assertEqual(fresh.get_shard(SourceType.TN).index.ntotal, 20)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 4)  # each shard keeps its own cached copy
+
+    def test_warm_up_loads_every_shard_and_the_encoder(self):
+        fresh = self._new_engine(refresh_interval_s=0)
+        fresh._model = RecordingEncoder()
+        fresh.warm_up()
+        self.assertEqual({t: s._index.ntotal for t, s in fresh._shards.items()}, {SourceType.BT: 20, SourceType.TN: 20})
+        self.assertEqual(fresh._model.calls, [["warm up"]])
+        self.assertEqual(fresh.query_cache_stats()["size"], 0)
+
+    def test_refresher_picks_up_a_new_shard_off_the_request_path(self):
+        reader = self._new_engine(refresh_interval_s=0.05)
+        reader.search("passage number 3", limit=5)
+        self.assertTrue(reader._refresher.is_alive())  # started by the combined engine, not just its shards
+
+        self._new_engine().get_shard(SourceType.MS).populate_bulk(_docs(5, prefix="MS_Berakhot_0_"), batch_size=8)
+        deadline = time.time() + 5
+        while SourceType.MS not in reader._persisted_shards and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertIn(SourceType.MS, reader._persisted_shards)
+
+        reader.stop_background_refresh()
+        reader.refresh_interval_s = 3600  # no tick during the search below
+        listings = self.db.shard_listings
+        hits = reader.search("passage number 3", limit=20, src_types=[SourceType.MS])
+        self.assertEqual(hits[0][0], "MS_Berakhot_0_3:1-2")
+        self.assertEqual(self.db.shard_listings, listings)  # the search itself never lists
+
+    def test_added_documents_go_to_their_shard(self):
+        self.engine.add_documents([{"key": "TN_Exodus_0_1:1", "content": "new tanach passage"},
+                                   {"key": "BT_Shabbat_0_2a:1", "content": "new talmud passage"}])
+        fresh = self._new_engine()
+        self.assertEqual(fresh.get_shard(SourceType.TN).index.ntotal, 21)
+        self.assertEqual(fresh.get_shard(SourceType.BT).index.ntotal, 21)
+
+
+class TestChunkedIndex(FaissEngineTestBase):
+
+    CHUNK_WORDS = 40
+
+    def _long_docs(self, n, words=100):
+        return [{"key": f"BT_Shabbat_0_{i}a:1-9", "content": " ".join(f"d{i}w{j}" for j in range(words))}
+                for i in range(n)]
+
+    def _last_chunk(self, doc):
+        return split_passage(doc["content"], self.CHUNK_WORDS, FaissEngine.CHUNK_OVERLAP_WORDS)[-1]
+
+    def test_split_passage_overlaps_and_covers_the_end(self):
+        words = [f"w{i}" for i in range(100)]
+        chunks = split_passage(" ".join(words), 40, 10)
+        self.assertEqual([c.split()[0] for c in chunks], ["w0", "w30", "w60"])
+        self.assertEqual(chunks[-1].split()[-1], "w99")
+        self.assertEqual(split_passage("short text", 40, 10), ["short text"])
+
+    def test_aggregation_modes(self):
+        owners = np.array([0, 1, 1, 1, 0])
+        sims = np.array([0.9, 0.8, 0.7, 0.7, 0.1])
+        self.assertEqual(aggregate_chunk_hits(owners, sims, ChunkAggregation.MAX).tolist(), [0, 1])
+        self.assertEqual(aggregate_chunk_hits(owners, sims, ChunkAggregation.SUM_TOP_N, top_n=3).tolist(), [1, 0])
+
+    def test_late_content_is_searchable(self):
+        docs = self._long_docs(20)
+        self.engine.clear_index(chunk_words=self.CHUNK_WORDS)
+        self.engine.populate_bulk(docs, batch_size=8)
+
+        self.assertGreater(self.engine.index.ntotal, len(docs))
+        self.assertEqual(len(self.engine.metadata), len(docs))
+        self.assertEqual(_keys(self.engine.search(self._last_chunk(docs[7]), limit=1)), [docs[7]["key"]])
+        results = _keys(self.engine.search(self._last_chunk(docs[7]), limit=5))
+        self.assertEqual(len(results), len(set(results)))  # one entry per passage, not per chunk
+
+        candidates = [docs[3]["key"], docs[7]["key"], docs[12]["key"]]
+        self.assertEqual(_keys(self.engine.search_within(self._last_chunk(docs[12]), candidates))[0], docs[12]["key"])
+
+    def test_chunk_map_survives_deltas_and_reload(self):
+        docs = self._long_docs(30)
+        self.engine.clear_index(chunk_words=self.CHUNK_WORDS)
+        compact = self.engine.compact
+        self.engine.compact = self.engine._save_delta_to_mongo  # leave the checkpoints as deltas
+        try:
+            self.engine.populate_bulk(docs, batch_size=10, checkpoint_every=10)
+        finally:
+            self.engine.compact = compact
+
+        fresh = self._new_engine()
+        self.assertGreater(fresh.index.ntotal, len(docs))
+        self.assertEqual(fresh.chunk_words, self.CHUNK_WORDS)
+        self.assertEqual(fresh.metadata, [d["key"] for d in docs])
+        self.assertEqual(len(fresh._owner_ids()), fresh.index.ntotal)
+        self.assertEqual(_keys(fresh.search(self._last_chunk(docs[25]), limit=1)), [docs[25]["key"]])
+
+        fresh.add_documents(self._long_docs(31)[30:])
+        self.assertEqual(_keys(fresh.search(self._last_chunk(self._long_docs(31)[30]), limit=1)),
+                         ["BT_Shabbat_0_30a:1-9"])
+
+
+    def test_candidate_chunks_come_from_the_passage_map(self):
+        docs = self._long_docs(12)
+        self.engine.clear_index(chunk_words=self.CHUNK_WORDS)
+        self.engine.populate_bulk(docs, batch_size=5)
+        self.engine.add_documents(self._long_docs(14)[12:])
+
+        keys = [docs[2]["key"], "BT_Shabbat_0_13a:1-9", "not indexed", docs[0]["key"]]
+        passage_ids = [self.engine.metadata.index(k) for k in keys if k in self.engine.metadata]
+        full_scan = np.flatnonzero(np.isin(self.engine._owner_ids(), passage_ids))
+        np.testing.assert_array_equal(self.engine._ids_for_keys(keys), full_scan)
+        self.assertEqual(self.engine._ids_for_keys(["not indexed"]).size, 0)
+
+class TestPopulateEncoded(FaissEngineTestBase):
+    """The single-writer side of the multi-process EmbeddingPipeline."""
+
+    def _encoded_batches(self, docs, batch_size):
+        for i in range(0, len(docs), batch_size):
+            batch = docs[i:i + batch_size]
+            yield [d["key"] for d in batch], FakeEncoder().encode([d["content"] for d in batch]), None
+
+    def test_matches_populate_bulk(self):
+        docs = _docs(40)
+        self.engine.populate_encoded(self._encoded_batches(docs, 7), total=len(docs), checkpoint_every=10)
+
+        fresh = self._new_engine()
+        self.assertEqual(_keys(fresh.search("passage number 17", limit=1)), ["TN_Genesis_0_17:1-2"])
+        self.assertEqual(fresh.metadata, [d["key"] for d in docs])
+
+    def test_streamed_batches_train_the_index_first(self):
+        docs = _docs(1000)
+        self.engine.clear_index(index_type=FaissIndexType.IVF_FLAT)
+        self.engine.populate_encoded(self._encoded_batches(docs, 100), train_sample_size=300)
+
+        self.assertTrue(self.engine.index.is_trained)
+        self.assertEqual(self.engine.index.ntotal, 1000)
+        self.assertEqual(self.engine.metadata, [d["key"] for d in docs])
+
+    def test_pipeline_batches_skip_indexed_and_duplicate_keys(self):
+        from backend.faiss_api.EmbeddingPipeline import EmbeddingPipeline
+
+        self.engine.populate_bulk(_docs(5), batch_size=5)
+        pipeline = EmbeddingPipeline(self.engine, workers=1, batch_size=4)
+        sources = [(d["key"], d["content"]) for d in _docs(12)] + [("TN_Genesis_0_11:1-2", "dup")]
+        batches = list(pipeline._batches(sources))
+
+        self.assertEqual([len(b) for b in batches], [4, 3])
+        self.assertEqual(batches[0][0][0], "TN_Genesis_0_5:1-2")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,219 @@
+# bs"d
+"""
+Tests for the BM25 keyword index, the Hebrew full-text index, and how
+SourceSearchHandler.order_by_faiss_similarity combines them with FAISS.
+"""
+import threading
+import unittest
+from types import SimpleNamespace
+
+from backend.app.SourceSearchHandler import SourceSearchHandler
+from backend.lexical_api.BM25Index import BM25Index
+from backend.lexical_api.HebrewTextIndex import HebrewTextIndex
+from backend.lexical_api.LexicalIndexCache import LexicalIndexCache
+from backend.lexical_api.RankFusion import reciprocal_rank_fusion
+
+
+DOCS = [
+    {"key": "BT_Berakhot_0_2a:1", "content": "From when may one recite the Shema in the evening?"},
+    {"key": "BT_Berakhot_0_5a:3", "content": "Rav Hisda said: one who sees suffering should examine his deeds."},
+    {"key": "BT_Shabbat_0_31a:6", "content": "Hillel said: what is hateful to you, do not do to your friend."},
+    {"key": "TN_Genesis_0_1:1-5", "content": "In the beginning God created the heaven and the earth."},
+    {"key": "TN_Genesis_0_2:1-3", "content": "The heaven and the earth were finished, and God rested."},
+]
+
+HEB_DOCS = [
+    {"key": "TN_Genesis_0_1:1-5", "content": "בְּרֵאשִׁ֖ית בָּרָ֣א אֱלֹהִ֑ים אֵ֥ת הַשָּׁמַ֖יִם וְאֵ֥ת הָאָֽרֶץ"},
+    {"key": "TN_Exodus_0_12:3-5", "content": "שה תמים זכר בן שנה יהיה לכם ברא אלהים"},
+    {"key": "TN_Psalms_0_55:15", "content": "ובבית אלהים נהלך ברגש"},
+    {"key": "BT_Berakhot_0_4b:1", "content": "אמר ר' יוחנן ויאמר משה אל העם בבית המקדש"},
+]
+
+
+class FakeLexicalDB:
+
+    def __init__(self):
+        self.files = {}
+        self.upload_dates = {}
+        self.saves = 0
+        self.loads = 0
+
+    def save_lexical_index(self, name, index_bytes):
+        self.files[name] = index_bytes
+        self.saves += 1
+        self.upload_dates[name] = self.saves  # stands in for the GridFS uploadDate
+
+    def get_lexical_index_upload_date(self, name):
+        return self.upload_dates.get(name)
+
+    def load_lexical_index(self, name):
+        self.loads += 1
+        return self.files.get(name)
+
+
+class TestBM25Index(unittest.TestCase):
+
+    def setUp(self):
+        self.index = BM25Index.build(DOCS)
+        self.all_keys = [d["key"] for d in DOCS]
+
+    def test_rare_name_ranks_its_passage_first(self):
+        self.assertEqual(self.index.rank_within("what did Rav Ḥisda say", self.all_keys)[0],
+                         "BT_Berakhot_0_5a:3")
+
+    def test_rarer_term_outweighs_common_one(self):
+        ranked = self.index.rank_within("God rested", self.all_keys)
+        self.assertEqual(ranked, ["TN_Genesis_0_2:1-3", "TN_Genesis_0_1:1-5"])
+
+    def test_only_matching_candidates_are_returned(self):
+        ranked = self.index.rank_within("heaven", ["TN_Genesis_0_1:1-5", "BT_Shabbat_0_31a:6", "unknown"])
+        self.assertEqual(ranked, ["TN_Genesis_0_1:1-5"])
+        self.assertEqual(self.index.rank_within("the of and", self.all_keys), [])
+
+    def test_round_trip_through_db(self):
+        db = FakeLexicalDB()
+        self.index.save_to_db(db)
+        loaded = BM25Index.load_from_db(db)
+
+        self.assertEqual(loaded.keys, self.index.keys)
+        self.assertEqual(loaded.vocab, self.index.vocab)
+        self.assertEqual(loaded.scores("Hillel friend").tolist(), self.index.scores("Hillel friend").tolist())
+        self.assertIsNone(BM25Index.load_from_db(FakeLexicalDB()))
+
+
+class TestRankFusion(unittest.TestCase):
+
+    def test_agreement_beats_a_single_top_rank(self):
+        fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "c", "d"]])
+        self.assertEqual(fused[0], "b")
+        self.assertEqual(set(fused), {"a", "b", "c", "d"})
+
+    def test_ties_keep_first_seen_order(self):
+        self.assertEqual(reciprocal_rank_fusion([["x", "y"], ["y", "x"]]), ["x", "y"])
+
+
+class TestHybridOrdering(unittest.TestCase):
+
+    def setUp(self):
+        LexicalIndexCache._instance = None
+
+    def tearDown(self):
+        LexicalIndexCache._instance = None
+
+    def _handler(self, semantic_order, lexical_db):
+        handler = SourceSearchHandler.__new__(SourceSearchHandler)  # skip the real db/FAISS set-up
+        handler.db_api = lexical_db
+        handler.faiss = SimpleNamespace(
+            search_within=lambda text, keys, max_distance=None: [
+                (k, 1.0 - i / 100) for i, k in enumerate(semantic_order) if k in set(keys)],
+        )
+        handler.lexical_cache = LexicalIndexCache(check_interval_s=0)
+        handler.filter_index = None  # filter in the (fake) db
+        return handler
+
+    def test_keyword_match_is_promoted(self):
+        db = FakeLexicalDB()
+        BM25Index.build(DOCS).save_to_db(db)
+        # semantic ranking puts the Hisda passage last
+        semantic = [d["key"] for d in DOCS if d["key"] != "BT_Berakhot_0_5a:3"] + ["BT_Berakhot_0_5a:3"]
+        handler = self._handler(semantic, db)
+        keys = [d["key"] for d in DOCS]
+
+        ordered, scores = handler.order_by_faiss_similarity("Rav Hisda", keys)
+        self.assertEqual(ordered[0], "BT_Berakhot_0_5a:3")
+        self.assertEqual(set(scores), {d["key"] for d in DOCS})
+        self.assertEqual(len(ordered), len(DOCS))
+
+        handler.order_by_faiss_similarity("Rav Hisda", keys)
+        self.assertEqual(db.loads, 2)  # once per lexical index, until its file changes
+
+        other = self._handler(semantic, db)  # the frontend builds a handler per search
+        other.order_by_faiss_similarity("Rav Hisda", keys)
+        self.assertEqual(db.loads, 2)
+        BM25Index.build(DOCS[:3]).save_to_db(db)  # rebuilt after FAISS: only BM25 is reloaded
+        other.order_by_faiss_similarity("Rav Hisda", keys)
+        self.assertEqual(db.loads, 3)
+        self.assertEqual(len(other._get_lexical_index(BM25Index).keys), 3)
+
+    def test_without_lexical_index_order_is_semantic(self):
+        semantic = [d["key"] for d in reversed(DOCS)]
+        handler = self._handler(semantic, FakeLexicalDB())
+        keys = [d["key"] for d in DOCS]
+        ordered, _ = handler.order_by_faiss_similarity("Hillel", keys)
+        self.assertEqual(ordered, semantic)
+
+    def test_hebrew_query_uses_hebrew_index(self):
+        db = FakeLexicalDB()
+        HebrewTextIndex.build(HEB_DOCS).save_to_db(db)
+        semantic = [d["key"] for d in HEB_DOCS]
+        handler = self._handler(semantic, db)
+        keys = [d["key"] for d in HEB_DOCS]
+
+        ordered, scores = handler.order_by_faiss_similarity("משה", keys)
+        self.assertEqual(ordered[0], "BT_Berakhot_0_4b:1")
+        self.assertEqual(scores, {})
+        self.assertEqual(len(ordered), len(HEB_DOCS))
+
+
+class TestLexicalIndexCache(unittest.TestCase):
+
+    def setUp(self):
+        LexicalIndexCache._instance = None
+        self.cache = LexicalIndexCache(check_interval_s=0)
+
+    def tearDown(self):
+        LexicalIndexCache._instance = None
+
+    def test_reload_does_not_hold_up_other_searches(self):
+        db = FakeLexicalDB()
+        BM25Index.build(DOCS).save_to_db(db)
+        old = self.cache.get(BM25Index, db)
+
+        BM25Index.build(DOCS[:2]).save_to_db(db)
+        release, loading = threading.Event(), threading.Event()
+        load = db.load_lexical_index
+        db.load_lexical_index = lambda name: loading.set() or release.wait(5) and load(name)
+        reloader = threading.Thread(target=self.cache.get, args=(BM25Index, db))
+        reloader.start()
+        self.assertTrue(loading.wait(5))
+
+        self.assertIs(self.cache.get(BM25Index, db), old)  # served while the reload downloads
+        self.assertIsNone(self.cache.get(HebrewTextIndex, FakeLexicalDB()))  # other classes aren't blocked
+        release.set()
+        reloader.join(5)
+        self.assertEqual(len(self.cache.get(BM25Index, db).keys), 2)
+
+
+class TestHebrewTextIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = HebrewTextIndex.build(HEB_DOCS)
+
+    def test_tokenize_strips_marks_and_folds_final_letters(self):
+        self.assertEqual(HebrewTextIndex.tokenize("בְּרֵאשִׁ֖ית בָּרָ֣א אֱלֹהִ֑ים כל־העם רש\"י"),
+                         ["בראשית", "ברא", "אלהימ", "כל", "העמ", "רשי"])
+
+    def test_query_with_niqqud_matches_plain_text(self):
+        self.assertEqual(self.index.search("אֱלֹהִים"),
+                         self.index.search("אלהים"))
+        self.assertEqual(len(self.index.search("אלהים")), 3)
+
+    def test_prefixed_forms_match_base_word_only(self):
+        self.assertEqual(set(self.index.search("בית")), {"TN_Psalms_0_55:15", "BT_Berakhot_0_4b:1"})
+        self.assertEqual(self.index.search("ארץ"), ["TN_Genesis_0_1:1-5"])  # הארץ
+        # משה must not match שה, even though מ is a prefix letter
+        self.assertEqual(self.index.search("משה"), ["BT_Berakhot_0_4b:1"])
+
+    def test_phrase_requires_adjacent_words(self):
+        self.assertEqual(set(self.index.search('"ברא אלהים"')), {"TN_Genesis_0_1:1-5", "TN_Exodus_0_12:3-5"})
+        self.assertEqual(self.index.search('"בית אלהים"'), ["TN_Psalms_0_55:15"])
+        self.assertEqual(self.index.search('"אלהים ברא"'), [])
+
+    def test_positions_survive_round_trip(self):
+        loaded = HebrewTextIndex.from_bytes(self.index.to_bytes())
+        self.assertEqual(loaded.search('"ברא אלהים"'), self.index.search('"ברא אלהים"'))
+        self.assertEqual(loaded.positions.tolist(), self.index.positions.tolist())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -32,13 +32,17 @@ class QuerysFromCSVTests(unittest.TestCase):
 ############################################# 1. Basic Tests ####################################################
     def test_print_query_from_csv(self):
         query_rows = self.get_BT_live_query_from_csv()
+        real_qs = []
         for q in query_rows:
             real_q = q.to_query_from_user(SourceType.BT)
 
             # when zscalar on, uncomment this line:
             real_q.free_text_similarity = ''
+            real_qs.append(real_q)
 
-            ans = self.qaHandler.get_full_answer(real_q)
+        # all rows in one batch: one encoder call, one FAISS pass, each source fetched once
+        answers = self.qaHandler.get_full_answers(real_qs)
+        for q, ans in zip(query_rows, answers):
             html_ans = self.htmlWriter.get_full_html(ans)
             path = os.path.join(Paths.QUESTIONS_OUTPUT_DIR, q.query_name)
             LocalPrinter.print_to_file(html_ans, FileType.HTML, path)
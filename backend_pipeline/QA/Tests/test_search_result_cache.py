@@ -0,0 +1,91 @@
+# bs"d
+"""
+Tests for SearchResultCache: canonical query hashing, version-based
+invalidation and the shared disk tier, through SourceSearchHandler with the
+in-memory db/FAISS stand-ins of test_source_search_handler.
+"""
+import tempfile
+import unittest
+from datetime import datetime
+
+from backend.app.SearchResultCache import SearchResultCache
+from backend.app.SourceSearchQuery import SourceSearchQuery
+from backend.models_db.Enums import PassageType, SourceType
+from test_source_search_handler import make_handler
+
+
+class TestSearchResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.handler = make_handler()
+        self.cache = self.handler.result_cache
+
+    def tearDown(self):
+        SearchResultCache._instance = None
+
+    def test_equivalent_queries_hash_the_same(self):
+        a = SourceSearchQuery(free_text_similarity="  rav  hisda", max_sources=5,
+                              src_types=[SourceType.TN, SourceType.BT], entity_ids=["E2", "E1"])
+        b = SourceSearchQuery(free_text_similarity="rav hisda ", max_sources=5,
+                              src_types=[SourceType.BT, SourceType.TN], entity_ids=["E1", "E2"])
+        self.assertEqual(SearchResultCache.query_hash(a), SearchResultCache.query_hash(b))
+        for changed in (SourceSearchQuery(free_text_similarity="rav hisda", max_sources=5, offset=5),
+                        SourceSearchQuery(free_text_similarity="rav hisda", max_sources=5,
+                                          passage_types=[list(PassageType)[0]])):
+            self.assertNotEqual(SearchResultCache.query_hash(a), SearchResultCache.query_hash(changed))
+
+    def test_repeated_search_skips_db_and_faiss(self):
+        query = SourceSearchQuery(free_text_similarity="x", max_sources=5)
+        first = self.handler.get_full_answer(query)
+        again = self.handler.get_full_answer(SourceSearchQuery(free_text_similarity=" x", max_sources=5))
+
+        self.assertEqual(self.handler.faiss.searches, 1)
+        self.assertEqual([m.key for m in again.src_metadata_lst], [m.key for m in first.src_metadata_lst])
+        self.assertEqual([s.key for s in again.src_contents], [s.key for s in first.src_contents])
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_metadata_change_invalidates(self):
+        query = SourceSearchQuery(free_text_similarity="x", max_sources=5)
+        self.handler.get_answer_w_source_metadata(query)
+        self.handler.db_api.src_metadata_version += 1
+        self.cache.version_ttl_s = 0
+        self.handler.get_answer_w_source_metadata(query)
+        self.assertEqual(self.handler.faiss.searches, 2)
+
+    def test_faiss_upload_invalidates(self):
+        query = SourceSearchQuery(free_text_similarity="x", max_sources=5)
+        self.handler.get_answer_w_source_metadata(query)
+        self.handler.db_api.get_latest_faiss_upload_date = lambda: datetime(2026, 1, 1)
+        self.cache.version_ttl_s = 0
+        self.handler.get_answer_w_source_metadata(query)
+        self.assertEqual(self.handler.faiss.searches, 2)
+
+    def test_answer_of_an_older_version_is_not_stored(self):
+        query = SourceSearchQuery(free_text_similarity="x", max_sources=5)
+        old = self.cache.current_version()
+        ans = self.handler.get_answer_w_source_metadata(query)
+        self.handler.db_api.src_metadata_version += 1
+        self.cache.version_ttl_s = 0
+        new = self.cache.current_version()
+        self.cache.put(query, ans, old)
+        self.assertIsNone(self.cache.get(query, new))
+
+    def test_disk_tier_is_shared_between_processes(self):
+        query = SourceSearchQuery(free_text_similarity="x", max_sources=5)
+        with tempfile.TemporaryDirectory() as disk_dir:
+            SearchResultCache._instance = None
+            self.handler.result_cache = SearchResultCache(dbapi=self.handler.db_api, disk_dir=disk_dir)
+            first = self.handler.get_answer_w_source_metadata(query)
+
+            other = make_handler()  # a fresh process-wide cache, as in another worker
+            SearchResultCache._instance = None
+            other.result_cache = SearchResultCache(dbapi=other.db_api, disk_dir=disk_dir)
+            ans = other.get_answer_w_source_metadata(query)
+
+            self.assertEqual(other.faiss.searches, 0)
+            self.assertEqual([m.key for m in ans.src_metadata_lst], [m.key for m in first.src_metadata_lst])
+            self.assertEqual(ans.scores, first.scores)
+
+
+if __name__ == "__main__":
+    unittest.main()
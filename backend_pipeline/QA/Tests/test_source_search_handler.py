@@ -0,0 +1,286 @@
+# bs"d
+"""
+Tests for SourceSearchHandler's answer assembly, with the db and FAISS
+replaced by small in-memory stand-ins (no Mongo, no model).
+"""
+import unittest
+from types import SimpleNamespace
+
+from backend.app.SearchResultCache import SearchResultCache
+from backend.app.SourceSearchHandler import SourceSearchHandler
+from backend.app.SourceSearchQuery import SourceSearchQuery
+from backend.db.Collections import CollectionObjs
+from backend.db.DBConstants import DBFields
+from backend.models_db.Enums import SourceType
+from backend.models_db.SourceClasses.SourceContent import SourceContent
+from backend.models_db.SourceClasses.SourceMetadata import SourceMetadata
+
+KEYS = [f"TN_Genesis_0_{i}:1" for i in range(1, 13)]
+
+
+class FakeSearchDB:
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.content_fetches = []
+        self.bulk_fetches = 0
+        self.metadata_fetches = []  # keys of every metadata document sent back
+        self.pages = []
+        self.src_metadata_version = 0
+
+    def get_latest_faiss_upload_date(self):
+        return None
+
+    def get_src_metadata_version(self):
+        return self.src_metadata_version
+
+    def get_source_metadata_keys_filtered(self, passage_types=None, entity_ids=None, rel_ids=None, src_types=None,
+                                          books=None):
+        return self._matching(src_types, books)
+
+    def get_source_metadata_page(self, passage_types=None, entity_ids=None, rel_ids=None, src_types=None,
+                                 books=None, offset=0, limit=0):
+        self.pages.append((offset, limit))
+        matching = sorted(self._matching(src_types, books))
+        return self.get_source_metadata_by_keys(matching[offset:offset + limit]), len(matching)
+
+    def get_source_metadata_by_keys(self, keys):
+        self.metadata_fetches.extend(keys)
+        return [SimpleNamespace(key=k) for k in keys if k in self.keys]
+
+    def hydrate_source_metadata(self, src_metadata_lst):
+        hydrated = self.get_source_metadata_by_keys([src.key for src in src_metadata_lst])
+        for src in hydrated:
+            src.hydrated = True
+        return hydrated
+
+    def _matching(self, src_types, books=None):
+        return [k for k in self.keys
+                if (not src_types or SourceMetadata.get_src_type_from_key(k) in src_types)
+                and (not books or SourceMetadata.get_book_name_from_key(k) in books)]
+
+    def find_source_contents(self, keys):
+        self.bulk_fetches += 1
+        self.content_fetches.extend(keys)
+        return [SourceContent(key=key, content=[f"en {key}", f"heb {key}"]) for key in keys]
+
+    def load_lexical_index(self, name):
+        return None
+
+    def get_lexical_index_upload_date(self, name):
+        return None
+
+
+class FakeFaiss:
+    """Ranks candidates by descending key order, scoring 1.0, 0.9, ..."""
+
+    def __init__(self):
+        self.searches = 0
+        self.loaded_at = None
+
+    def search_within(self, text, keys, max_distance=None):
+        self.searches += 1
+        ranked = sorted(keys, reverse=True)
+        hits = [(key, 1.0 - i / 10) for i, key in enumerate(ranked)]
+        if max_distance is not None:
+            hits = [(key, score) for key, score in hits if 2 * (1 - score) <= max_distance]
+        return hits
+
+    def search_within_many(self, texts, keys_per_text, max_distance=None):
+        return [self.search_within(text, keys, max_distance) for text, keys in zip(texts, keys_per_text)]
+
+
+def make_handler(keys=KEYS):
+    handler = SourceSearchHandler.__new__(SourceSearchHandler)  # skip the real db/FAISS set-up
+    handler.db_api = FakeSearchDB(keys)
+    handler.faiss = FakeFaiss()
+    handler.lexical_cache = None  # no lexical ranking
+    handler.filter_index = None  # filter in the (fake) db
+    SearchResultCache._instance = None
+    handler.result_cache = SearchResultCache(dbapi=handler.db_api)
+    return handler
+
+
+class TestPagedAnswers(unittest.TestCase):
+
+    def test_first_page_carries_scores_and_full_ranking(self):
+        handler = make_handler()
+        ans = handler.get_full_answer(SourceSearchQuery(free_text_similarity="x", max_sources=5))
+
+        ranked = sorted(KEYS, reverse=True)
+        self.assertEqual([m.key for m in ans.src_metadata_lst], ranked[:5])
+        self.assertEqual([s.key for s in ans.src_contents], ranked[:5])
+        self.assertEqual(ans.total_found(), len(KEYS))
+        self.assertTrue(ans.has_more())
+        self.assertAlmostEqual(ans.scores[ranked[0]], 1.0)
+        self.assertEqual(handler.db_api.content_fetches, ranked[:5])  # only the page is hydrated
+        self.assertEqual(handler.db_api.metadata_fetches, ranked[:5])
+        self.assertEqual(handler.db_api.bulk_fetches, 1)
+
+    def test_later_pages_reuse_the_ranking(self):
+        handler = make_handler()
+        ans = handler.get_full_answer(SourceSearchQuery(free_text_similarity="x", max_sources=5))
+        page = handler.get_page(ans, offset=10, limit=5)
+
+        self.assertEqual(handler.faiss.searches, 1)
+        self.assertEqual([m.key for m in page.src_metadata_lst], sorted(KEYS, reverse=True)[10:])
+        self.assertEqual(len(page.src_contents), 2)
+        self.assertFalse(page.has_more())
+
+    def test_without_free_text_the_db_pages(self):
+        handler = make_handler()
+        ans = handler.get_full_answer(SourceSearchQuery(free_text_similarity="", max_sources=5, offset=2))
+        page = handler.get_page(ans, offset=10, limit=5)
+
+        self.assertEqual([m.key for m in ans.src_metadata_lst], sorted(KEYS)[2:7])
+        self.assertEqual(ans.total_found(), len(KEYS))
+        self.assertEqual(handler.db_api.pages, [(2, 5), (10, 5)])
+        self.assertEqual(handler.db_api.metadata_fetches, sorted(KEYS)[2:7] + sorted(KEYS)[10:])
+        self.assertEqual([m.key for m in page.src_metadata_lst], sorted(KEYS)[10:])
+        self.assertFalse(page.has_more())
+        self.assertEqual(handler.faiss.searches, 0)
+
+    def test_max_distance_drops_far_sources(self):
+        handler = make_handler()
+        ans = handler.get_answer_w_source_metadata(
+            SourceSearchQuery(free_text_similarity="x", max_sources=50, max_distance=0.45))
+        self.assertEqual(ans.total_found(), 3)  # scores 1.0, 0.9, 0.8
+
+    def test_src_types_filter_before_ranking(self):
+        handler = make_handler(KEYS + ["BT_Berakhot_0_2a:1"])
+        ans = handler.get_answer_w_source_metadata(
+            SourceSearchQuery(free_text_similarity="x", max_sources=50, src_types=[SourceType.BT]))
+        self.assertEqual([m.key for m in ans.src_metadata_lst], ["BT_Berakhot_0_2a:1"])
+
+
+class TestBatchedAnswers(unittest.TestCase):
+
+    def test_batch_matches_single_answers_and_fetches_each_source_once(self):
+        queries = [SourceSearchQuery(free_text_similarity="x", max_sources=5),
+                   SourceSearchQuery(free_text_similarity="y", max_sources=5, offset=3),
+                   SourceSearchQuery(free_text_similarity="", max_sources=4)]
+        handler = make_handler()
+        answers = handler.get_full_answers(queries)
+
+        for query, ans in zip(queries, answers):
+            single = make_handler().get_full_answer(query)
+            self.assertEqual([m.key for m in ans.src_metadata_lst], [m.key for m in single.src_metadata_lst])
+            self.assertEqual([s.key for s in ans.src_contents], [s.key for s in single.src_contents])
+            self.assertEqual(ans.scores, single.scores)
+
+        fetched = handler.db_api.content_fetches
+        self.assertEqual(handler.db_api.bulk_fetches, 1)
+        self.assertEqual(len(fetched), len(set(fetched)))
+        self.assertEqual(set(fetched), {m.key for ans in answers for m in ans.src_metadata_lst})
+
+
+class TestStreamedAnswer(unittest.TestCase):
+
+    def test_metadata_first_then_contents_a_page_at_a_time(self):
+        query = SourceSearchQuery(free_text_similarity="x", max_sources=10)
+        handler = make_handler()
+        steps = [([m.key for m in ans.src_metadata_lst], [s.key for s in ans.src_contents])
+                 for ans in handler.iter_full_answer(query, content_page_size=4)]
+
+        ranked = sorted(KEYS, reverse=True)[:10]
+        self.assertEqual(steps[0], (ranked, []))  # the ranking shows before any text is fetched
+        self.assertEqual([len(contents) for _, contents in steps], [0, 4, 8, 10])
+        self.assertEqual(handler.db_api.bulk_fetches, 3)
+
+        full = make_handler().get_full_answer(query)
+        self.assertEqual(steps[-1], ([m.key for m in full.src_metadata_lst], [s.key for s in full.src_contents]))
+
+
+class TestSourceMetadataQueries(unittest.TestCase):
+
+    KEYS = ["TN_Exodus_0_2:1", "BT_Berakhot_0_2a:1", "TN_Genesis_0_1:10", "TN_Genesis_0_1:2"]
+
+    def setUp(self):
+        from conftest import FakeDBapi
+        self.db = FakeDBapi.create()
+        for key in self.KEYS:
+            self.db.insert_source_metadata(SourceMetadata(key=key))
+
+    def test_page_is_in_canonical_order(self):
+        canonical = sorted(self.KEYS, key=lambda k: SourceMetadata(key=k).sort_key())
+        page, total = self.db.get_source_metadata_page(offset=1, limit=2)
+        self.assertEqual([m.key for m in page], canonical[1:3])
+        self.assertEqual(total, len(self.KEYS))
+
+    def test_src_types_and_keys_only(self):
+        page, total = self.db.get_source_metadata_page(src_types=[SourceType.BT])
+        self.assertEqual(([m.key for m in page], total), (["BT_Berakhot_0_2a:1"], 1))
+        self.assertEqual(sorted(self.db.get_source_metadata_keys_filtered(src_types=[SourceType.TN])),
+                         sorted(k for k in self.KEYS if k.startswith("TN_")))
+
+    def test_books_filter(self):
+        keys = self.db.get_source_metadata_keys_filtered(src_types=[SourceType.TN], books=["Genesis"])
+        self.assertEqual(sorted(keys), ["TN_Genesis_0_1:10", "TN_Genesis_0_1:2"])
+
+    def test_backfill_sets_type_and_book(self):
+        self.db.get_collection(CollectionObjs.SRC_METADATA).insert_one({"key": "TN_Exodus_0_3:1"})  # an older document
+        version = self.db.get_src_metadata_version()
+        self.assertEqual(self.db.backfill_src_metadata_type_fields(), 1)
+        self.assertEqual(self.db.get_src_metadata_version(), version + 1)
+        keys = self.db.get_source_metadata_keys_filtered(books=["Exodus"])
+        self.assertEqual(sorted(keys), ["TN_Exodus_0_2:1", "TN_Exodus_0_3:1"])
+        self.assertEqual(self.db.backfill_src_metadata_type_fields(), 0)
+
+    def test_slim_then_hydrate(self):
+        self.db.update_source_metadata(SourceMetadata(key="TN_Genesis_0_1:2", summary_en="creation",
+                                                      entity_keys={"E1"}))
+        slim = self.db.get_source_metadata_filtered(books=["Genesis"], slim=True)
+        self.assertTrue(all(not sm.hydrated and sm.summary_en is None for sm in slim))
+        with self.assertRaises(ValueError):
+            self.db.update_source_metadata(slim[0])
+
+        page = [sm for sm in slim if sm.key == "TN_Genesis_0_1:2"]
+        page.append(SourceMetadata("TN_Genesis_0_99:1", hydrated=False))  # deleted since
+        hydrated = self.db.hydrate_source_metadata(page)
+        self.assertEqual([sm.key for sm in hydrated], ["TN_Genesis_0_1:2"])
+        self.assertTrue(hydrated[0].hydrated)
+        self.assertEqual((hydrated[0].summary_en, hydrated[0].entity_keys), ("creation", {"E1"}))
+
+    def test_writes_bump_the_version(self):
+        self.assertEqual(self.db.get_src_metadata_version(), len(self.KEYS))
+        self.db.update_source_metadata(SourceMetadata(key=self.KEYS[0], summary_en="changed"))
+        self.assertEqual(self.db.get_src_metadata_version(), len(self.KEYS) + 1)
+
+    def test_each_write_is_stamped_with_the_version_it_bumped_to(self):
+        collection = self.db.get_collection(CollectionObjs.SRC_METADATA)
+        stamps = [d[DBFields.WRITE_VERSION] for d in collection.find({})]
+        self.assertEqual(stamps, list(range(1, len(self.KEYS) + 1)))
+        self.db.update_source_metadata(SourceMetadata(key=self.KEYS[0], summary_en="changed"))
+        self.assertEqual(collection.find_one({DBFields.KEY: self.KEYS[0]})[DBFields.WRITE_VERSION],
+                         self.db.get_src_metadata_version())
+
+    def test_by_keys_keeps_the_order_given(self):
+        keys = ["TN_Genesis_0_1:2", "TN_Genesis_0_99:1", "BT_Berakhot_0_2a:1"]
+        self.assertEqual([m.key for m in self.db.get_source_metadata_by_keys(keys)],
+                         ["TN_Genesis_0_1:2", "BT_Berakhot_0_2a:1"])
+
+
+class TestFindSourceContents(unittest.TestCase):
+
+    def setUp(self):
+        from conftest import FakeDBapi
+        self.db = FakeDBapi.create()
+        for collection, keys in ((CollectionObjs.TN, ["TN_Genesis_0_1:1-5", "TN_Exodus_0_2:1"]),
+                                 (CollectionObjs.BT, ["BT_Berakhot_0_2a:1"])):
+            for key in keys:
+                self.db.get_collection(collection).insert_one({"key": key, "content": [f"en {key}", "heb", ""]})
+
+    def test_results_follow_the_ranked_order_across_collections(self):
+        keys = ["TN_Exodus_0_2:1", "BT_Berakhot_0_2a:1", "TN_Genesis_0_1:1-5"]
+        contents = self.db.find_source_contents(keys)
+        self.assertEqual([s.key for s in contents], keys)
+        self.assertEqual(contents[1].content[0], "en BT_Berakhot_0_2a:1")
+        self.assertEqual(self.db.find_source_contents([]), [])
+
+    def test_missing_key_raises(self):
+        with self.assertRaises(Exception):
+            self.db.find_source_contents(["TN_Genesis_0_1:1-5", "TN_Genesis_0_99:1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -7,6 +7,7 @@ Covers:
 - TN chapter:verse section sorting (e.g. 1:1–24, 2:1–24, 5:13–6:27)
 - Cross-book sorting by Book.order
 - Integration: get_all_src_contents_by_book returns sorted results
+- Stored string sort key and the streaming iter_src_contents_by_book
 """
 import unittest
 
@@ -14,6 +15,7 @@ from backend.models_db.SourceClasses.SectionSorting import (
     bt_section_sort_key,
     tn_section_sort_key,
     get_section_sort_key,
+    encode_sort_key,
 )
 from backend.models_db.SourceClasses.SourceContent import SourceContent
 from backend.db.data_names.Books import Books
@@ -234,6 +236,54 @@ class TestGetAllSrcContentsByBookSorted(unittest.TestCase):
         self.assertEqual(result_keys, expected)
 
 
+# ═══════════════════════════════════════════════════════════════════════════════
+# Stored sort key + streaming by-book reads
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestStoredSortKey(unittest.TestCase):
+
+    KEYS = [
+        "TN_Genesis_0_12:1-9", "TN_Genesis_0_1:1-5", "BT_Bava Batra_0_13b:9-14a:4",
+        "TN_Exodus_0_2:1", "BT_Bava Batra_0_3b:4-7", "TN_Genesis_0_3:1-24",
+    ]
+
+    def test_string_order_matches_tuple_order(self):
+        srcs = [SourceContent(key=k, content=[]) for k in self.KEYS]
+        by_tuple = [s.key for s in sorted(srcs)]
+        by_string = [s.key for s in sorted(srcs, key=lambda s: s.stored_sort_key())]
+        self.assertEqual(by_string, by_tuple)
+
+    def test_shorter_key_sorts_first(self):
+        self.assertLess(encode_sort_key((1, (6,))), encode_sort_key((1, (6, 0))))
+        self.assertLess(encode_sort_key((1, (6, 99))), encode_sort_key((1, (10,))))
+
+    def test_book_prefix(self):
+        self.assertTrue(SourceContent(key="TN_Genesis_0_1:1-5", content=[]).stored_sort_key()
+                        .startswith(SourceContent.book_sort_key_prefix(Books.GENESIS)))
+        self.assertFalse(SourceContent(key="TN_Exodus_0_2:1", content=[]).stored_sort_key()
+                         .startswith(SourceContent.book_sort_key_prefix(Books.GENESIS)))
+
+
+class TestIterSrcContentsByBook(unittest.TestCase):
+
+    def setUp(self):
+        from conftest import FakeDBapi
+        from backend.db.Collections import CollectionObjs
+        self.db = FakeDBapi.create()
+        self.col = CollectionObjs.TN
+        for k in ["TN_Genesis_0_12:1-9", "TN_Exodus_0_2:1", "TN_Genesis_0_1:1-5", "TN_Genesis_0_3:1-24"]:
+            self.db.get_collection(self.col).insert_one({"key": k, "content": [LANG_EN, "heb", ""]})
+
+    def test_backfill_then_stream_in_order(self):
+        self.assertEqual(list(self.db.iter_src_contents_by_book(Books.GENESIS)), [])  # no sort keys yet
+        self.assertEqual(self.db.backfill_src_content_sort_keys(self.col), 4)
+        self.assertEqual(self.db.backfill_src_content_sort_keys(self.col), 0)
+
+        streamed = [s.key for s in self.db.iter_src_contents_by_book(Books.GENESIS)]
+        self.assertEqual(streamed, [s.key for s in self.db.get_all_src_contents_by_book(Books.GENESIS)])
+        self.assertEqual(streamed, ["TN_Genesis_0_1:1-5", "TN_Genesis_0_3:1-24", "TN_Genesis_0_12:1-9"])
+
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -0,0 +1,183 @@
+# bs"d
+"""
+Tests for StructuralFilterIndex: every structural filter must resolve in
+memory to exactly what the db query returns (the in-memory conftest fake
+runs the real SourceMetadataMongoMixin queries), before and after
+incremental refreshes.
+"""
+import threading
+import time
+import unittest
+
+import numpy as np
+
+from backend.app.SourceSearchHandler import SourceSearchHandler
+from backend.app.SourceSearchQuery import SourceSearchQuery
+from backend.app.StructuralFilterIndex import StructuralFilterIndex
+from backend.db.Collections import CollectionObjs
+from backend.db.DBConstants import DBFields
+from backend.models_db.Enums import PassageType, SourceType
+from backend.models_db.SourceClasses.SourceMetadata import SourceMetadata
+from conftest import FakeDBapi
+from test_source_search_handler import FakeFaiss
+
+LAW, STORY, PROPHECY = PassageType.LAW, PassageType.STORY, PassageType.PROPHECY
+
+FILTERS = [
+    {},
+    {"passage_types": [LAW]},
+    {"passage_types": [LAW, PROPHECY]},
+    {"entity_ids": ["E1"]},
+    {"entity_ids": ["E1", "E7"], "passage_types": [STORY]},
+    {"rel_ids": ["R3"], "src_types": [SourceType.TN]},
+    {"rel_ids": ["R13", "R52"]},
+    {"src_types": [SourceType.BT], "books": ["Berakhot"]},
+    {"books": ["Genesis", "Exodus"], "entity_ids": ["E2"], "passage_types": [LAW, STORY]},
+    {"entity_ids": ["no such entity"]},
+]
+
+
+def make_sources():
+    sources = []
+    for i in range(60):
+        key = f"TN_Genesis_0_{i // 10 + 1}:{i % 10 + 1}" if i < 30 else (
+            f"TN_Exodus_0_{i}:1" if i < 45 else f"BT_Berakhot_0_{i}a:1")
+        sources.append(SourceMetadata(
+            key=key,
+            passage_types=[LAW] if i % 2 else [STORY, PROPHECY] if i % 3 else [],
+            entity_keys={f"E{i % 9}"} | ({"E7"} if i % 11 == 0 else set()),
+            rel_keys={"R3", f"R{i}"} if i % 13 == 0 else set(),
+        ))
+    return sources
+
+
+class TestStructuralFilterIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.db = FakeDBapi.create()
+        for src in make_sources():
+            self.db.insert_source_metadata(src)
+        StructuralFilterIndex._instance = None
+        self.index = StructuralFilterIndex(dbapi=self.db, refresh_interval_s=0)
+        self.assertTrue(self.index.refresh())
+
+    def tearDown(self):
+        self.index.stop_background_refresh()
+        StructuralFilterIndex._instance = None
+
+    def assert_matches_db(self):
+        for filters in FILTERS:
+            with self.subTest(**{k: str(v) for k, v in filters.items()}):
+                self.assertEqual(self.index.get_source_metadata_keys_filtered(**filters),
+                                 [m.key for m in self.db.get_source_metadata_page(**filters)[0]])
+                page, total = self.db.get_source_metadata_page(**filters, offset=3, limit=5)
+                self.assertEqual(self.index.get_source_metadata_key_page(**filters, offset=3, limit=5),
+                                 ([m.key for m in page], total))
+
+    def test_matches_the_db_query(self):
+        self.assert_matches_db()
+
+    def test_rare_values_are_ordinal_arrays_and_common_ones_bitmaps(self):
+        postings = self.index._postings
+        self.assertEqual(postings[(DBFields.REL_KEYS, "R13")].dtype, np.int32)  # 1 source of 60
+        self.assertEqual(postings[(DBFields.PASSAGE_TYPES, LAW.value)].dtype, np.uint8)
+
+    def test_writes_are_picked_up_incrementally(self):
+        self.db.insert_source_metadata(SourceMetadata(key="TN_Exodus_0_99:1", passage_types=[LAW], entity_keys={"E1"}))
+        self.db.update_source_metadata(SourceMetadata(key="TN_Genesis_0_1:2", passage_types=[PROPHECY],
+                                                      rel_keys={"R3"}))
+        scans = []
+        structure = self.db.get_src_metadata_structure
+        self.db.get_src_metadata_structure = lambda **kw: scans.append(kw) or structure(**kw)
+
+        self.assertTrue(self.index.refresh())
+        self.assertEqual([kw.get("min_write_version") for kw in scans], [60])  # only what was written since
+        self.assertEqual(self.index._base_n, 60)  # new postings are still in the tail
+        self.assert_matches_db()
+
+    def test_sort_key_ties_break_on_key(self):
+        tied = ["TN_Genesis_0_1:2", "TN_Exodus_0_30:1", "BT_Berakhot_0_50a:1"]  # key order is not insertion order
+        collection = self.db.get_collection(CollectionObjs.SRC_METADATA)
+        for key in tied:
+            collection.update_one({DBFields.KEY: key}, {"$set": {DBFields.SORT_KEY: "0"}})
+        StructuralFilterIndex._instance = None
+        self.index = StructuralFilterIndex(dbapi=self.db, refresh_interval_s=0)
+        self.assertTrue(self.index.refresh())
+
+        page, _ = self.db.get_source_metadata_page(limit=3)
+        self.assertEqual([m.key for m in page], sorted(tied))
+        self.assertEqual(self.index.get_source_metadata_key_page(limit=3)[0], sorted(tied))
+        self.assert_matches_db()
+
+    def test_unreadable_db_falls_back(self):
+        StructuralFilterIndex._instance = None
+        broken = StructuralFilterIndex(dbapi=None)
+        self.assertFalse(broken.refresh())
+
+
+class TestHandlerWithFilterIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.db = FakeDBapi.create()
+        for src in make_sources():
+            self.db.insert_source_metadata(src)
+
+    def tearDown(self):
+        if StructuralFilterIndex._instance is not None:
+            StructuralFilterIndex._instance.stop_background_refresh()
+        StructuralFilterIndex._instance = None
+
+    def _handler(self, with_index, refresh_interval_s=0):
+        handler = SourceSearchHandler.__new__(SourceSearchHandler)  # skip the real db/FAISS set-up
+        handler.db_api = self.db
+        handler.faiss = FakeFaiss()
+        handler.lexical_cache = None  # no lexical ranking
+        handler.result_cache = None
+        StructuralFilterIndex._instance = None
+        handler.filter_index = StructuralFilterIndex(
+            dbapi=self.db, refresh_interval_s=refresh_interval_s) if with_index else None
+        return handler
+
+    @staticmethod
+    def _wait_for(condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            if time.monotonic() > deadline:
+                raise AssertionError("timed out")
+            time.sleep(0.01)
+
+    def test_same_answers_as_filtering_in_the_db(self):
+        queries = [SourceSearchQuery(free_text_similarity="x", max_sources=5, passage_types=[LAW]),
+                   SourceSearchQuery(free_text_similarity="", max_sources=4, offset=2, entity_ids=["E1", "E2"]),
+                   SourceSearchQuery(free_text_similarity="", max_sources=10, src_types=[SourceType.BT])]
+        expected = self._handler(with_index=False).get_answers_w_source_metadata(queries)
+        handler = self._handler(with_index=True)
+        answers = handler.get_answers_w_source_metadata(queries)
+
+        self.assertTrue(handler.uses_filter_index())
+        for exp, ans in zip(expected, answers):
+            self.assertEqual([m.key for m in ans.src_metadata_lst], [m.key for m in exp.src_metadata_lst])
+            self.assertEqual([m.summary_en for m in ans.src_metadata_lst], [m.summary_en for m in exp.src_metadata_lst])
+            self.assertEqual((ans.total_found(), ans.scores), (exp.total_found(), exp.scores))
+
+
+    def test_searches_leave_the_db_reads_to_the_refresher(self):
+        handler = self._handler(with_index=True, refresh_interval_s=0.02)
+        readers, scans = [], []
+        version, structure = self.db.get_src_metadata_version, self.db.get_src_metadata_structure
+        self.db.get_src_metadata_version = lambda: readers.append(threading.current_thread().name) or version()
+        self.db.get_src_metadata_structure = lambda **kw: scans.append(kw) or structure(**kw)
+
+        self.assertFalse(handler.uses_filter_index())  # not built yet: filter in the db, and start building
+        self._wait_for(handler.uses_filter_index)
+        self.db.insert_source_metadata(SourceMetadata(key="TN_Exodus_0_99:1", passage_types=[LAW]))
+        self._wait_for(lambda: "TN_Exodus_0_99:1" in handler.filter_index.get_source_metadata_keys_filtered(
+            passage_types=[LAW]))
+        handler.filter_index.stop_background_refresh()
+
+        self.assertEqual(set(readers), {"StructuralFilterIndex-refresher"})
+        self.assertEqual(sum("min_write_version" not in kw for kw in scans), 1)  # the insert was added incrementally
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+# bs"d
+"""
+Tests for WarmUpService's background warm-up and readiness state, with a
+stand-in handler (no Mongo, no model).
+"""
+import threading
+import unittest
+
+from backend.app.WarmUpService import WarmUpService, WarmUpState
+
+
+class FakeHandler:
+
+    def __init__(self, release: threading.Event, fail: bool = False):
+        self.release = release
+        self.fail = fail
+        self.warm_ups = 0
+
+    def warm_up(self):
+        self.warm_ups += 1
+        self.release.wait(5)
+        if self.fail:
+            raise ConnectionError("no db")
+
+
+class TestWarmUpService(unittest.TestCase):
+
+    def setUp(self):
+        WarmUpService._instance = None  # undo the singleton between tests
+        self.release = threading.Event()
+        self.created = []
+
+    def tearDown(self):
+        self.release.set()
+        WarmUpService._instance = None
+
+    def _factory(self, fail=False):
+        def factory():
+            handler = FakeHandler(self.release, fail)
+            self.created.append(handler)
+            return handler
+        return factory
+
+    def _service(self, fail=False):
+        return WarmUpService(handler_factory=self._factory(fail))
+
+    def test_warms_once_in_background_then_shares_the_handler(self):
+        service = self._service()
+        self.assertEqual(service.state, WarmUpState.NOT_STARTED)
+
+        service.start()
+        service.start()
+        self.assertEqual(service.state, WarmUpState.WARMING_UP)  # start() did not block
+
+        self.release.set()
+        self.assertTrue(service.wait(5))
+        self.assertIs(WarmUpService(), service)
+        self.assertIs(service.get_handler(), self.created[0])
+        self.assertEqual([h.warm_ups for h in self.created], [1])
+
+    def test_failure_falls_back_to_fresh_handlers(self):
+        service = self._service(fail=True)
+        service.start()
+        self.release.set()
+
+        self.assertFalse(service.wait(5))
+        self.assertEqual(service.state, WarmUpState.FAILED)
+        self.assertEqual(service.error, "no db")
+        self.assertIsNot(service.get_handler(), self.created[0])
+
+    def test_failed_warm_up_is_retried_after_the_backoff(self):
+        service = self._service(fail=True)
+        service.start()
+        self.release.set()
+        self.assertFalse(service.wait(5))
+
+        fallback = service.get_handler()  # still inside the backoff: no retry, one shared fallback
+        self.assertIs(service.get_handler(), fallback)
+        self.assertEqual(len(self.created), 2)
+
+        service._handler_factory = self._factory(fail=False)  # the db is back
+        service.retry_backoff_s = 0
+        service.get_handler()  # the backoff is over: warms up again
+        self.assertTrue(service.wait(5))
+        self.assertEqual(service.state, WarmUpState.READY)
+        self.assertIsNone(service.error)
+        self.assertEqual([h.warm_ups for h in self.created], [1, 0, 1])
+        self.assertIs(service.get_handler(), self.created[2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,33 @@
 # bs'd
+import itertools
+
 from backend.db.Collections import CollectionObjs
+from backend.db.DBConstants import SrcContentProjections
 from backend_pipeline.data_pipeline.DBScriptParentClass import DBParentClass
 from backend.faiss_api import FaissEngine
+from backend.faiss_api.EmbeddingPipeline import EmbeddingPipeline
+from backend.faiss_api.FaissIndexFactory import FaissIndexType
+from backend.lexical_api.BM25Index import BM25Index
+from backend.lexical_api.HebrewTextIndex import HebrewTextIndex
+from backend.models_db.Enums import SourceType
 
 
 class DBPopulateFaiss(DBParentClass):
 
+    # Index layout to rebuild with; see QA/Benchmarks/FaissIndexBenchmark for the trade-offs.
+    INDEX_TYPE = FaissIndexType.FLAT
+    # For compressed types (SQ8/PQ/IVF_PQ): also persist the float32 vectors for exact re-ranking.
+    STORE_EXACT_VECTORS = False
+    # >0: embed passages as overlapping windows of this many words (multi-vector
+    # index, see the chunking benchmark); 0: one vector per passage.
+    CHUNK_WORDS = 0
+    # Encoder processes (None = one per core).
+    EMBEDDING_WORKERS = None
+    # One FAISS index per SourceType (loaded only when searched), instead of a single combined one.
+    SHARD_BY_SOURCE_TYPE = True
+    # Collections whose text gets indexed (BT and TN are the ones populated so far).
+    COLLECTIONS = (CollectionObjs.BT, CollectionObjs.TN)
+
     def setUp(self):
         """Runs before every test to set up directories and lazy init Faiss."""
         super().setUp()  # call parent setup first
@@ -17,28 +39,51 @@ class DBPopulateFaiss(DBParentClass):
         ############################################## Populating FAISS ###############################################
 
     def test_populate_faiss_index(self):
-        self.faiss.clear_index()  # start from a totally clean FAISS index
-
-        # all_srcs = self.db_api.get_all_src_contents_of_collection(CollectionObjs.TN)
-        # all_srcs = self.db_api.get_all_src_contents_of_collection(CollectionObjs.BT)
-        all_srcs = (self.db_api.get_all_src_contents_of_collection(CollectionObjs.BT)
-                    + self.db_api.get_all_src_contents_of_collection(CollectionObjs.TN))
-        print(f"{len(all_srcs)} sources found")
-
-        docs = [
-            {
-                "key": src.key,
-                "content": src.get_clean_en_text(),
-            }
-            for src in all_srcs
-        ]
-
-        self.faiss.populate_bulk(
-            docs,
-            batch_size=256,  # safe for CPU RAM; raise to 512 if you have more
-            checkpoint_every=500,  # save to Mongo every 500 docs as crash insurance
-        )
+        # start from a totally clean FAISS index
+        self.faiss.clear_index(index_type=self.INDEX_TYPE, store_exact_vectors=self.STORE_EXACT_VECTORS,
+                               chunk_words=self.CHUNK_WORDS)
+
+        # Three streaming passes over BT+TN; none of them holds the corpus in memory.
+        # 1. embeddings: cursor -> worker processes (clean + encode, all cores) -> this process adds to FAISS
+        if self.SHARD_BY_SOURCE_TYPE:
+            for collection in self.COLLECTIONS:
+                self._populate_shard(collection)
+        else:
+            self._embed_into(self.faiss, self._iter_all_srcs(SrcContentProjections.EN_ONLY))
+        # 2. keyword index over the same text, fused with FAISS at search time
+        BM25Index.build(
+            {"key": src.key, "content": src.get_clean_en_text()}
+            for src in self._iter_all_srcs(SrcContentProjections.EN_ONLY)
+        ).save_to_db(self.db_api)
+        # 3. Hebrew full-text index (the embeddings above are English only)
+        HebrewTextIndex.build(
+            {"key": src.key, "content": src.get_clean_heb_text()} for src in self._iter_all_srcs()
+        ).save_to_db(self.db_api)
 
         results = self.faiss.search("leading the battle", 20)
         for r in results:
-            print(r)
\ No newline at end of file
+            print(r)
+
+    def test_populate_one_faiss_shard(self):
+        # (re)index a single SourceType; the other shards and the lexical indexes are left as they are
+        self._populate_shard(CollectionObjs.TN)
+        for r in self.faiss.search("leading the battle", 20, src_types=[SourceType.TN]):
+            print(r)
+
+    def _populate_shard(self, collection):
+        shard = self.faiss.get_shard(SourceType[collection.name])
+        shard.clear_index(index_type=self.INDEX_TYPE, store_exact_vectors=self.STORE_EXACT_VECTORS,
+                          chunk_words=self.CHUNK_WORDS)
+        self._embed_into(shard, self.db_api.iter_src_contents_of_collection(
+            collection, projection=SrcContentProjections.EN_ONLY))
+
+    def _embed_into(self, engine, srcs):
+        EmbeddingPipeline(engine, workers=self.EMBEDDING_WORKERS).run(
+            ((src.key, src.get_en_html_content()) for src in srcs),
+            checkpoint_every=500,  # save to Mongo every 500 docs as crash insurance
+        )
+
+    def _iter_all_srcs(self, projection=None):
+        return itertools.chain.from_iterable(
+            self.db_api.iter_src_contents_of_collection(collection, projection=projection)
+            for collection in self.COLLECTIONS)
@@ -190,7 +190,7 @@ class DBPopulateLlmBase(DBParentClass):
         total_cost_usd = 0.0
         total_tokens = total_input_tokens = total_output_tokens = 0
 
-        contents = self.db_api.get_all_src_contents_by_book(book)
+        contents = self.db_api.iter_src_contents_by_book(book)
         for src_content in contents:
             passage = src_content.get_clean_en_text()
             json_str, usage, cost_usd = await self._extract_from_passage(passage)
@@ -332,5 +332,5 @@ def get_examples_src_contents(db_api) -> list[SourceContent]:
 
 
     ]
-    res = [db_api.find_one_source_content(k) for k in key_strs]
+    res = db_api.find_source_contents(key_strs)
     return res
\ No newline at end of file
@@ -228,6 +228,18 @@ class DBPopulateSourceContent(DBParentClass):
 
 
     ############################################## Data Clean up functions ##############################################
+    def test_backfill_sort_keys(self):
+        # one-time, for documents inserted before the stored sort key (needed by iter_src_contents_by_book
+        # and get_source_metadata_page)
+        for collection in (CollectionObjs.BT, CollectionObjs.TN, CollectionObjs.SRC_METADATA):
+            updated = self.db_api.backfill_src_content_sort_keys(collection)
+            print(f"Set sort key on {updated} documents in {collection.name}.")
+
+    def test_backfill_src_metadata_type_fields(self):
+        # one-time, for SourceMetadata inserted before source_type/book were stored (needed by src_types/books filters)
+        updated = self.db_api.backfill_src_metadata_type_fields()
+        print(f"Set source type and book on {updated} documents in {CollectionObjs.SRC_METADATA.name}.")
+
     def test_remove_3rd_col_of_content(self):
         # Retrieve the query template
         query = self.get_query("remove_third_content_element")
@@ -22,6 +22,7 @@ from components.header import render_header
 from components.layout import apply_layout, language_selector
 from translations1 import get_text, is_rtl
 from pages import about, entity_search, home, maps, number_search, source_search
+from backend.app.WarmUpService import WarmUpService
 from system_common.Constants import (
     DEFAULT_LANG,
     PAGE_HOME, PAGE_ABOUT, PAGE_NUMBER_SEARCH, PAGE_SOURCE_SEARCH,
@@ -161,6 +162,10 @@ def _render_page(page_key: str, lang: str) -> None:
 def main() -> None:
     st.set_page_config(page_title="MapaLi | מפה-לי", layout="wide")
 
+    # Load the db connection, FAISS index and model in the background (once
+    # per process), so the first source search doesn't wait for them.
+    WarmUpService().start()
+
     _init_state()
     apply_layout(st.session_state["lang"])
 
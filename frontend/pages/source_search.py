@@ -32,7 +32,7 @@ from components.source_filters import (
     render_active_filter_chips,
     render_source_filters,
 )
-from .source_search_logic import collect_search_query, run_search
+from .source_search_logic import collect_search_query, fetch_next_page, is_warming_up, stream_search
 
 logger = logging.getLogger(__name__)
 
@@ -55,17 +55,21 @@ def _render_search_input_row(lang: str) -> None:
         # Spacer so the button lines up with the input box, which has a
         # label rendered above it.
         st.markdown("<div style='height: 1.9rem;'></div>", unsafe_allow_html=True)
-        if st.button(get_text("source_search_ui.find_sources_button", lang)):
-            try:
-                query_obj = collect_search_query()
-                ans, elapsed = run_search(query_obj)
-                st.session_state["_search_ans"] = ans
-                st.session_state["_search_elapsed"] = elapsed
-                st.session_state.pop("_search_error", None)
-            except Exception as e:
-                logger.error("Search failed: %s", e)
-                st.session_state["_search_error"] = str(e)
-                st.session_state.pop("_search_ans", None)
+        if st.button(get_text("source_search_ui.find_sources_button", lang), disabled=is_warming_up()):
+            # Run by _render_search_panel, which streams the results in as they arrive.
+            st.session_state["_pending_query"] = collect_search_query()
+            st.session_state.pop("_search_error", None)
+            st.session_state.pop("_search_ans", None)
+
+
+@st.fragment(run_every=2)
+def _render_warm_up_status(lang: str) -> None:
+    """Shown (and re-checked every 2s) until the background warm-up is done,
+    then reruns the page once to enable the search button."""
+    if is_warming_up():
+        st.info(get_text("source_search_ui.warming_up", lang))
+    else:
+        st.rerun()
 
 
 def _render_dicta_promo(lang: str) -> None:
@@ -78,19 +82,56 @@ def _render_dicta_promo(lang: str) -> None:
     st.markdown(promo, unsafe_allow_html=False)
 
 
-def _render_search_panel() -> None:
+def _render_search_panel(lang: str) -> None:
+    if "_pending_query" in st.session_state:
+        _stream_results(st.session_state.pop("_pending_query"), lang)
+
     if st.session_state.get("_search_error"):
         st.error(st.session_state["_search_error"])
     elif "_search_ans" in st.session_state:
-        found_count = len(getattr(st.session_state["_search_ans"], "src_metadata_lst", []))
+        ans = st.session_state["_search_ans"]
         elapsed = st.session_state.get("_search_elapsed", "")
-        st.success(f"Found {found_count} sources in {elapsed}")
+        st.success(f"Found {ans.total_found()} sources in {elapsed} (showing {len(ans.src_metadata_lst)})")
 
     if "_search_ans" in st.session_state:
         _render_results_body(
             st.session_state["_search_ans"],
             st.session_state.get("_search_elapsed", ""),
         )
+        _render_load_more(lang)
+
+
+def _stream_results(query_obj, lang: str) -> None:
+    """Show the ranked sources as soon as they are known, then re-render as
+    their texts arrive, a page at a time. The finished answer is stored like
+    any other search's, so the normal rendering below takes over from it."""
+    status, body = st.empty(), st.empty()
+    try:
+        for ans, elapsed in stream_search(query_obj):
+            status.info(get_text("source_search_ui.loading_texts", lang).format(
+                loaded=len(ans.src_contents), total=len(ans.src_metadata_lst)))
+            with body.container():
+                _render_results_body(ans, elapsed)
+        st.session_state["_search_ans"] = ans
+        st.session_state["_search_elapsed"] = elapsed
+    except Exception as e:
+        logger.error("Search failed: %s", e)
+        st.session_state["_search_error"] = str(e)
+        st.session_state.pop("_search_ans", None)
+    status.empty()
+    body.empty()
+
+
+def _render_load_more(lang: str) -> None:
+    """Next page of the same ranking, fetched only when asked for."""
+    ans = st.session_state["_search_ans"]
+    if ans.has_more() and st.button(get_text("source_search_ui.load_more_button", lang)):
+        try:
+            st.session_state["_search_ans"] = fetch_next_page(ans)
+            st.rerun()
+        except Exception as e:
+            logger.error("Loading more results failed: %s", e)
+            st.error(str(e))
 
 
 # ---------------------------------------------------------------------------
@@ -139,8 +180,10 @@ def render(lang: str) -> None:
         # Free-text similarity search below entity filters, with the Find
         # Sources button on the same line, and a Dicta promo note beneath it.
         _render_search_input_row(lang)
+        if is_warming_up():
+            _render_warm_up_status(lang)
         _render_dicta_promo(lang)
         # Active filter chips – reflect current source-filter selections,
         # shown directly above the results.
         render_active_filter_chips()
-        _render_search_panel()
+        _render_search_panel(lang)
@@ -9,16 +9,23 @@ reused if other pages need the same query/result model.
 from __future__ import annotations
 
 import logging
+from dataclasses import replace
+from typing import Iterator, Tuple
+
 import streamlit as st
 
-from backend.app.SourceSearchHandler import SourceSearchHandler
+from backend.app.WarmUpService import WarmUpService, WarmUpState
 from backend.app.SourceSearchQuery import SourceSearchQuery
+from backend.models_db.Answer import Answer
 from components.facets import get_selected_entity_ids
+from backend.db.data_names.Books import Books
 from components.source_filters import get_selected_books, get_selected_passage_types
 from system_common.SystemFunctions import get_ts_datetime
 
 logger = logging.getLogger(__name__)
 
+PAGE_SIZE = 50
+
 
 def collect_search_query() -> SourceSearchQuery:
     """Read the current source-filters selections and free-text box to build
@@ -26,34 +33,61 @@ def collect_search_query() -> SourceSearchQuery:
     free_text = st.session_state.get("free_text_query", "")
 
     selected_passage_types = get_selected_passage_types()
-    # Book-level selection – captured for the future; not yet wired into
-    # server-side filtering (backend support is out of scope for now).
-    selected_books = get_selected_books()  # noqa: F841
+    selected_books = get_selected_books()
     selected_src_types = sorted(
         {b.source_type for b in selected_books}, key=lambda st_: st_.value,
     )
+    # Whole source types are filtered by src_types alone; books only narrow
+    # the search when some book of a selected source type was left out.
+    books_of_src_types = [b for src_type in selected_src_types for b in Books.by_source(src_type)]
+    books = [b.database_name for b in selected_books] if len(selected_books) < len(books_of_src_types) else []
 
     return SourceSearchQuery(
         free_text_similarity=free_text,
-        max_sources=50,
+        max_sources=PAGE_SIZE,
         src_types=selected_src_types,
+        books=books,
         passage_types=selected_passage_types,
         entity_ids=get_selected_entity_ids(),
         rel_ids=[],
     )
 
 
-def run_search(query_obj: SourceSearchQuery):
-    """Execute the search and return ``(answer, elapsed_str)``."""
-    handler = SourceSearchHandler()
+def is_warming_up() -> bool:
+    """True while the background warm-up (started by app.py) is still loading."""
+    return WarmUpService().state == WarmUpState.WARMING_UP
+
+
+def stream_search(query_obj: SourceSearchQuery) -> Iterator[Tuple[Answer, str]]:
+    """Execute the search, yielding ``(answer, elapsed_str)`` as soon as the
+    ranked sources are known and again whenever more source texts arrive
+    (see SourceSearchHandler.iter_full_answer). The answer is complete
+    after the last yield."""
+    handler = WarmUpService().get_handler()
     time_begin = get_ts_datetime()
-    logger.info("Starting search with SearchHandler.get_full_answer. search start time: %s", time_begin)
+    logger.info("Starting search with SearchHandler.iter_full_answer. search start time: %s", time_begin)
 
-    with st.spinner("Searching..."):
-        ans = handler.get_full_answer(query_obj)
+    first = True
+    for ans in handler.iter_full_answer(query_obj):
+        elapsed = str(get_ts_datetime() - time_begin)
+        if first:
+            logger.info("Ranked sources ready. Found %d sources. time to first results: %s", ans.total_found(), elapsed)
+            first = False
+        yield ans, elapsed
 
-    elapsed = str(get_ts_datetime() - time_begin)
-    found_count = len(getattr(ans, "src_metadata_lst", []))
-    logger.info("Search completed. Found %d sources. total search time: %s", found_count, elapsed)
-    return ans, elapsed
+    logger.info("Search completed. total search time: %s", str(get_ts_datetime() - time_begin))
+
+
+def fetch_next_page(ans):
+    """Append the next page of ``ans``'s ranking to it (no new search) and
+    return the extended answer."""
+    handler = WarmUpService().get_handler()
+    with st.spinner("Loading more..."):
+        page = handler.get_page(ans, ans.offset + len(ans.src_metadata_lst), PAGE_SIZE)
+    return replace(
+        page,
+        src_metadata_lst=ans.src_metadata_lst + page.src_metadata_lst,
+        src_contents=ans.src_contents + page.src_contents,
+        offset=ans.offset,
+    )
 